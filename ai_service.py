@@ -1,10 +1,21 @@
 import json
 import logging
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from openai import OpenAI
 
-from config import ONEAPI_KEY, ONEAPI_BASE_URL, MODEL_NAME
+import metrics
+
+from config import (ONEAPI_KEY, ONEAPI_BASE_URL, MODEL_NAME, LLM_REQUEST_TIMEOUT,
+                    LLM_HEDGE_BASE_URL, LLM_HEDGE_API_KEY, LLM_HEDGE_MODEL, LLM_HEDGE_PERCENTILE,
+                    LLM_HEDGE_DEFAULT_DELAY, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_DELAY, DEADLINE_PLAN_SHARE,
+                    PLAN_ABBREVIATED_KEYS)
+from deadline import Deadline
+from ppt_builder.layout_engine import describe_layouts
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,6 +31,46 @@ except ValueError as e:
     client = None
 
 
+class LLMEndpoint:
+    """一个可用于生成方案的模型端点（地址 + 模型），并记录其近期的请求延迟。"""
+
+    def __init__(self, name: str, client: OpenAI, model: str, window: int = 50):
+        self.name = name
+        self.client = client
+        self.model = model
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency_percentile(self, percentile: float, min_samples: int = 5) -> float | None:
+        """返回近期成功请求延迟的分位数，样本不足时返回None。"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(percentile * len(samples)))
+        return samples[index]
+
+
+def _init_endpoints() -> list[LLMEndpoint]:
+    """主端点在前，可选的对冲端点在后。"""
+    if not client:
+        return []
+    endpoints = [LLMEndpoint("primary", client, MODEL_NAME)]
+    if LLM_HEDGE_BASE_URL or LLM_HEDGE_MODEL:
+        hedge_client = OpenAI(api_key=LLM_HEDGE_API_KEY, base_url=LLM_HEDGE_BASE_URL) if LLM_HEDGE_BASE_URL else client
+        endpoints.append(LLMEndpoint("hedge", hedge_client, LLM_HEDGE_MODEL or MODEL_NAME))
+        logging.info(f"已启用对冲请求: 备用地址 {LLM_HEDGE_BASE_URL or ONEAPI_BASE_URL}, "
+                     f"备用模型 {LLM_HEDGE_MODEL or MODEL_NAME}")
+    return endpoints
+
+
+endpoints = _init_endpoints()
+
+
 def _extract_json_from_response(text: str) -> str | None:
     """从可能包含markdown和注释的字符串中提取并清理JSON对象。"""
     try:
@@ -45,305 +96,494 @@ def _extract_json_from_response(text: str) -> str | None:
         return None
 
 
-def generate_presentation_plan(theme: str, num_pages: int, aspect_ratio: str = "16:9") -> dict | None:
-    """使用OneAPI为演示文稿生成详细的JSON计划。"""
+# 方案提示词中所有请求都相同的部分放在系统消息里，按字节保持不变，服务端可以缓存这段前缀；
+# 主题、页数和画布尺寸等每次请求不同的内容只出现在最后的用户消息中（见 _plan_request）。
+_JSON_ONLY_INSTRUCTION = ("You are a world-class presentation designer. Your output must be a single, raw JSON object. "
+                          "You must strictly follow all instructions.")
+
+PLAN_SYSTEM_PROMPT = _JSON_ONLY_INSTRUCTION + """
+
+你是一位深谙**年轻女性审美**的顶级演示文稿（PPT）设计大师和信息架构专家。你精通平面设计、版式理论、色彩心理学和视觉传达。你的任务是根据用户提供的主题，设计一份兼具专业性、设计感和视觉冲击力的演示文稿方案。
+
+**你的输出必须是一个单一、完整、严格符合以下所有规则的原始JSON对象，禁止包含任何JSON之外的解释性文字、注释或Markdown代码块标记（如 ```json）。**
+
+---
+
+### **第一部分：全局设计系统 (Global Design System)**
+
+这是整个演示文稿的基石，定义了统一的视觉规范。
+
+1.  **`design_concept`**: (字符串) **必须用中文**为本次设计提炼一个高度概括、富有创意的核心设计理念。例如：“深海数据之境”、“都市脉搏与光影”、“墨韵书香”、“赛博朋克霓虹”等。
+2.  **`font_pairing`**: (对象) 定义全局**默认**字体搭配。当单个文本元素未指定特定字体时，将使用这里的设置。
+    * `heading`: (字符串) 默认标题字体。例如: "黑体"。
+    * `body`: (字符串) 默认正文字体。例如: "宋体"。
+3.  **`color_palette`**: (对象) 定义一个专业、和谐的色板。
+    * `primary`: (字符串, Hex) 主色，用于关键元素、标题。
+    * `secondary`: (字符串, Hex) 辅色，用于次要信息、图表。
+    * `background`: (字符串, Hex) 背景色。
+    * `text`: (字符串, Hex) 主要文本颜色。
+    * `accent`: (字符串, Hex) 点缀色/强调色，用于按钮、图表高亮、特殊标记。
+4.  **`master_slide`**: (对象) 定义应用于所有页面的“母版”元素。
+    * `background`: (对象) 定义背景。可以是纯色 `{ "color": "#RRGGBB" }`，也可以是图片 `{ "image_keyword": "英文图片关键词" }`。
+    * `footer`: (对象, 可选) 页脚。包含 `text` (如“公司名称 | 内部资料”) 和 `style` (定义 `x`, `y`, `width`, `height`, `font_size`, `color` 等)。
+    * `page_number`: (对象, 可选) 页码。包含 `style` (定义 `x`, `y`, `width`, `height`, `font_size`, `color` 等)。
+
+---
+
+### **第二部分：页面详细规划 (Page Details)**
+
+`pages` 是一个数组，其中每个对象代表一页幻灯片。
+
+* **`layout_type`**: (字符串) 对本页布局风格的描述。例如: `title_slide`, `image_left_content_right`, `full_screen_image_with_quote`, `three_column_comparison`, `data_chart_summary`, `process_flow`, `team_introduction`。
+* **`elements`**: (数组) 页面上所有视觉元素的集合。
+
+#### **元素 (Element) 定义**
+
+**所有元素都必须包含** `type`, `x`, `y`, `width`, `height` 这五个基本属性。
+**重要：所有坐标和尺寸都必须基于请求中给出的画布尺寸（像素）进行设计。**
+
+1.  **`text_box`**
+    * `type`: "text_box"
+    * `content`: (字符串或字符串数组) **[新功能]** 如果是普通文本，则为字符串，支持用 `\\n` 换行。如果要创建项目符号列表，则**必须**使用字符串数组，数组中每个字符串代表一个列表项。
+    * `style`: (对象)
+        * `font`: (对象)
+            * `name`: (字符串, 可选) **直接指定字体名称** (如 "黑体", "微软雅黑")。**如果提供此项，将优先使用，并忽略下面的 `type` 字段。**
+            * `type`: (字符串, 可选) "heading" 或 "body"。如果未指定 `name`，则会根据此类型调用全局 `font_pairing` 中定义的默认字体。
+            * `size`: (数字) 字号 (pt)。
+            * `color`: (字符串, Hex, 可选) 局部覆盖全局文本颜色。
+            * `bold`: (布尔值, 可选) 是否加粗。
+            * `italic`: (布尔值, 可选) 是否斜体。
+        * `alignment`: (字符串, 可选) 对齐方式: "LEFT", "CENTER", "RIGHT"。
+
+2.  **`image`**
+    * `type`: "image"
+    * `image_keyword`: (字符串) **必须是英文**的图片搜索关键词，越具体越好。
+    * `style`: (对象, 可选)
+        * `opacity`: (数字, 0.0-1.0) 图片整体的不透明度， 0.0表示完全透明，1.0表示完全可见。
+        * `border`: (对象) 边框。包含 `color` (Hex) 和 `width` (px)。
+        * `crop`: (字符串, 可选) **[新功能]** 裁剪形状。目前唯一支持的值是 **`"circle"`**，用于将图片裁剪为圆形。
+
+3.  **`shape`**
+    * `type`: "shape"
+    * `shape_type`: (字符串) 形状类型。可选值: `rectangle`, `oval`, `triangle`, `star`, `rounded_rectangle`。
+    * `style`: (对象)
+        * `fill_color`: (字符串, Hex, 可选) 填充色。
+        * `opacity`: (数字, 0.0-1.0, 可选) 填充色的不透明度。0.0表示完全透明，1.0表示完全可见。
+        * `gradient`: (对象, 可选, 与`fill_color`互斥) 渐变填充。
+        * `border`: (对象, 可选) 边框。
+** 重要 ** 以下是一个示例，描述如何使用`text_box`, `image` 和 `shape` 元素进行综合布局
+```json
+    {
+  "layout_type": "title_slide_with_gradient_overlay",
+  "elements": [
+    {
+      "type": "image",
+      "image_keyword": "abstract technology background blue",
+      "x": 0, "y": 0, "width": 1280, "height": 720
+    },
+    {
+      "type": "shape",
+      "shape_type": "rectangle",
+      "x": 0, "y": 0, "width": 1280, "height": 720,
+      "style": {
+        "gradient": {
+          "angle": 45,
+          "colors": ["#0D47A1", "#42A5F5"]
+        },
+        "opacity": 0.85
+      }
+    },
+    {
+      "type": "text_box",
+      "content": "在渐变蒙版上的标题",
+      "x": 100, "y": 300, "width": 1080, "height": 120,
+      "style": {
+        "font": { "size": 60, "bold": true, "color": "#FFFFFF" },
+        "alignment": "CENTER"
+      }
+    }
+  ]
+}
+```
+4.  **`chart`**
+    * `type`: "chart"
+    * `title`: (字符串) **[新要求]** 必须为图表提供一个清晰、简洁的标题。
+    * `chart_type`: (字符串) 图表类型。可选值: `bar` (柱状图), `pie` (饼图), `line` (折线图)。
+    * `data`: (对象)
+        * `categories`: (字符串数组) 类别轴标签。
+        * `series`: (对象数组) 每个对象是一组数据序列。
+            * `name`: (字符串) **必须提供**，将用于图例显示。
+            * `values`: (数字数组) 数据值。
+    ** 美观的饼图示例: **
+    ```json
+    {
+      "type": "chart",
+      "x": 140, 
+      "y": 100, 
+      "width": 1000, 
+      "height": 550,
+      "title": "用户对现有智能产品痛点分布",
+      "chart_type": "pie",
+      "data": {
+        "categories": [
+          "操作复杂",
+          "兼容性差",
+          "隐私担忧",
+          "功能单一",
+          "价格过高"
+        ],
+        "series": [
+          { 
+            "name": "痛点分布", 
+            "values": [30, 25, 20, 15, 10]
+            }
+        ]
+      }
+    }
+    ```
+5.  **`table`**
+    * `type`: "table"
+    * `headers`: (字符串数组) 表头。
+    * `rows`: (二维字符串数组) 表格数据。
+    * `style`: (对象, 可选) 定义表头/行颜色等。
+
+---
+
+### **第三部分：多样性与一致性核心准则 (Core Principles for Variety & Consistency)**
+
+1.  **布局多样性 (Layout Variety)**: **必须**混合使用多种 `layout_type`。**严禁**连续超过两页使用完全相同的简单布局。
+2.  **视觉元素丰富度 (Visual Richness)**: **每一张内容页都应至少包含一个视觉元素** (`image`, `shape`, `chart`, `table`)。
+3.  **设计系统贯穿始终 (Consistent Design System)**: 全局定义的 `color_palette` 和 `font_pairing` **必须**被应用到所有页面。
+4.  **色彩对比度与可读性 (Color Contrast & Readability)**: 文本颜色应与其下方的背景（形状或图片）形成足够的对比：深色背景配浅色文字，浅色背景配深色文字。渲染时会自动检查并修正对比度不足的文本，你不必为此牺牲设计。
+5.  **字体策略 (Font Strategy)**:
+        * **优先使用推荐字体**: 为了保证最佳兼容性，请**严格从以下列表中选择字体**。这些字体在绝大多数现代操作系统中都可用。
+        * **中文推荐**:  **华文新魏**, **黑体**, **华文行楷**, **楷体**, **等线**, **微软雅黑**。
+        * **英文推荐**: **Arial**, **Calibri**, **Times New Roman**, **Verdana**, **Georgia**。
+        * **创意与兜底**: 你可以为标题、引用等特殊文本使用列表中的字体进行创意组合。对于大段正文，如果没有特别的设计需求，使用 "微软雅黑" 或 "等线" 是最安全的选择。
+        * **严格禁止**: 请**绝对不要使用** "思源黑体 (Source Han Sans)", "思源宋体 (Source Han Serif)", "苹方 (PingFang SC)" 或任何其他需要用户额外安装的字体。
+6.  **切勿在`content`字段的文本中使用任何Markdown语法**。
+7.  **所有的文本样式（如加粗）都必须通过`style`对象中的对应属性（如 `"bold": true`）来定义。**
+8.  **你的PPT页数应该严格与用户要求的页数一致**
+9.  **设计质量规则**: 每一页都必须承载明确的信息，严禁创建无实质内容的“过渡页”，也不要在一个页面中只放置一句话格言。
+
+---
+
+### **第四部分：设计风格指南 (Style Guide for Target Audience)**
+
+为了更好地贴合**中国女大学生**的审美，请遵循以下设计风格：
+
+1.  **设计理念 (Design Concept)**: 请使用更具诗意和画面感的词语。例如：“夏日橘子汽水”、“莫兰迪的午后”、“赛博蝴蝶梦”、“落日飞行”、“盐系手帐”。
+2.  **色彩运用 (Color Palette)**: 优先考虑**低饱和度的莫兰迪色系、柔和的马卡龙色系或高对比度的艺术撞色**。避免使用高饱和度的商务蓝、红色等传统商业配色，除非主题特别要求。
+3.  **版式布局 (Layout)**: 多采用**留白**，创造呼吸感。尝试不对称布局、图片网格、以及大号字体和图片的创意组合，营造杂志般的视觉效果。
+4.  **字体策略 (Font Strategy)**: **这是设计的灵魂，必须严格遵守。**
+    * **核心原则：和谐源于对比与一致性。**
+        * **经典搭配**: 在`font_pairing`中，优先选择一个**无衬线字体 (Sans-serif, 如 微软雅黑, 等线, 黑体)**用于正文，搭配一个**有衬线 (Serif, 如 宋体, 楷体) 或有设计感的无衬线字体 (如 华文行楷, 华文新魏)** 用于标题。这种对比清晰易读，且富有美感。
+    * **建立清晰的视觉层级**:
+        * **主标题 (页面大标题)**: 使用`heading`字体，字号最大 (如 36-48pt)，通常加粗。
+        * **副标题/小标题**: 使用`heading`字体，字号中等 (如 24-32pt)，粗细可变。
+        * **正文/列表**: 使用`body`字体，字号最小 (如 16-22pt)，使用常规体。
+        * **你必须在整个PPT中保持这套层级规则的一致性。**
+    * **风格与主题匹配**:
+        * 你选择的`font_pairing`**必须**与你的`design_concept`在气质上保持一致。
+        * **科技/简约风**: 多用“等线”、“微软雅黑”、“黑体”。
+        * **人文/艺术/复古风**: 多用“宋体”、“楷体”、“华文行楷”。
+        * **女性/柔美风**: 多用“等线 Light”、“微软雅黑 Light”或“楷体”。
+    * **安全字体列表**: 为了保证最佳兼容性，请**严格从以下列表中选择字体**。
+        * **中文推荐**:  **华文新魏**, **黑体**, **华文行楷**, **楷体**, **等线**, **微软雅黑**, **宋体**。
+        * **英文推荐**: **Arial**, **Calibri**, **Times New Roman**, **Verdana**, **Georgia**。
+        * **严格禁止**: 请**绝对不要使用** "思源黑体", "思源宋体", "苹方" 或任何需要用户额外安装的字体。
+
+
+---
+
+### **第五部分：输出样例（已加入新功能）**
+
+#### **样例一：团队介绍页 (使用圆形裁剪和半透明背景)**
+
+{
+  "design_concept": "盐系手帐：我们的故事",
+  "font_pairing": { "heading": "Dengxian", "body": "Dengxian" },
+  "color_palette": { "primary": "#4A4A4A", "secondary": "#9B9B9B", "background": "#FDFBF8", "text": "#4A4A4A", "accent": "#F5A623" },
+  "master_slide": { "background": { "color": "#FDFBF8" } },
+  "pages": [
+    {
+      "layout_type": "team_introduction",
+      "elements": [
+        { "type": "text_box", "x": 100, "y": 80, "width": 1080, "height": 60, "content": "核心团队成员", "style": { "font": { "type": "heading", "size": 36, "bold": true }, "alignment": "CENTER" } },
+        { "type": "image", "x": 240, "y": 200, "width": 150, "height": 150, "image_keyword": "professional portrait of a smiling young woman", "style": { "crop": "circle" } },
+        { "type": "text_box", "x": 215, "y": 360, "width": 200, "height": 60, "content": "张三\\n产品经理", "style": { "font": { "type": "body", "size": 16 }, "alignment": "CENTER" } },
+        { "type": "image", "x": 565, "y": 200, "width": 150, "height": 150, "image_keyword": "professional portrait of a smiling young man", "style": { "crop": "circle" } },
+        { "type": "text_box", "x": 540, "y": 360, "width": 200, "height": 60, "content": "李四\\n首席设计师", "style": { "font": { "type": "body", "size": 16 }, "alignment": "CENTER" } },
+        { "type": "image", "x": 890, "y": 200, "width": 150, "height": 150, "image_keyword": "professional portrait of a friendly woman software developer", "style": { "crop": "circle" } },
+        { "type": "text_box", "x": 865, "y": 360, "width": 200, "height": 60, "content": "王五\\n后端工程师", "style": { "font": { "type": "body", "size": 16 }, "alignment": "CENTER" } },
+        { "type": "shape", "shape_type": "rectangle", "x": 0, "y": 550, "width": 1280, "height": 170, "style": { "fill_color": "#4A4A4A", "opacity": 0.1 } }
+      ]
+    }
+  ]
+}
+
+#### **样例二：功能介绍页 (使用项目符号列表)**
+
+{
+  "design_concept": "夏日橘子汽水",
+  "font_pairing": { "heading": "Microsoft YaHei Light", "body": "Microsoft YaHei Light" },
+  "color_palette": { "primary": "#FF6B6B", "secondary": "#FFD166", "background": "#FFFFFF", "text": "#4A4A4A", "accent": "#06D6A0" },
+  "master_slide": { "background": { "color": "#FFFFFF" } },
+  "pages": [
+    {
+      "layout_type": "image_left_content_right",
+      "elements": [
+        { "type": "image", "x": 0, "y": 0, "width": 640, "height": 720, "image_keyword": "vibrant flat illustration of a mobile app interface" },
+        { "type": "text_box", "x": 700, "y": 150, "width": 520, "height": 80, "content": "产品核心功能", "style": { "font": { "type": "heading", "size": 40, "bold": true } } },
+        { "type": "text_box", "x": 700, "y": 250, "width": 520, "height": 300, 
+           "content": [
+             "AI智能规划：一句话生成完整演示文稿。",
+             "丰富的设计模板：覆盖多种行业和场景。",
+             "在线协同编辑：支持团队成员实时修改。",
+             "一键导出分享：轻松获取PPTX或PDF文件。"
+           ],
+           "style": { "font": { "type": "body", "size": 22 }, "alignment": "LEFT" }
+        }
+      ]
+    }
+  ]
+}
+"""
+
+# 紧凑模式：模型只输出设计系统和每页的语义内容，元素几何由本地版式引擎计算（见 ppt_builder.layout_engine）。
+# 版式与画布无关，同一份方案可以直接渲染为任意宽高比。
+COMPACT_PLAN_SYSTEM_PROMPT = _JSON_ONLY_INSTRUCTION + """
+
+你是一位深谙**年轻女性审美**的顶级演示文稿设计师和信息架构专家。请根据请求中的主题和页数规划一份演示文稿。
+**只输出一个原始JSON对象，不要任何解释、注释或Markdown代码块标记。** 版面几何由程序根据版式自动计算，
+**禁止输出** `x`、`y`、`width`、`height`、`elements` 或任何逐元素的 `style`。
+
+### 全局设计系统
+* `design_concept`: (字符串) 富有诗意和画面感的中文设计理念，如“夏日橘子汽水”、“莫兰迪的午后”、“盐系手帐”。
+* `font_pairing`: `{"heading": 标题字体, "body": 正文字体}`，只能从以下字体中选择：华文新魏、黑体、华文行楷、楷体、等线、微软雅黑、宋体、Arial、Calibri、Times New Roman、Verdana、Georgia。
+* `color_palette`: `primary`、`secondary`、`background`、`text`、`accent` 五个Hex颜色；优先低饱和的莫兰迪色、柔和的马卡龙色或高对比的艺术撞色。
+* `master_slide`: `{"background": {"color": "#RRGGBB"} 或 {"image_keyword": "英文关键词"}, "footer": {"text": "页脚文字"}, "page_number": {}}`，`footer` 和 `page_number` 可选。
+
+### 页面 (`pages` 数组)
+每页包含 `layout_type` 和该版式所需的内容字段。可用版式：
+""" + describe_layouts() + """
+
+内容字段：
+* `title` / `subtitle`: 字符串。
+* `body`: 字符串段落；`bullets`: 字符串数组，每项一个要点，简洁有力。
+* `image_keyword`: **英文**图片搜索关键词，越具体越好。
+* `quote` / `author`: 引言及其出处。
+* `items`: 对象数组，每项包含 `heading`、`text`，可选 `image_keyword`。
+* `chart`: `{"chart_type": "bar"|"pie"|"line", "title": 图表标题, "data": {"categories": [...], "series": [{"name": 系列名, "values": [...]}]}}`。
+* `table`: `{"headers": [...], "rows": [[...], ...]}`。
+
+### 规则
+1. 页数必须严格等于请求的页数；第一页使用 `title_slide`。
+2. 混合使用多种版式，不要连续超过两页使用相同版式；每页都要承载明确的信息，不要只放一句格言。
+3. 文本中不要使用任何Markdown语法。
+
+### 样例
+{"design_concept": "夏日橘子汽水", "font_pairing": {"heading": "华文新魏", "body": "微软雅黑"},
+  "color_palette": {"primary": "#FF6B6B", "secondary": "#FFD166", "background": "#FFFFFF", "text": "#4A4A4A", "accent": "#06D6A0"},
+  "master_slide": {"background": {"color": "#FFFFFF"}},
+  "pages": [
+    {"layout_type": "title_slide", "title": "产品发布会", "subtitle": "让灵感一键成稿", "image_keyword": "summer orange soda flat lay"},
+    {"layout_type": "image_left_content_right", "title": "产品核心功能", "image_keyword": "mobile app interface illustration",
+      "bullets": ["AI智能规划：一句话生成完整演示文稿", "在线协同编辑：团队成员实时修改"]},
+    {"layout_type": "data_chart_summary", "title": "用户增长", "chart": {"chart_type": "line", "title": "月活用户（万）",
+      "data": {"categories": ["1月", "2月", "3月"], "series": [{"name": "月活", "values": [12, 18, 27]}]}},
+      "bullets": ["三个月增长125%"]}
+  ]}
+"""
+
+# 缩写键输出格式：模型用短键输出JSON，解析后由 expand_plan_keys 还原为完整的方案字段。
+# 缩写不与任何完整字段名相同，因此无论模型是否使用缩写，还原都是安全的；
+# 同名字段（如 font.type 与元素 type）在任何位置都对应同一个缩写。
+PLAN_KEY_ABBREVIATIONS = {
+    'dc': 'design_concept', 'fp': 'font_pairing', 'cp': 'color_palette', 'ms': 'master_slide', 'pg': 'pages',
+    'bg': 'background', 'ftr': 'footer', 'pn': 'page_number', 'lt': 'layout_type', 'el': 'elements',
+    'tp': 'type', 'w': 'width', 'h': 'height', 'ct': 'content', 'sy': 'style', 'ft': 'font', 'nm': 'name',
+    'sz': 'size', 'fs': 'font_size', 'cl': 'color', 'bd': 'bold', 'it': 'italic', 'al': 'alignment',
+    'ik': 'image_keyword', 'op': 'opacity', 'cr': 'crop', 'bo': 'border', 'st': 'shape_type', 'fc': 'fill_color',
+    'gd': 'gradient', 'ag': 'angle', 'cs': 'colors', 'ttl': 'title', 'cht': 'chart_type', 'dt': 'data',
+    'cat': 'categories', 'sr': 'series', 'vl': 'values', 'hds': 'headers', 'rw': 'rows', 'tx': 'text',
+    'hg': 'heading', 'bdy': 'body', 'sub': 'subtitle', 'bl': 'bullets', 'qt': 'quote', 'au': 'author',
+    'its': 'items', 'ch': 'chart', 'tbl': 'table', 'dr': 'data_ref',
+}
+ABBREVIATED_KEYS_PROMPT = """
+
+### 输出格式：缩写键
+为减少输出长度，JSON中的**所有字段名**都必须使用以下缩写（字段值保持不变，例如 type 的值仍为 "text_box"）：
+""" + ', '.join(f"{short}={full}" for short, full in PLAN_KEY_ABBREVIATIONS.items()) + """
+未列出的字段名（如 x、y、primary、accent）保持原样。
+"""
+
+
+def expand_plan_keys(value):
+    """把缩写键格式的方案递归还原为完整字段名；完整格式的方案原样返回。"""
+    if isinstance(value, dict):
+        return {PLAN_KEY_ABBREVIATIONS.get(key, key): expand_plan_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand_plan_keys(item) for item in value]
+    return value
+
+
+def _plan_request(theme: str, num_pages: int, aspect_ratio: str, compact: bool, datasets: str = "") -> str:
+    """每次请求不同的部分，作为用户消息放在固定的系统提示词之后。datasets 为附带数据文件的描述。"""
+    if compact:
+        return f"主题：“{theme}”\n页数：{num_pages}\n请按以上规则输出演示文稿方案JSON。" + datasets
+    canvas_width, canvas_height = (1024, 768) if aspect_ratio == "4:3" else (1280, 720)
+    return (f"主题：“{theme}”\n页数：{num_pages}\n画布：宽 {canvas_width} 像素，高 {canvas_height} 像素\n"
+            f"请**回顾并严格遵守系统提示中的所有规则**，为该主题生成一个包含 {num_pages} 页、"
+            f"所有坐标和尺寸都基于 {canvas_width}x{canvas_height} 画布的完整PPT设计方案JSON。" + datasets)
+
+
+def generate_presentation_plan(theme: str, num_pages: int, aspect_ratio: str = "16:9",
+                               deadline: Deadline | None = None, compact: bool = False,
+                               abbreviated: bool = PLAN_ABBREVIATED_KEYS, datasets: str = "") -> dict | None:
+    """
+    使用OneAPI为演示文稿生成详细的JSON计划。配置了备用端点时会发送对冲请求。
+    提供 deadline 时，请求超时和等待时间都不超过剩余预算的 DEADLINE_PLAN_SHARE 比例。
+    compact 为True时使用紧凑提示词：模型只输出设计系统和每页的语义内容，元素几何由本地版式引擎计算
+    （见 ppt_builder.layout_engine），输出的token数大幅减少。
+    abbreviated 为True时要求模型使用缩写键输出，返回前还原为完整字段名。
+    datasets 为附带数据文件的描述（见 data_service.describe_datasets），模型据此用 data_ref 引用数据而不是编造数值。
+    """
     if not client:
         logging.error("OneAPI client not initialized.")
         return None
 
     # 直接使用从 config.py 导入的模型名称
-    logging.info(f"Requesting plan from model '{MODEL_NAME}' via OneAPI...")
-    if aspect_ratio == "4:3":
-        canvas_width, canvas_height = 1024, 768
-    else:  # 默认为 16:9
-        canvas_width, canvas_height = 1280, 720
-
-    # [核心修改] 更新了Prompt，赋予AI更灵活的字体控制权
-    prompt = f"""
-    你是一位你是一位深谙**年轻女性审美**的顶级演示文稿（PPT）设计大师和信息架构专家。你精通平面设计、版式理论、色彩心理学和视觉传达。你的任务是根据用户提供的主题，设计一份兼具专业性、设计感和视觉冲击力的演示文稿方案。
-
-    **你的输出必须是一个单一、完整、严格符合以下所有规则的原始JSON对象，禁止包含任何JSON之外的解释性文字、注释或Markdown代码块标记（如 ```json）。**
-
-    ---
-
-    ### **第一部分：全局设计系统 (Global Design System)**
-
-    这是整个演示文稿的基石，定义了统一的视觉规范。
-
-    1.  **`design_concept`**: (字符串) **必须用中文**为本次设计提炼一个高度概括、富有创意的核心设计理念。例如：“深海数据之境”、“都市脉搏与光影”、“墨韵书香”、“赛博朋克霓虹”等。
-    2.  **`font_pairing`**: (对象) 定义全局**默认**字体搭配。当单个文本元素未指定特定字体时，将使用这里的设置。
-        * `heading`: (字符串) 默认标题字体。例如: "黑体"。
-        * `body`: (字符串) 默认正文字体。例如: "宋体"。
-    3.  **`color_palette`**: (对象) 定义一个专业、和谐的色板。
-        * `primary`: (字符串, Hex) 主色，用于关键元素、标题。
-        * `secondary`: (字符串, Hex) 辅色，用于次要信息、图表。
-        * `background`: (字符串, Hex) 背景色。
-        * `text`: (字符串, Hex) 主要文本颜色。
-        * `accent`: (字符串, Hex) 点缀色/强调色，用于按钮、图表高亮、特殊标记。
-    4.  **`master_slide`**: (对象) 定义应用于所有页面的“母版”元素。
-        * `background`: (对象) 定义背景。可以是纯色 `{{ "color": "#RRGGBB" }}`，也可以是图片 `{{ "image_keyword": "英文图片关键词" }}`。
-        * `footer`: (对象, 可选) 页脚。包含 `text` (如“公司名称 | 内部资料”) 和 `style` (定义 `x`, `y`, `width`, `height`, `font_size`, `color` 等)。
-        * `page_number`: (对象, 可选) 页码。包含 `style` (定义 `x`, `y`, `width`, `height`, `font_size`, `color` 等)。
-
-    ---
-
-    ### **第二部分：页面详细规划 (Page Details)**
-
-    `pages` 是一个数组，其中每个对象代表一页幻灯片。
-
-    * **`layout_type`**: (字符串) 对本页布局风格的描述。例如: `title_slide`, `image_left_content_right`, `full_screen_image_with_quote`, `three_column_comparison`, `data_chart_summary`, `process_flow`, `team_introduction`。
-    * **`elements`**: (数组) 页面上所有视觉元素的集合。
-
-    #### **元素 (Element) 定义**
-
-    **所有元素都必须包含** `type`, `x`, `y`, `width`, `height` 这五个基本属性。
-    **重要：所有坐标和尺寸都必须基于一个 {canvas_width}x{canvas_height} 像素的画布进行设计。**
-
-    1.  **`text_box`**
-        * `type`: "text_box"
-        * `content`: (字符串或字符串数组) **[新功能]** 如果是普通文本，则为字符串，支持用 `\\n` 换行。如果要创建项目符号列表，则**必须**使用字符串数组，数组中每个字符串代表一个列表项。
-        * `style`: (对象)
-            * `font`: (对象)
-                * `name`: (字符串, 可选) **直接指定字体名称** (如 "黑体", "微软雅黑")。**如果提供此项，将优先使用，并忽略下面的 `type` 字段。**
-                * `type`: (字符串, 可选) "heading" 或 "body"。如果未指定 `name`，则会根据此类型调用全局 `font_pairing` 中定义的默认字体。
-                * `size`: (数字) 字号 (pt)。
-                * `color`: (字符串, Hex, 可选) 局部覆盖全局文本颜色。
-                * `bold`: (布尔值, 可选) 是否加粗。
-                * `italic`: (布尔值, 可选) 是否斜体。
-            * `alignment`: (字符串, 可选) 对齐方式: "LEFT", "CENTER", "RIGHT"。
-
-    2.  **`image`**
-        * `type`: "image"
-        * `image_keyword`: (字符串) **必须是英文**的图片搜索关键词，越具体越好。
-        * `style`: (对象, 可选)
-            * `opacity`: (数字, 0.0-1.0) 图片整体的不透明度， 0.0表示完全透明，1.0表示完全可见。
-            * `border`: (对象) 边框。包含 `color` (Hex) 和 `width` (px)。
-            * `crop`: (字符串, 可选) **[新功能]** 裁剪形状。目前唯一支持的值是 **`"circle"`**，用于将图片裁剪为圆形。
-
-    3.  **`shape`**
-        * `type`: "shape"
-        * `shape_type`: (字符串) 形状类型。可选值: `rectangle`, `oval`, `triangle`, `star`, `rounded_rectangle`。
-        * `style`: (对象)
-            * `fill_color`: (字符串, Hex, 可选) 填充色。
-            * `opacity`: (数字, 0.0-1.0, 可选) 填充色的不透明度。0.0表示完全透明，1.0表示完全可见。
-            * `gradient`: (对象, 可选, 与`fill_color`互斥) 渐变填充。
-            * `border`: (对象, 可选) 边框。
-    ** 重要 ** 以下是一个示例，描述如何使用`text_box`, `image` 和 `shape` 元素进行综合布局
-    ```json
-        {{
-      "layout_type": "title_slide_with_gradient_overlay",
-      "elements": [
-        {{
-          "type": "image",
-          "image_keyword": "abstract technology background blue",
-          "x": 0, "y": 0, "width": 1280, "height": 720
-        }},
-        {{
-          "type": "shape",
-          "shape_type": "rectangle",
-          "x": 0, "y": 0, "width": 1280, "height": 720,
-          "style": {{
-            "gradient": {{
-              "angle": 45,
-              "colors": ["#0D47A1", "#42A5F5"]
-            }},
-            "opacity": 0.85
-          }}
-        }},
-        {{
-          "type": "text_box",
-          "content": "在渐变蒙版上的标题",
-          "x": 100, "y": 300, "width": 1080, "height": 120,
-          "style": {{
-            "font": {{ "size": 60, "bold": true, "color": "#FFFFFF" }},
-            "alignment": "CENTER"
-          }}
-        }}
-      ]
-    }}
-    ```
-    4.  **`chart`**
-        * `type`: "chart"
-        * `title`: (字符串) **[新要求]** 必须为图表提供一个清晰、简洁的标题。
-        * `chart_type`: (字符串) 图表类型。可选值: `bar` (柱状图), `pie` (饼图), `line` (折线图)。
-        * `data`: (对象)
-            * `categories`: (字符串数组) 类别轴标签。
-            * `series`: (对象数组) 每个对象是一组数据序列。
-                * `name`: (字符串) **必须提供**，将用于图例显示。
-                * `values`: (数字数组) 数据值。
-        ** 美观的饼图示例: **
-        ```json
-        {{
-          "type": "chart",
-          "x": 140, 
-          "y": 100, 
-          "width": 1000, 
-          "height": 550,
-          "title": "用户对现有智能产品痛点分布",
-          "chart_type": "pie",
-          "data": {{
-            "categories": [
-              "操作复杂",
-              "兼容性差",
-              "隐私担忧",
-              "功能单一",
-              "价格过高"
-            ],
-            "series": [
-              {{ 
-                "name": "痛点分布", 
-                "values": [30, 25, 20, 15, 10]
-                }}
-            ]
-          }}
-        }}
-        ```
-    5.  **`table`**
-        * `type`: "table"
-        * `headers`: (字符串数组) 表头。
-        * `rows`: (二维字符串数组) 表格数据。
-        * `style`: (对象, 可选) 定义表头/行颜色等。
-
-    ---
-
-    ### **第三部分：多样性与一致性核心准则 (Core Principles for Variety & Consistency)**
-
-    1.  **布局多样性 (Layout Variety)**: **必须**混合使用多种 `layout_type`。**严禁**连续超过两页使用完全相同的简单布局。
-    2.  **视觉元素丰富度 (Visual Richness)**: **每一张内容页都应至少包含一个视觉元素** (`image`, `shape`, `chart`, `table`)。
-    3.  **设计系统贯穿始终 (Consistent Design System)**: 全局定义的 `color_palette` 和 `font_pairing` **必须**被应用到所有页面。
-    4.  **色彩对比度与可读性 (Color Contrast & Readability)**: **这是一条绝对的、必须遵守的规则。**
-        * 当文本被放置在任何有颜色的背景（如形状或图片）之上时，**必须确保文本颜色与背景色之间有足够高的对比度**，以保证内容清晰易读。
-        * **具体准则：**
-            * 在**深色背景**（如深蓝、黑色、深紫色）上，**必须使用浅色文字**（如白色 `#FFFFFF` 或极浅的灰色）。
-            * 在**浅色背景**（如白色、米色、淡黄色）上，**必须使用深色文字**（如黑色 `#000000` 或极深的灰色）。
-        * **严格禁止**：将颜色亮度相近的文本和背景放在一起（例如，在深灰色背景上放黑色文字，或在天蓝色背景上放白色文字）。
-    5.  **字体策略 (Font Strategy)**:
-            * **优先使用推荐字体**: 为了保证最佳兼容性，请**严格从以下列表中选择字体**。这些字体在绝大多数现代操作系统中都可用。
-            * **中文推荐**:  **华文新魏**, **黑体**, **华文行楷**, **楷体**, **等线**, **微软雅黑**。
-            * **英文推荐**: **Arial**, **Calibri**, **Times New Roman**, **Verdana**, **Georgia**。
-            * **创意与兜底**: 你可以为标题、引用等特殊文本使用列表中的字体进行创意组合。对于大段正文，如果没有特别的设计需求，使用 "微软雅黑" 或 "等线" 是最安全的选择。
-            * **严格禁止**: 请**绝对不要使用** "思源黑体 (Source Han Sans)", "思源宋体 (Source Han Serif)", "苹方 (PingFang SC)" 或任何其他需要用户额外安装的字体。
-    6.  **切勿在`content`字段的文本中使用任何Markdown语法**。
-    7.  **所有的文本样式（如加粗）都必须通过`style`对象中的对应属性（如 `"bold": true`）来定义。**
-    8.  **你的PPT页数应该严格与用户要求的页数一致**
-    9.  **设计质量规则**: 每一页都必须承载明确的信息，严禁创建无实质内容的“过渡页”，也不要在一个页面中只放置一句话格言。
-    
-    ---
-
-    ### **第四部分：设计风格指南 (Style Guide for Target Audience)**
-
-    为了更好地贴合**中国女大学生**的审美，请遵循以下设计风格：
-
-    1.  **设计理念 (Design Concept)**: 请使用更具诗意和画面感的词语。例如：“夏日橘子汽水”、“莫兰迪的午后”、“赛博蝴蝶梦”、“落日飞行”、“盐系手帐”。
-    2.  **色彩运用 (Color Palette)**: 优先考虑**低饱和度的莫兰迪色系、柔和的马卡龙色系或高对比度的艺术撞色**。避免使用高饱和度的商务蓝、红色等传统商业配色，除非主题特别要求。
-    3.  **版式布局 (Layout)**: 多采用**留白**，创造呼吸感。尝试不对称布局、图片网格、以及大号字体和图片的创意组合，营造杂志般的视觉效果。
-    4.  **字体策略 (Font Strategy)**: **这是设计的灵魂，必须严格遵守。**
-        * **核心原则：和谐源于对比与一致性。**
-            * **经典搭配**: 在`font_pairing`中，优先选择一个**无衬线字体 (Sans-serif, 如 微软雅黑, 等线, 黑体)**用于正文，搭配一个**有衬线 (Serif, 如 宋体, 楷体) 或有设计感的无衬线字体 (如 华文行楷, 华文新魏)** 用于标题。这种对比清晰易读，且富有美感。
-        * **建立清晰的视觉层级**:
-            * **主标题 (页面大标题)**: 使用`heading`字体，字号最大 (如 36-48pt)，通常加粗。
-            * **副标题/小标题**: 使用`heading`字体，字号中等 (如 24-32pt)，粗细可变。
-            * **正文/列表**: 使用`body`字体，字号最小 (如 16-22pt)，使用常规体。
-            * **你必须在整个PPT中保持这套层级规则的一致性。**
-        * **风格与主题匹配**:
-            * 你选择的`font_pairing`**必须**与你的`design_concept`在气质上保持一致。
-            * **科技/简约风**: 多用“等线”、“微软雅黑”、“黑体”。
-            * **人文/艺术/复古风**: 多用“宋体”、“楷体”、“华文行楷”。
-            * **女性/柔美风**: 多用“等线 Light”、“微软雅黑 Light”或“楷体”。
-        * **安全字体列表**: 为了保证最佳兼容性，请**严格从以下列表中选择字体**。
-            * **中文推荐**:  **华文新魏**, **黑体**, **华文行楷**, **楷体**, **等线**, **微软雅黑**, **宋体**。
-            * **英文推荐**: **Arial**, **Calibri**, **Times New Roman**, **Verdana**, **Georgia**。
-            * **严格禁止**: 请**绝对不要使用** "思源黑体", "思源宋体", "苹方" 或任何需要用户额外安装的字体。
-
-
-    ---
-
-    ### **第五部分：输出样例（已加入新功能）**
-
-    #### **样例一：团队介绍页 (使用圆形裁剪和半透明背景)**
-
-    {{
-      "design_concept": "盐系手帐：我们的故事",
-      "font_pairing": {{ "heading": "Dengxian", "body": "Dengxian" }},
-      "color_palette": {{ "primary": "#4A4A4A", "secondary": "#9B9B9B", "background": "#FDFBF8", "text": "#4A4A4A", "accent": "#F5A623" }},
-      "master_slide": {{ "background": {{ "color": "#FDFBF8" }} }},
-      "pages": [
-        {{
-          "layout_type": "team_introduction",
-          "elements": [
-            {{ "type": "text_box", "x": 100, "y": 80, "width": 1080, "height": 60, "content": "核心团队成员", "style": {{ "font": {{ "type": "heading", "size": 36, "bold": true }}, "alignment": "CENTER" }} }},
-            {{ "type": "image", "x": 240, "y": 200, "width": 150, "height": 150, "image_keyword": "professional portrait of a smiling young woman", "style": {{ "crop": "circle" }} }},
-            {{ "type": "text_box", "x": 215, "y": 360, "width": 200, "height": 60, "content": "张三\\n产品经理", "style": {{ "font": {{ "type": "body", "size": 16 }}, "alignment": "CENTER" }} }},
-            {{ "type": "image", "x": 565, "y": 200, "width": 150, "height": 150, "image_keyword": "professional portrait of a smiling young man", "style": {{ "crop": "circle" }} }},
-            {{ "type": "text_box", "x": 540, "y": 360, "width": 200, "height": 60, "content": "李四\\n首席设计师", "style": {{ "font": {{ "type": "body", "size": 16 }}, "alignment": "CENTER" }} }},
-            {{ "type": "image", "x": 890, "y": 200, "width": 150, "height": 150, "image_keyword": "professional portrait of a friendly woman software developer", "style": {{ "crop": "circle" }} }},
-            {{ "type": "text_box", "x": 865, "y": 360, "width": 200, "height": 60, "content": "王五\\n后端工程师", "style": {{ "font": {{ "type": "body", "size": 16 }}, "alignment": "CENTER" }} }},
-            {{ "type": "shape", "shape_type": "rectangle", "x": 0, "y": 550, "width": 1280, "height": 170, "style": {{ "fill_color": "#4A4A4A", "opacity": 0.1 }} }}
-          ]
-        }}
-      ]
-    }}
-
-    #### **样例二：功能介绍页 (使用项目符号列表)**
-
-    {{
-      "design_concept": "夏日橘子汽水",
-      "font_pairing": {{ "heading": "Microsoft YaHei Light", "body": "Microsoft YaHei Light" }},
-      "color_palette": {{ "primary": "#FF6B6B", "secondary": "#FFD166", "background": "#FFFFFF", "text": "#4A4A4A", "accent": "#06D6A0" }},
-      "master_slide": {{ "background": {{ "color": "#FFFFFF" }} }},
-      "pages": [
-        {{
-          "layout_type": "image_left_content_right",
-          "elements": [
-            {{ "type": "image", "x": 0, "y": 0, "width": 640, "height": 720, "image_keyword": "vibrant flat illustration of a mobile app interface" }},
-            {{ "type": "text_box", "x": 700, "y": 150, "width": 520, "height": 80, "content": "产品核心功能", "style": {{ "font": {{ "type": "heading", "size": 40, "bold": true }} }} }},
-            {{ "type": "text_box", "x": 700, "y": 250, "width": 520, "height": 300, 
-               "content": [
-                 "AI智能规划：一句话生成完整演示文稿。",
-                 "丰富的设计模板：覆盖多种行业和场景。",
-                 "在线协同编辑：支持团队成员实时修改。",
-                 "一键导出分享：轻松获取PPTX或PDF文件。"
-               ],
-               "style": {{ "font": {{ "type": "body", "size": 22 }}, "alignment": "LEFT" }}
-            }}
-          ]
-        }}
-      ]
-    }}
+    logging.info(f"Requesting {'compact ' if compact else ''}plan from model '{MODEL_NAME}' via OneAPI...")
+    system_prompt = COMPACT_PLAN_SYSTEM_PROMPT if compact else PLAN_SYSTEM_PROMPT
+    if abbreviated:
+        system_prompt += ABBREVIATED_KEYS_PROMPT
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": _plan_request(theme, num_pages, aspect_ratio, compact, datasets)}
+    ]
+
+    try:
+        return _hedged_request(messages, deadline or Deadline())
+    except Exception as e:
+        logging.error(f"与OneAPI通信时发生严重错误: {e}", exc_info=True)
+        return None
 
-    **最后指令：**
-    现在，请**回顾并严格遵守以上所有部分的规则**，为主题 **“{theme}”** 生成一个包含 **{num_pages}** 页，宽为{canvas_width}，高为{canvas_height}的完整PPT设计方案JSON。
-    """
 
+def _parse_plan(response_content: str | None) -> dict:
+    """从模型响应中提取并解析方案JSON，失败时抛出 ValueError。"""
+    if not response_content:
+        raise ValueError("AI响应内容为空。")
+    json_string = _extract_json_from_response(response_content)
+    if not json_string:
+        raise ValueError("从AI响应中提取JSON失败。")
+    # 移除可能由模型生成的多余的尾随逗号
+    cleaned_json_string = re.sub(r',\s*([}\]])', r'\1', json_string)
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system",
-                 "content": "You are a world-class presentation designer. Your output must be a single, raw JSON object. You must strictly follow all instructions."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.55
-        )
+        return expand_plan_keys(json.loads(cleaned_json_string))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON解码失败: {e}。原始响应片段: '{json_string[:500]}...'") from e
 
-        response_content = response.choices[0].message.content
-        if response_content:
-            logging.info("已成功从AI接收到演示文稿方案。")
-            json_string = _extract_json_from_response(response_content)
-            if json_string:
-                # 移除可能由模型生成的多余的尾随逗号
-                cleaned_json_string = re.sub(r',\s*([}\]])', r'\1', json_string)
-                return json.loads(cleaned_json_string)
-            else:
-                logging.error("从AI响应中提取JSON失败。")
-                return None
 
-        logging.error("AI响应内容为空。")
+def _request_plan(endpoint: LLMEndpoint, messages: list[dict], timeout: float) -> dict:
+    """向单个端点请求方案；只有通过JSON解析的响应才计入延迟统计并返回。"""
+    start_time = time.monotonic()
+    outcome = "error"
+    try:
+        response = endpoint.client.chat.completions.create(
+            model=endpoint.model,
+            messages=messages,
+            temperature=0.55,
+            timeout=timeout
+        )
+        if usage := getattr(response, 'usage', None):
+            # 命中服务端前缀缓存的输入token数（OpenAI 兼容接口的 prompt_tokens_details.cached_tokens），不支持时为0
+            cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None) or 0
+            metrics.LLM_TOKENS.observe(usage.prompt_tokens or 0, endpoint=endpoint.name, kind="prompt")
+            metrics.LLM_TOKENS.observe(cached_tokens, endpoint=endpoint.name, kind="cached_prompt")
+            metrics.LLM_TOKENS.observe(usage.completion_tokens or 0, endpoint=endpoint.name, kind="completion")
+            logging.info(f"端点 '{endpoint.name}' 的token用量: 输入 {usage.prompt_tokens} "
+                         f"(缓存命中 {cached_tokens}), 输出 {usage.completion_tokens}。")
+        try:
+            plan = _parse_plan(response.choices[0].message.content)
+        except ValueError:
+            outcome = "parse_error"
+            metrics.PLAN_PARSE_FAILURES.inc(endpoint=endpoint.name)
+            raise
+        outcome = "success"
+    finally:
+        metrics.LLM_REQUEST_SECONDS.observe(time.monotonic() - start_time, endpoint=endpoint.name, outcome=outcome)
+    elapsed = time.monotonic() - start_time
+    endpoint.record_latency(elapsed)
+    logging.info(f"已成功从端点 '{endpoint.name}' ({endpoint.model}) 接收到演示文稿方案，耗时 {elapsed:.1f}s。")
+    return plan
+
+
+def _hedge_delay(endpoint: LLMEndpoint) -> float:
+    """根据端点近期延迟的分位数计算对冲延迟。"""
+    observed = endpoint.latency_percentile(LLM_HEDGE_PERCENTILE)
+    delay = LLM_HEDGE_DEFAULT_DELAY if observed is None else observed
+    return max(LLM_HEDGE_MIN_DELAY, min(LLM_HEDGE_MAX_DELAY, delay))
+
+
+def _hedged_request(messages: list[dict], deadline: Deadline) -> dict | None:
+    """
+    先向主端点发送请求；若超过对冲延迟仍未返回（或已失败），则向下一个端点发送对冲请求。
+    第一个通过JSON提取的响应胜出，其余请求被取消：尚未开始的直接取消，
+    已在进行中的请求无法中断，其结果将被丢弃（受请求超时约束）。
+    整体等待时间不超过时间预算分配给方案生成的份额。
+    """
+    if not endpoints:
+        logging.error("没有可用的模型端点。")
         return None
 
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON解码失败: {e}。原始响应片段: '{json_string[:500]}...'")
+    executor = ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix="llm")
+    futures = {}
+    next_index = 0
+    plan_budget = deadline.share(DEADLINE_PLAN_SHARE, LLM_REQUEST_TIMEOUT)
+    give_up_at = time.monotonic() + plan_budget
+
+    def launch():
+        nonlocal next_index
+        endpoint = endpoints[next_index]
+        next_index += 1
+        timeout = max(1.0, give_up_at - time.monotonic())
+        futures[executor.submit(_request_plan, endpoint, messages, timeout)] = endpoint
+
+    try:
+        launch()
+        while futures:
+            budget_left = give_up_at - time.monotonic()
+            if budget_left <= 0:
+                logging.error(f"方案请求在 {plan_budget:.1f}s 的预算内未能完成。")
+                return None
+            can_hedge = next_index < len(endpoints)
+            timeout = min(_hedge_delay(endpoints[0]), budget_left) if can_hedge else budget_left
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if not can_hedge or time.monotonic() >= give_up_at:
+                    continue
+                logging.warning(f"方案请求超过对冲延迟 {timeout:.1f}s 仍未返回，"
+                                f"向端点 '{endpoints[next_index].name}' 发送对冲请求。")
+                launch()
+                continue
+
+            for future in done:
+                endpoint = futures.pop(future)
+                try:
+                    plan = future.result()
+                except Exception as e:
+                    logging.warning(f"端点 '{endpoint.name}' 的方案请求失败: {e}")
+                    continue
+                if futures:
+                    logging.info(f"端点 '{endpoint.name}' 率先返回，放弃其余 {len(futures)} 个进行中的请求。")
+                return plan
+
+            # 已发出的请求全部失败时，立即向下一个端点发送请求，无需等待对冲延迟
+            if not futures and next_index < len(endpoints):
+                launch()
+
+        logging.error("所有端点的方案请求均失败。")
         return None
-    except Exception as e:
-        logging.error(f"与OneAPI通信时发生严重错误: {e}", exc_info=True)
-        return None
\ No newline at end of file
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
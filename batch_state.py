@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+# 任务状态
+STATUS_PENDING = "pending"
+STATUS_PLANNED = "planned"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class BatchState:
+    """
+    批量任务的断点状态文件。
+    记录每个任务的状态、AI生成的方案、已解析的图片资源和输出路径，
+    每次更新后原子写入磁盘，供 --resume 跳过已完成的任务或从最近完成的阶段继续。
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        """
+        :param path: 状态文件路径。
+        :param resume: 为True时加载已有状态；否则从空状态开始并覆盖旧文件。
+        """
+        self.path = path
+        # 断点续跑需要的图片资源不能放在会被清理的临时目录中
+        self.asset_dir = f"{os.path.splitext(path)[0]}_assets"
+        self.tasks = {}
+        # 流水线模式下规划线程和主线程会同时更新状态
+        self._lock = threading.RLock()
+
+        if resume and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.tasks = json.load(f).get('tasks', {})
+                logging.info(f"已加载断点状态文件 '{path}'，共 {len(self.tasks)} 个任务记录。")
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error(f"读取断点状态文件 '{path}' 失败，将从头开始: {e}")
+                self.tasks = {}
+
+    @staticmethod
+    def task_key(index: int, theme: str, num_pages: int, aspect_ratio: str) -> str:
+        """生成任务的唯一键。批量文件内容变化时键随之变化，避免误用旧的方案。"""
+        return f"{index}|{theme}|{num_pages}|{aspect_ratio}"
+
+    def get_task(self, key: str) -> dict:
+        """获取任务记录，不存在时创建一条待处理记录。"""
+        with self._lock:
+            return self.tasks.setdefault(key, {"status": STATUS_PENDING, "images": {}})
+
+    def is_done(self, key: str) -> bool:
+        """任务已完成且输出文件仍然存在。"""
+        record = self.tasks.get(key, {})
+        output_path = record.get('output_path')
+        return record.get('status') == STATUS_DONE and bool(output_path) and os.path.exists(output_path)
+
+    def update_task(self, key: str, **fields):
+        """更新任务记录并立即持久化。"""
+        with self._lock:
+            self.get_task(key).update(fields)
+            self.save()
+
+    def save(self):
+        """原子写入：先写同目录下的临时文件，再用 os.replace 替换，进程中途退出也不会留下半个文件。"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(prefix='.batch_state_', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({"tasks": self.tasks}, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
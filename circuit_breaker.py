@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, BREAKER_HALF_OPEN_PROBES
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    单个外部服务的熔断器。线程安全。
+    连续失败达到阈值后断开 (open)：此后的调用直接被拒绝，调用方应立即改用缓存或本地降级方案，
+    不再为注定失败的请求付出超时和重试等待。断开 reset_seconds 秒后进入半开 (half_open)，
+    放行少量探测请求：探测成功则恢复 (closed)，失败则重新断开并重新计时。
+    用法：allow() 为真时发起请求，之后必须调用 record_success() 或 record_failure() 报告结果。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS, half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        """
+        :param name: 服务名，用于日志和指标标签。
+        :param failure_threshold: 断开前允许的连续失败次数。
+        :param reset_seconds: 断开后等待多久进入半开状态。
+        :param half_open_probes: 半开状态下同时放行的探测请求数。
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str):
+        self._state = state
+        self._probes = 0
+        metrics.BREAKER_TRANSITIONS.inc(provider=self.name, state=state)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            logging.warning(f"服务 '{self.name}' 连续失败 {self._failures} 次，熔断 {self.reset_seconds:g} 秒，"
+                            f"期间直接使用缓存或本地降级方案。")
+        elif state == HALF_OPEN:
+            logging.info(f"服务 '{self.name}' 熔断期结束，放行探测请求。")
+        else:
+            logging.info(f"服务 '{self.name}' 已恢复。")
+
+    def available(self) -> bool:
+        """是否可能放行请求（不占用探测名额），用于决定是否值得重试。"""
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and self._probes < self.half_open_probes)
+
+    def allow(self) -> bool:
+        """申请发起一次请求。返回True时调用方必须随后报告结果；返回False时应直接降级。"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+        metrics.BREAKER_REJECTIONS.inc(provider=self.name)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            # 半开状态下探测失败立即重新断开；关闭状态下连续失败达到阈值才断开
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._transition(OPEN)
+
+    def __repr__(self):
+        return f"CircuitBreaker({self.name!r}, state={self.state})"
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name: str) -> CircuitBreaker:
+    """进程内按服务名共享的熔断器：同一批次中的所有任务共用同一服务的健康状态。"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
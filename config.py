@@ -1,5 +1,6 @@
 # config.py
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 加载 .env 文件变量到环境中
@@ -12,8 +13,89 @@ ONEAPI_BASE_URL = os.environ.get("ONEAPI_BASE_URL", "http://127.0.0.1:3000/v1")
 PEXELS_API_KEY = os.environ.get("PEXELS_API_KEY", "YOUR_PEXELS_API_KEY_HERE")
 MODEL_NAME = "gemini-2.5-flash"  # 您可以换成更强大的模型，如 "gpt-4o"
 
+# --- LLM 请求与对冲配置 ---
+# 单次方案请求的超时时间（秒）
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", "300"))
+# 对冲请求：主请求在对冲延迟内未返回时，向备用地址/模型再发一次请求，先通过JSON提取的响应胜出。
+# 设置 LLM_HEDGE_BASE_URL 或 LLM_HEDGE_MODEL 中的任意一个即可启用。
+LLM_HEDGE_BASE_URL = os.environ.get("LLM_HEDGE_BASE_URL")
+LLM_HEDGE_API_KEY = os.environ.get("LLM_HEDGE_API_KEY", ONEAPI_KEY)
+LLM_HEDGE_MODEL = os.environ.get("LLM_HEDGE_MODEL")
+# 对冲延迟取主端点近期延迟的该分位数，并限制在 [最小值, 最大值] 区间内；样本不足时使用默认值
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "0.9"))
+LLM_HEDGE_DEFAULT_DELAY = 60.0
+LLM_HEDGE_MIN_DELAY = 10.0
+LLM_HEDGE_MAX_DELAY = 180.0
+# 设为 1 时默认使用紧凑提示词：模型只输出每页的语义内容，元素几何由本地版式引擎计算（也可用 --compact-prompt 指定）
+PLAN_COMPACT_PROMPT = os.environ.get("PLAN_COMPACT_PROMPT", "").lower() in ("1", "true", "yes")
+# 设为 1 时要求模型用缩写键输出方案JSON（解析后还原为完整字段名），进一步减少输出token
+PLAN_ABBREVIATED_KEYS = os.environ.get("PLAN_ABBREVIATED_KEYS", "").lower() in ("1", "true", "yes")
+
+# --- 任务时间预算 ---
+# 剩余预算低于该秒数时进入降级模式：跳过重试和网络图片，改用缓存或本地占位图
+DEADLINE_LOW_SECONDS = 20.0
+# 从预算中分配给单个子步骤的最短超时（秒）
+DEADLINE_MIN_TIMEOUT = 1.0
+# 方案生成可占用的剩余预算比例，其余留给图片获取和渲染
+DEADLINE_PLAN_SHARE = 0.7
+# 单张图片获取可占用的剩余预算比例
+DEADLINE_IMAGE_SHARE = 0.1
+
+# --- 图片复用配置 ---
+# 规范化后的图片关键词相似度 (Jaccard) 达到该阈值时，直接复用已缓存的搜索结果而不再请求Pexels
+IMAGE_KEYWORD_SIMILARITY = float(os.environ.get("IMAGE_KEYWORD_SIMILARITY", "0.75"))
+# 进程内最多缓存的搜索结果（关键词）数量
+IMAGE_KEYWORD_INDEX_SIZE = 128
+# 每次Pexels搜索取回的候选照片数量，同一关键词的多次使用会在其中轮换
+PEXELS_RESULTS_PER_PAGE = 15
+# 搜索结果的缓存有效期（秒）
+PEXELS_SEARCH_TTL = 6 * 3600
+# 进程内最多缓存的已下载照片数量
+IMAGE_PHOTO_CACHE_SIZE = 64
+# 选择Pexels尺寸版本时，图框像素尺寸乘以该系数作为所需的最小分辨率（幻灯片按1280像素宽设计，1.5倍可覆盖1920宽的屏幕）
+IMAGE_DPI_FACTOR = float(os.environ.get("IMAGE_DPI_FACTOR", "1.5"))
+
+# --- 数据文件 ---
+# 流式读取CSV/Parquet时每个批次的行数
+DATA_BATCH_ROWS = int(os.environ.get("DATA_BATCH_ROWS", "65536"))
+# 折线图每个数据点至少占用的图框宽度 (px)；点数超过 图框宽度/该值 时用 LTTB 降采样
+CHART_PX_PER_POINT = float(os.environ.get("CHART_PX_PER_POINT", "4"))
+
+# --- 外部服务熔断 ---
+# 图片服务（Pexels搜索接口、照片下载）连续失败该次数后熔断，熔断期间直接使用缓存或本地占位图
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "3"))
+# 熔断持续的秒数，之后放行探测请求检查服务是否恢复
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+# 半开状态下同时放行的探测请求数
+BREAKER_HALF_OPEN_PROBES = int(os.environ.get("BREAKER_HALF_OPEN_PROBES", "1"))
+
+# --- 渲染工作进程回收 ---
+# 渲染工作进程完成该数量的任务后退出并由新进程接替，0 表示不按任务数回收
+WORKER_MAX_TASKS = int(os.environ.get("WORKER_MAX_TASKS", "20"))
+# 任务结束后工作进程的RSS超过该值 (MB) 时回收，0 表示不按内存回收
+WORKER_MAX_RSS_MB = float(os.environ.get("WORKER_MAX_RSS_MB", "1536"))
+
+# --- 指标导出 ---
+# 设置后在该端口提供 Prometheus 格式的 /metrics 端点（也可用 --metrics-port 指定）
+METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.environ.get("METRICS_PORT") else None
+# 批量任务结束后写出的指标文本文件路径，供 node_exporter textfile collector 采集；未设置时写在批量文件旁
+METRICS_TEXTFILE = os.environ.get("METRICS_TEXTFILE")
+
+# --- 表格 ---
+# 设为 1 时，行数超出图框容量的表格把剩余行分页到续页幻灯片上（会增加页数）；默认截断并注明未显示的行数。
+# 单个表格元素可用 "paginate": true/false 覆盖
+TABLE_PAGINATE = os.environ.get("TABLE_PAGINATE", "").lower() in ("1", "true", "yes")
+
+# --- 布局检查 ---
+# 渲染前总会检查方案中元素的越界、重叠和遮挡并记录日志；设为 1 时同时就地修正越界和重叠的元素
+LAYOUT_AUTOFIX = os.environ.get("LAYOUT_AUTOFIX", "").lower() in ("1", "true", "yes")
+
 # --- 输出配置 ---
+# 保存演示文稿时 XML 等部件的 deflate 压缩级别 (0-9)；PNG/JPEG 等已压缩的媒体始终直接存储
+PPTX_DEFLATE_LEVEL = int(os.environ.get("PPTX_DEFLATE_LEVEL", "6"))
 OUTPUT_DIR = "AI_Generated_PPTs"
+# 各任务临时目录的根目录；每个进程的每个任务在其中使用独立的子目录，多个进程可以共用
+SCRATCH_ROOT = os.environ.get("SCRATCH_ROOT") or os.path.join(tempfile.gettempdir(), "ai_ppt_generator")
 
 # --- Helper Functions (可选，保持清晰) ---
 def get_env_variable(var_name: str, default: str = None) -> str | None:
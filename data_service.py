@@ -0,0 +1,464 @@
+import copy
+import csv
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import pyarrow
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装时CSV按行流式聚合，Parquet不可用
+    pyarrow = None
+
+import metrics
+from config import DATA_BATCH_ROWS, CHART_PX_PER_POINT
+
+# 支持的聚合方式
+AGGREGATIONS = ('sum', 'mean', 'count', 'min', 'max')
+# 折线图降采样后至少保留的点数
+MIN_LINE_POINTS = 20
+# 柱状图每个类别至少需要的图框宽度 (px)，超出的类别只保留排序后的前若干个
+MIN_BAR_WIDTH_PX = 24
+# 饼图最多的扇区数，其余类别合并为“其他”
+MAX_PIE_SLICES = 8
+# 表格引用未指定 limit 时最多取的行数（超出图框容量的行由渲染器截断或分页，见 table_builder.split_table）
+DEFAULT_TABLE_ROWS = 50
+# 流式聚合时每累积这么多个批次的部分结果就合并一次，控制内存中的分组数
+PARTIAL_MERGE_EVERY = 16
+# 描述数据集时为文本列列出的示例取值个数，以及取示例值和推断CSV列类型时读取的行数
+SAMPLE_VALUES = 3
+SCHEMA_SAMPLE_ROWS = 200
+# 解析结果的缓存容量（同一进程内预览、多个宽高比和重复引用共用）
+RESOLVE_CACHE_SIZE = 64
+
+# 告诉模型如何引用数据文件；只在任务附带了数据文件时追加到请求末尾
+DATA_REF_INSTRUCTIONS = """
+### 附带的数据文件
+图表 (`chart`) 和表格 (`table`) 可以不写具体数值，改用 `data_ref` 引用以下数据文件，由程序读取并聚合：
+`"data_ref": {"file": 文件名, "x": 分组/横轴列, "y": [数值列, ...], "agg": "sum"|"mean"|"count"|"min"|"max", "sort": "x"|"-列名"|"列名", "limit": 数量}`
+- 每个数值列成为一个图表系列或一个表格列；`agg` 默认为 sum，`count` 统计行数。
+- `sort` 以 `-` 开头表示降序；折线图默认按 x 升序，柱状图、饼图和表格默认按第一个数值列降序。
+- 表格也可以用 `{"file": 文件名, "columns": [列名, ...], "limit": 数量}` 直接列出原始行。
+- 使用 `data_ref` 时不要再写 `data`、`headers` 或 `rows`；只能引用下面列出的文件和列。
+"""
+
+_resolve_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+class DataRefError(ValueError):
+    """数据引用无效：文件不存在、格式不支持或引用了不存在的列。"""
+
+
+def _format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    if ext in ('.csv', '.txt'):
+        return 'csv'
+    raise DataRefError(f"不支持的数据文件格式: '{path}'（仅支持 CSV 和 Parquet）。")
+
+
+def _category_label(value) -> str:
+    """类别轴标签：整点的时间只保留日期，整数值的浮点数去掉小数部分。"""
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+# ---------------------------------------------------------------------------
+# 流式读取
+# ---------------------------------------------------------------------------
+
+def _arrow_batches(path: str, columns: list[str] | None):
+    """按批次读取数据文件（pyarrow），只解码用到的列。"""
+    if _format(path) == 'parquet':
+        yield from pq.ParquetFile(path).iter_batches(batch_size=DATA_BATCH_ROWS, columns=columns)
+        return
+    convert_options = pa_csv.ConvertOptions(include_columns=columns) if columns else None
+    read_options = pa_csv.ReadOptions(block_size=1 << 22)
+    with pa_csv.open_csv(path, read_options=read_options, convert_options=convert_options) as reader:
+        yield from reader
+
+
+def _csv_rows(path: str):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def _schema(path: str) -> list[tuple[str, str]]:
+    """数据文件的 (列名, 类型) 列表。"""
+    if pyarrow is not None:
+        if _format(path) == 'parquet':
+            schema = pq.read_schema(path)
+        else:
+            schema = next(iter(_arrow_batches(path, None))).schema
+        return [(field.name, str(field.type)) for field in schema]
+    if _format(path) == 'parquet':
+        raise DataRefError("读取 Parquet 文件需要安装 pyarrow。")
+    # 没有类型信息：开头若干行的非空值都能解析为数字的列视为数值列
+    numeric = {}
+    for i, row in enumerate(_csv_rows(path)):
+        for name, value in row.items():
+            if value not in (None, '') and name is not None:
+                numeric[name] = numeric.get(name, True) and _to_number(value) is not None
+        if i >= SCHEMA_SAMPLE_ROWS:
+            break
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return [(name, 'double' if numeric.get(name) else 'string') for name in next(csv.reader(f), [])]
+
+
+def _y_columns(ref: dict) -> list[str]:
+    """引用中的数值列：模型有时把单个列名直接写成字符串，不能按字符拆开。"""
+    y = ref.get('y')
+    return [y] if isinstance(y, str) else list(y or [])
+
+
+def _check_columns(path: str, columns: list[str]):
+    available = {name for name, _ in _schema(path)}
+    if missing := [c for c in columns if c not in available]:
+        raise DataRefError(f"数据文件 '{os.path.basename(path)}' 中没有列: {', '.join(missing)}")
+
+
+# ---------------------------------------------------------------------------
+# 聚合
+# ---------------------------------------------------------------------------
+
+def _partial_specs(ys: list[str], agg: str) -> list[tuple[str, str, str]]:
+    """每个数值列需要累积的部分聚合：(列名, 批内聚合函数, 合并时的聚合函数)。"""
+    if agg == 'mean':
+        return [spec for y in ys for spec in ((y, 'sum', 'sum'), (y, 'count', 'sum'))]
+    if agg == 'count':
+        return [(y, 'count', 'sum') for y in ys]
+    return [(y, agg, agg) for y in ys]
+
+
+def _aggregate_arrow(path: str, x: str, ys: list[str], agg: str) -> tuple[list, list[list]]:
+    """
+    用 pyarrow 按批次分组聚合：每个批次向量化地 group_by 得到部分结果，
+    每 PARTIAL_MERGE_EVERY 个批次把部分结果再聚合一次，内存只与分组数成正比，与行数无关。
+    """
+    specs = _partial_specs(ys, agg)
+    names = [f"{y}_{func}" for y, func, _ in specs]
+    rows = 0
+
+    def merge(tables):
+        table = pyarrow.concat_tables(tables)
+        merged = table.group_by(x).aggregate([(name, merge_func) for name, (_, _, merge_func) in zip(names, specs)])
+        return merged.select([x] + [f"{name}_{merge_func}" for name, (_, _, merge_func) in zip(names, specs)]) \
+            .rename_columns([x] + names)
+
+    partials = []
+    for batch in _arrow_batches(path, list(dict.fromkeys([x] + ys))):
+        rows += batch.num_rows
+        table = pyarrow.Table.from_batches([batch]).filter(pc.is_valid(batch.column(x)))
+        partial = table.group_by(x).aggregate([(y, func) for y, func, _ in specs])
+        partials.append(partial.select([x] + names))
+        if len(partials) >= PARTIAL_MERGE_EVERY:
+            partials = [merge(partials)]
+    metrics.DATA_ROWS_SCANNED.inc(rows, format=_format(path))
+    if not partials:
+        return [], [[] for _ in ys]
+    result = merge(partials)
+
+    keys = result.column(x).to_pylist()
+    if agg == 'mean':
+        series = [pc.divide(pc.cast(result.column(f"{y}_sum"), pyarrow.float64()),
+                            result.column(f"{y}_count")).to_pylist() for y in ys]
+    else:
+        series = [result.column(f"{y}_{'count' if agg == 'count' else agg}").to_pylist() for y in ys]
+    return keys, series
+
+
+def _to_number(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _aggregate_csv(path: str, x: str, ys: list[str], agg: str) -> tuple[list, list[list]]:
+    """没有 pyarrow 时逐行流式聚合CSV，每个分组只保存各数值列的累积量。"""
+    groups = {}
+    rows = 0
+    for row in _csv_rows(path):
+        rows += 1
+        key = row.get(x)
+        if key in (None, ''):
+            continue
+        state = groups.get(key)
+        if state is None:
+            state = groups[key] = [[0.0, 0, None, None] for _ in ys]  # 和、计数、最小、最大
+        for acc, y in zip(state, ys):
+            value = _to_number(row.get(y))
+            if value is None:
+                continue
+            acc[0] += value
+            acc[1] += 1
+            acc[2] = value if acc[2] is None else min(acc[2], value)
+            acc[3] = value if acc[3] is None else max(acc[3], value)
+    metrics.DATA_ROWS_SCANNED.inc(rows, format='csv')
+
+    # CSV 没有类型信息：分组键全部是数字时按数值排序和显示
+    keys = list(groups)
+    if keys and all(_to_number(k) is not None for k in keys):
+        key_values = [_to_number(k) for k in keys]
+    else:
+        key_values = keys
+    pick = {'sum': lambda a: a[0] if a[1] else None, 'count': lambda a: a[1], 'min': lambda a: a[2],
+            'max': lambda a: a[3], 'mean': lambda a: a[0] / a[1] if a[1] else None}[agg]
+    series = [[pick(groups[k][i]) for k in keys] for i in range(len(ys))]
+    return key_values, series
+
+
+def aggregate(path: str, x: str, ys: list[str], agg: str = 'sum') -> tuple[list, list[list]]:
+    """
+    按 x 分组聚合数据文件的数值列 ys，返回 (分组键列表, 每个数值列的聚合值列表)，分组顺序未定义。
+    有 pyarrow 时向量化地按批次处理；否则CSV逐行流式处理。两种方式都不会把整个文件读入内存。
+    """
+    if agg not in AGGREGATIONS:
+        raise DataRefError(f"不支持的聚合方式 '{agg}'，可选: {', '.join(AGGREGATIONS)}")
+    _check_columns(path, [x] + ys)
+    if pyarrow is not None:
+        return _aggregate_arrow(path, x, ys, agg)
+    return _aggregate_csv(path, x, ys, agg)
+
+
+def head_rows(path: str, columns: list[str], limit: int) -> list[list]:
+    """读取数据文件的前 limit 行（只读取所需的批次）。"""
+    _check_columns(path, columns)
+    rows = []
+    if pyarrow is not None:
+        for batch in _arrow_batches(path, columns):
+            data = batch.slice(0, limit - len(rows)).to_pydict()
+            rows.extend(zip(*(data[c] for c in columns)))
+            if len(rows) >= limit:
+                break
+    else:
+        for row in _csv_rows(path):
+            rows.append(tuple(row.get(c) for c in columns))
+            if len(rows) >= limit:
+                break
+    return [[_category_label(v) if v is not None else '' for v in row] for row in rows]
+
+
+# ---------------------------------------------------------------------------
+# 降采样
+# ---------------------------------------------------------------------------
+
+def lttb_indices(values: list, threshold: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets 降采样：在等间距的横轴上从 values 中选出 threshold 个点的下标，
+    保留峰谷等视觉特征。首尾两点总是保留。缺失值按0参与面积计算。
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    ys = [v if v is not None else 0.0 for v in values]
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = (avg_start + avg_end - 1) / 2
+        avg_y = sum(ys[avg_start:avg_end]) / (avg_end - avg_start)
+        range_start, range_end = int(i * every) + 1, int((i + 1) * every) + 1
+        ax, ay = a, ys[a]
+        max_area, next_a = -1.0, range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - j) * (avg_y - ay))
+            if area > max_area:
+                max_area, next_a = area, j
+        selected.append(next_a)
+        a = next_a
+    selected.append(n - 1)
+    return selected
+
+
+def downsample_series(series: list[list], threshold: int) -> list[int]:
+    """多个系列共用类别轴：分别做 LTTB，取选中下标的并集，保证每个系列的特征点都在。"""
+    if not series or len(series[0]) <= threshold:
+        return list(range(len(series[0]) if series else 0))
+    return sorted(set().union(*(lttb_indices(values, threshold) for values in series)))
+
+
+# ---------------------------------------------------------------------------
+# 解析元素中的 data_ref
+# ---------------------------------------------------------------------------
+
+def _sorted_groups(keys: list, series: list[list], sort: str | None, ys: list[str]) -> list[int]:
+    """按 sort 返回分组的顺序（下标）：'x' 按分组键，'列名' 按该列的聚合值，'-' 前缀表示降序。"""
+    descending = bool(sort) and sort.startswith('-')
+    field = (sort or 'x').lstrip('-')
+    if field == 'x' or field not in ys:
+        values = keys
+    else:
+        values = series[ys.index(field)]
+    # 缺失值总是排在最后
+    order = sorted((i for i in range(len(keys)) if values[i] is not None), key=lambda i: values[i],
+                   reverse=descending)
+    return order + [i for i in range(len(keys)) if values[i] is None]
+
+
+def _round(value):
+    return round(value, 6) if isinstance(value, float) else value
+
+
+def _resolve_chart(path: str, ref: dict, element: dict) -> dict:
+    x, ys = ref.get('x'), _y_columns(ref)
+    if not x or not ys:
+        raise DataRefError("图表的 data_ref 必须指定 x 和 y。")
+    chart_type = str(element.get('chart_type', 'bar')).lower()
+    keys, series = aggregate(path, x, ys, ref.get('agg', 'sum'))
+
+    default_sort = 'x' if chart_type == 'line' else f"-{ys[0]}"
+    order = _sorted_groups(keys, series, ref.get('sort', default_sort), ys)
+    width = float(element.get('width', 1080))
+    if chart_type == 'line':
+        limit = ref.get('limit')
+        order = order[:limit] if isinstance(limit, int) and limit > 0 else order
+        ordered = [[values[i] for i in order] for values in series]
+        threshold = max(MIN_LINE_POINTS, int(width / CHART_PX_PER_POINT))
+        picked = downsample_series(ordered, threshold)
+        if len(picked) < len(order):
+            logging.info(f"折线图数据从 {len(order)} 个点降采样为 {len(picked)} 个点 (LTTB)。")
+        order = [order[i] for i in picked]
+        other = None
+    else:
+        max_groups = MAX_PIE_SLICES if chart_type == 'pie' else max(1, int(width / MIN_BAR_WIDTH_PX))
+        limit = min(ref['limit'], max_groups) if isinstance(ref.get('limit'), int) and ref['limit'] > 0 else max_groups
+        rest, order = order[limit:], order[:limit]
+        # 饼图需要完整的占比：被截掉的类别合并为“其他”
+        other = [sum(values[i] or 0 for i in rest) for values in series] if chart_type == 'pie' and rest else None
+
+    categories = [_category_label(keys[i]) for i in order]
+    data_series = [{'name': y, 'values': [_round(values[i]) for i in order]} for y, values in zip(ys, series)]
+    if other:
+        categories.append('其他')
+        for item, value in zip(data_series, other):
+            item['values'].append(_round(value))
+    return {'data': {'categories': categories, 'series': data_series}}
+
+
+def _resolve_table(path: str, ref: dict) -> dict:
+    limit = ref.get('limit') if isinstance(ref.get('limit'), int) and ref['limit'] > 0 else DEFAULT_TABLE_ROWS
+    if not ref.get('x'):
+        columns = list(ref.get('columns') or [name for name, _ in _schema(path)])
+        return {'headers': columns, 'rows': head_rows(path, columns, limit)}
+    x, ys = ref['x'], _y_columns(ref)
+    keys, series = aggregate(path, x, ys, ref.get('agg', 'sum'))
+    order = _sorted_groups(keys, series, ref.get('sort', f"-{ys[0]}" if ys else 'x'), ys)[:limit]
+    rows = [[_category_label(keys[i])] + [_category_label(_round(values[i])) if values[i] is not None else ''
+                                          for values in series] for i in order]
+    return {'headers': [x] + ys, 'rows': rows}
+
+
+def _resolve_element(element: dict, data_files: dict) -> dict:
+    ref = element['data_ref']
+    name = ref.get('file')
+    path = data_files.get(name) or data_files.get(os.path.basename(str(name)))
+    if not path or not os.path.exists(path):
+        raise DataRefError(f"未找到数据文件 '{name}'。")
+    stat = os.stat(path)
+    cache_key = (path, stat.st_mtime_ns, stat.st_size, element.get('type'), element.get('chart_type'),
+                 element.get('width'), json.dumps(ref, sort_keys=True, ensure_ascii=False))
+    with _lock:
+        if cache_key in _resolve_cache:
+            _resolve_cache.move_to_end(cache_key)
+            return _resolve_cache[cache_key]
+
+    start = time.perf_counter()
+    result = _resolve_table(path, ref) if element.get('type') == 'table' else _resolve_chart(path, ref, element)
+    elapsed = time.perf_counter() - start
+    metrics.DATA_RESOLVE_SECONDS.observe(elapsed, type=element.get('type', 'chart'))
+    logging.info(f"已从 '{os.path.basename(path)}' 解析 {element.get('type')} 数据，耗时 {elapsed:.2f}s。")
+    with _lock:
+        _resolve_cache[cache_key] = result
+        if len(_resolve_cache) > RESOLVE_CACHE_SIZE:
+            _resolve_cache.popitem(last=False)
+    return result
+
+
+def resolve_data_refs(plan: dict) -> dict:
+    """
+    把方案中图表和表格元素的 data_ref 替换为从数据文件聚合、降采样后的具体数据，返回新方案（不修改原方案）。
+    数据文件由方案的 'data_files'（文件名 -> 路径）给出；没有任何引用时原样返回。
+    单个引用解析失败时记录错误并保留元素原有的数据，不影响其余页面。
+    必须在版式确定之后调用：折线图的点数和柱状图的类别数取决于元素宽度。
+    """
+    data_files = plan.get('data_files') or {}
+    if not any('data_ref' in element for page in plan.get('pages', []) for element in page.get('elements', [])):
+        return plan
+    plan = copy.deepcopy(plan)
+    for page in plan.get('pages', []):
+        for element in page.get('elements', []):
+            if 'data_ref' not in element:
+                continue
+            try:
+                element.update(_resolve_element(element, data_files))
+            except (DataRefError, OSError) as e:
+                logging.error(f"解析数据引用 {element['data_ref']} 失败: {e}")
+            except Exception as e:
+                logging.error(f"解析数据引用 {element['data_ref']} 时出错: {e}", exc_info=True)
+    return plan
+
+
+# ---------------------------------------------------------------------------
+# 给模型的数据集描述
+# ---------------------------------------------------------------------------
+
+def _row_count(path: str) -> int | None:
+    if pyarrow is not None and _format(path) == 'parquet':
+        return pq.ParquetFile(path).metadata.num_rows
+    return None  # CSV 需要完整扫描才能计数，描述中省略
+
+
+def _describe_dataset(path: str, name: str) -> str:
+    """单个数据文件的描述行：列名、类型、行数和文本列的示例值。"""
+    schema = _schema(path)
+    samples = {}
+    text_columns = [column for column, kind in schema if kind in ('string', 'large_string')]
+    if text_columns:
+        for row in head_rows(path, text_columns, SCHEMA_SAMPLE_ROWS):
+            for column, value in zip(text_columns, row):
+                values = samples.setdefault(column, [])
+                if value and value not in values and len(values) < SAMPLE_VALUES:
+                    values.append(value)
+    rows = _row_count(path)
+    return f"- `{name}`" + (f"（{rows} 行）" if rows is not None else "") + "：" + "，".join(
+        f"{column} ({kind}" + (f"，如 {'/'.join(samples[column])}" if samples.get(column) else "") + ")"
+        for column, kind in schema)
+
+
+def describe_datasets(paths: list[str]) -> tuple[dict, str]:
+    """
+    为任务附带的数据文件生成 (文件名 -> 绝对路径, 给模型的描述)。描述只包含列名、类型、行数和文本列的少量示例值，
+    不包含数据本身；附在方案请求的末尾，模型据此用 data_ref 引用数据。
+    """
+    data_files, lines = {}, []
+    for path in paths:
+        name = os.path.basename(path)
+        # 单个文件损坏、编码不是UTF-8或格式无法解析时只忽略该文件，不影响方案生成和批次中的其他任务
+        try:
+            lines.append(_describe_dataset(path, name))
+        except (DataRefError, OSError) as e:
+            logging.error(f"读取数据文件 '{path}' 失败，已忽略: {e}")
+            continue
+        except Exception as e:
+            logging.error(f"解析数据文件 '{path}' 时出错，已忽略: {e}")
+            continue
+        data_files[name] = os.path.abspath(path)
+    if not data_files:
+        return {}, ""
+    return data_files, DATA_REF_INSTRUCTIONS + "\n".join(lines)
@@ -0,0 +1,58 @@
+import time
+
+from config import DEADLINE_LOW_SECONDS, DEADLINE_MIN_TIMEOUT
+
+
+class Deadline:
+    """
+    单个任务的端到端时间预算。
+    各子步骤通过 share() 从剩余预算中申请超时时间；预算所剩无几时 is_low() 为真，
+    调用方应降级（跳过重试、改用缓存或本地占位图），以保证按时交付演示文稿。
+    """
+
+    def __init__(self, seconds: float | None = None):
+        """
+        :param seconds: 预算秒数，None 表示不限时；0 或负数表示预算已经用完（不是不限时）。
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + max(0.0, seconds) if seconds is not None else None
+
+    @classmethod
+    def until(cls, wall_expiry: float | None) -> "Deadline":
+        """由绝对截止时间 (time.time() 时间戳) 创建预算，用于跨进程传递：在队列中等待的时间同样计入预算。"""
+        return cls(None if wall_expiry is None else wall_expiry - time.time())
+
+    def wall_expiry(self) -> float | None:
+        """截止时间的 time.time() 时间戳；不限时返回None。"""
+        return None if self.unlimited else time.time() + self.remaining()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.expires_at is None
+
+    def remaining(self) -> float | None:
+        """剩余秒数（不小于0）；不限时返回None。"""
+        if self.unlimited:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return not self.unlimited and self.remaining() <= 0
+
+    def is_low(self) -> bool:
+        """剩余预算低于降级阈值。"""
+        return not self.unlimited and self.remaining() < DEADLINE_LOW_SECONDS
+
+    def share(self, fraction: float, default: float) -> float:
+        """
+        为子步骤分配超时时间：不超过 default，也不超过剩余预算的 fraction 比例。
+        不限时则直接返回 default。
+        """
+        if self.unlimited:
+            return default
+        return max(DEADLINE_MIN_TIMEOUT, min(default, self.remaining() * fraction))
+
+    def __repr__(self):
+        if self.unlimited:
+            return "Deadline(unlimited)"
+        return f"Deadline(remaining={self.remaining():.1f}s)"
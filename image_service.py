@@ -1,99 +1,399 @@
 import logging
 import requests
+import threading
+from collections import Counter, OrderedDict
 from io import BytesIO
-from pexels_api import API as PexelsAPI
 import config
+from config import (DEADLINE_IMAGE_SHARE, IMAGE_KEYWORD_SIMILARITY, IMAGE_KEYWORD_INDEX_SIZE,
+                    PEXELS_RESULTS_PER_PAGE, PEXELS_SEARCH_TTL, IMAGE_PHOTO_CACHE_SIZE, IMAGE_DPI_FACTOR)
+from deadline import Deadline
+from circuit_breaker import breaker_for
+import metrics
+from keyword_index import KeywordIndex
 import tempfile
-from PIL import Image
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont, ImageStat
+import math
 import os
 import time  # 引入 time 模块
+import weakref
+import scratch
+from ppt_builder.contrast import parse_hex
 
-# 定义临时文件目录
-TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'temp')
+PEXELS_SEARCH_URL = "https://api.pexels.com/v1/search"
+# 熔断器的服务名：搜索接口（限流、鉴权）和照片CDN的故障相互独立，各自熔断
+PEXELS_SEARCH_PROVIDER = "pexels_search"
+PEXELS_PHOTO_PROVIDER = "pexels_photos"
+# 单个关键词获取Pexels图片的最多尝试次数，以及两次尝试之间的等待秒数
+PEXELS_MAX_ATTEMPTS = 3
+PEXELS_RETRY_DELAY = 3
+
+# Pexels 照片 src 中各尺寸版本的生成方式：('fit', 最大宽, 最大高) 为等比缩小到框内，None 表示该方向不限；
+# ('crop', 宽, 高) 为裁剪到固定尺寸。按此推算每个版本的实际像素，选择能覆盖图框的最小版本
+PEXELS_SIZE_VARIANTS = {
+    'tiny': ('crop', 280, 200),
+    'small': ('fit', None, 130),
+    'medium': ('fit', None, 350),
+    'landscape': ('crop', 1200, 627),
+    'portrait': ('crop', 800, 1200),
+    'large': ('fit', 940, 650),
+    'large2x': ('fit', 1880, 1300),
+}
+# 没有版本能覆盖图框、或照片缺少尺寸信息时使用的版本
+PEXELS_DEFAULT_VARIANT = 'large2x'
+# 图框宽高比超出 [1/该值, 该值] 时，搜索时请求横向或竖向的照片，否则请求方形照片
+PEXELS_ORIENTATION_RATIO = 1.2
+
+# 本地占位图的默认尺寸与配色 (主色, 辅色)
+PLACEHOLDER_DEFAULT_SIZE = (1280, 720)
+PLACEHOLDER_DEFAULT_PALETTE = ("#9E9E9E", "#E0E0E0")
+
+# 图片区域统计的网格 (列, 行)：图片按该网格划分区域，记录每个区域的平均颜色
+IMAGE_STATS_GRID = (12, 12)
+
+class PhotoCache:
+    """按照片URL缓存已下载的图片字节，容量有限，超出时淘汰最久未使用的条目。线程安全。"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> bytes | None:
+        with self._lock:
+            if url in self._entries:
+                self._entries.move_to_end(url)
+                return self._entries[url]
+            return None
+
+    def put(self, url: str, content: bytes):
+        with self._lock:
+            self._entries[url] = content
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# 进程内共享的搜索结果索引：{规范化关键词: (获取时间, 候选照片列表)}。
+# 不同页面、不同演示文稿中相同或相近的关键词共用一次搜索的结果。
+shared_search_index = KeywordIndex(IMAGE_KEYWORD_SIMILARITY, max_entries=IMAGE_KEYWORD_INDEX_SIZE)
+# 进程内共享的已下载照片缓存
+shared_photo_cache = PhotoCache(IMAGE_PHOTO_CACHE_SIZE)
+
+# 依次尝试的占位图字体，均不可用时退回Pillow内置字体
+PLACEHOLDER_FONTS = ("DejaVuSans.ttf", "arial.ttf", "msyh.ttc")
+
+
+def _load_placeholder_font(size: int):
+    for font_name in PLACEHOLDER_FONTS:
+        try:
+            return ImageFont.truetype(font_name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 的内置字体不支持指定字号
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=256)
+def render_placeholder(keyword: str, size: tuple[int, int], palette: tuple[str, ...]) -> bytes:
+    """
+    在本地绘制一张与配色方案匹配的占位图 (PNG字节)。
+    背景为主色到辅色的对角渐变（只有一种颜色时为纯色），中央写有关键词。
+    结果按 (关键词, 尺寸, 配色) 缓存。
+    """
+    width, height = max(1, int(size[0])), max(1, int(size[1]))
+    # 无法解析的颜色退回默认灰色
+    start = (parse_hex(palette[0]) if palette else None) or parse_hex(PLACEHOLDER_DEFAULT_PALETTE[0])
+    end = (parse_hex(palette[1]) if len(palette) > 1 else None) or start
+
+    if start == end:
+        img = Image.new("RGB", (width, height), start)
+    else:
+        # 对角渐变: 混合横向与纵向的小尺寸线性渐变得到对角蒙版，放大到目标尺寸后再混合两种颜色
+        vertical = Image.linear_gradient("L")
+        mask = Image.blend(vertical, vertical.rotate(90), 0.5).resize((width, height))
+        img = Image.composite(Image.new("RGB", (width, height), end), Image.new("RGB", (width, height), start), mask)
+
+    if keyword:
+        draw = ImageDraw.Draw(img)
+        # 根据背景平均亮度选择黑色或白色文字
+        mid = tuple((a + b) // 2 for a, b in zip(start, end))
+        luminance = 0.299 * mid[0] + 0.587 * mid[1] + 0.114 * mid[2]
+        text_color = (33, 33, 33) if luminance > 150 else (255, 255, 255)
+
+        font_size = max(8, min(height // 6, width // max(8, len(keyword) // 2 + 4)))
+        font = _load_placeholder_font(font_size)
+        left, top, right, bottom = draw.textbbox((0, 0), keyword, font=font)
+        draw.text(((width - (right - left)) / 2 - left, (height - (bottom - top)) / 2 - top),
+                  keyword, fill=text_color, font=font)
+
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def search_orientation(size: tuple[int, int] | None) -> str | None:
+    """根据图框宽高比给出Pexels搜索的 orientation 参数。"""
+    if not size or not size[0] or not size[1]:
+        return None
+    aspect = size[0] / size[1]
+    if aspect >= PEXELS_ORIENTATION_RATIO:
+        return 'landscape'
+    if aspect <= 1 / PEXELS_ORIENTATION_RATIO:
+        return 'portrait'
+    return 'square'
+
+
+def _variant_dimensions(width: int, height: int, variant: tuple) -> tuple[float, float]:
+    mode, max_width, max_height = variant
+    if mode == 'crop':
+        return max_width, max_height
+    scale = min(max_width / width if max_width else 1.0, max_height / height if max_height else 1.0, 1.0)
+    return width * scale, height * scale
+
+
+def choose_photo_variant(photo: dict, size: tuple[int, int] | None) -> str:
+    """
+    选择能覆盖目标图框的最小尺寸版本。
+    图片会按图框宽高比居中裁剪，因此比较的是裁剪后可见部分的宽度与 图框宽度 x IMAGE_DPI_FACTOR。
+    """
+    src = photo.get('src', {})
+    width, height = photo.get('width'), photo.get('height')
+    if not size or not size[0] or not size[1] or not width or not height:
+        return PEXELS_DEFAULT_VARIANT
+    box_aspect = size[0] / size[1]
+    required_width = size[0] * IMAGE_DPI_FACTOR
+
+    best, best_area = None, None
+    for name, variant in PEXELS_SIZE_VARIANTS.items():
+        if name not in src:
+            continue
+        variant_width, variant_height = _variant_dimensions(width, height, variant)
+        visible_width = min(variant_width, variant_height * box_aspect)
+        area = variant_width * variant_height
+        if visible_width >= required_width and (best_area is None or area < best_area):
+            best, best_area = name, area
+    return best or PEXELS_DEFAULT_VARIANT
+
+
+def compute_image_stats(img: Image.Image) -> dict:
+    """
+    计算图片的亮度与区域颜色统计，供渲染时检查文字对比度。
+    图片用BOX滤波缩小到统计网格，每个像素就是对应区域的平均颜色 (RGBA，透明度已预乘处理)，
+    整个计算在Pillow的C实现中完成，不需要逐像素遍历。
+    :return: {'size': 原图尺寸, 'grid': (列, 行), 'cells': 按行排列的区域平均颜色, 'mean_luminance': 平均亮度 0-255}
+    """
+    rgba = img.convert("RGBA")
+    return {
+        'size': rgba.size,
+        'grid': IMAGE_STATS_GRID,
+        'cells': list(rgba.resize(IMAGE_STATS_GRID, Image.BOX).getdata()),
+        'mean_luminance': ImageStat.Stat(rgba.convert("L")).mean[0],
+    }
 
 
 class ImageService:
     """处理图片获取、应用效果（如透明度）并保存为临时文件。"""
 
-    def __init__(self):
-        self.pexels_client = None
+    def __init__(self, asset_dir: str | None = None, asset_cache: dict | None = None,
+                 deadline: Deadline | None = None, offline: bool = False,
+                 search_index: KeywordIndex | None = None):
+        """
+        :param asset_dir: 处理后图片的保存目录。默认新建一个本实例专用的临时目录，实例被回收时删除。
+        :param asset_cache: 可选的 {资源键: 文件路径} 映射，命中且文件仍存在时直接复用（用于断点续跑）。
+        :param deadline: 任务时间预算。预算不足时跳过网络请求，改用缓存或本地占位图。
+        :param offline: 离线模式，只使用本地占位图，不发起任何网络请求。
+        :param search_index: Pexels搜索结果的关键词索引，默认使用进程内共享的索引。
+        """
+        if asset_dir is None:
+            scratch_dir = scratch.create("images")
+            weakref.finalize(self, scratch_dir.release)
+            asset_dir = scratch_dir.path
+        self.asset_dir = asset_dir
+        self.asset_cache = asset_cache if asset_cache is not None else {}
+        self.deadline = deadline or Deadline()
+        self.offline = offline
+        self.search_index = search_index if search_index is not None else shared_search_index
+        # 本演示文稿内各照片与关键词的使用次数，用于为重复的关键词分配不同的照片
+        self._photo_uses = Counter()
+        self._keyword_uses = Counter()
+        # 已生成图片的区域统计 {文件路径: compute_image_stats 的结果}
+        self._image_stats = {}
+        # 本地占位图的配色，由 PresentationBuilder 根据方案的调色板设置
+        self.palette = PLACEHOLDER_DEFAULT_PALETTE
+        # 进程内共享的熔断器：服务故障期间，本进程的所有任务都直接使用缓存或本地占位图
+        self.search_breaker = breaker_for(PEXELS_SEARCH_PROVIDER)
+        self.photo_breaker = breaker_for(PEXELS_PHOTO_PROVIDER)
+        self.pexels_key = None
         pexels_key = config.get_api_key("PEXELS_API_KEY")
-        if pexels_key and pexels_key != "YOUR_PEXELS_API_KEY_HERE":
-            try:
-                self.pexels_client = PexelsAPI(pexels_key)
-                logging.info("Pexels客户端初始化成功。")
-            except Exception as e:
-                logging.error(f"初始化Pexels客户端失败: {e}")
+        if offline:
+            logging.info("图片服务运行于离线模式，将只使用本地占位图。")
+        elif pexels_key and pexels_key != "YOUR_PEXELS_API_KEY_HERE":
+            self.pexels_key = pexels_key
+            logging.info("Pexels客户端初始化成功。")
         else:
             logging.warning("未配置Pexels API密钥，将使用占位图片服务。")
 
-    def _fetch_from_pexels(self, keyword: str) -> BytesIO | None:
+    def _search_pexels(self, keyword: str, timeout: float, orientation: str | None = None) -> dict:
+        """
+        调用Pexels搜索接口。直接使用 requests 而非 pexels_api 客户端：
+        后者的超时固定为15秒，且在网络错误时会直接退出进程。
+        """
+        params = {"query": keyword, "per_page": PEXELS_RESULTS_PER_PAGE, "page": 1}
+        if orientation:
+            params["orientation"] = orientation
+        response = requests.get(
+            PEXELS_SEARCH_URL,
+            params=params,
+            headers={"Authorization": self.pexels_key},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _get_candidates(self, keyword: str, allow_network: bool, orientation: str | None = None) -> list[dict] | None:
+        """
+        获取关键词的候选照片列表：优先使用未过期的（相同或相近关键词的）缓存搜索结果，
+        否则发起一次搜索并缓存整页结果。不允许联网或搜索接口处于熔断状态时，过期的缓存也会被使用。
+        orientation 只是搜索时的提示：缓存的结果不区分方向，由 _pick_photo 在候选中挑选宽高比最接近的照片。
+        """
+        hit = self.search_index.lookup(keyword)
+        fresh = hit is not None and time.time() - hit[0][0] < PEXELS_SEARCH_TTL
+        # 只在确实需要联网时才向熔断器申请；熔断期间过期的缓存结果同样可用
+        if not fresh and allow_network and not self.search_breaker.allow():
+            logging.info(f"Pexels搜索接口处于熔断状态，'{keyword}' 只使用已缓存的图片。")
+            allow_network = False
+        if hit and (fresh or not allow_network):
+            (fetched_at, photos), score = hit
+            logging.info(f"关键词 '{keyword}' 命中已缓存的搜索结果 (相似度 {score:.2f}，{len(photos)} 张候选)。")
+            metrics.PEXELS_SEARCHES.inc(result="hit")
+            return photos
+        if not allow_network:
+            return None
+
+        metrics.PEXELS_SEARCHES.inc(result="miss")
+        try:
+            search_results = self._search_pexels(keyword, self.deadline.share(DEADLINE_IMAGE_SHARE, 15), orientation)
+        except Exception:
+            self.search_breaker.record_failure()
+            raise
+        self.search_breaker.record_success()
+        photos = search_results.get('photos') or []
+        # 空结果同样缓存，避免重复搜索注定没有结果的关键词
+        self.search_index.add(keyword, (time.time(), photos))
+        return photos
+
+    def _pick_photo(self, photos: list[dict], size: tuple[int, int] | None = None) -> dict:
+        """
+        优先选择本演示文稿中尚未使用过的照片；候选全部用过时选择使用次数最少的。
+        使用次数相同的照片中，选择宽高比与图框最接近的，裁剪损失的像素最少。
+        """
+        def aspect_distance(p):
+            if not size or not size[0] or not size[1] or not p.get('width') or not p.get('height'):
+                return 0.0
+            return abs(math.log((p['width'] / p['height']) / (size[0] / size[1])))
+
+        photo = min(photos, key=lambda p: (self._photo_uses[p.get('id')], aspect_distance(p)))
+        self._photo_uses[photo.get('id')] += 1
+        return photo
+
+    def _download_photo(self, photo: dict, allow_network: bool, size: tuple[int, int] | None = None) -> bytes | None:
+        """下载照片中能覆盖图框的最小尺寸版本（见 choose_photo_variant）。"""
+        src = photo.get('src', {})
+        variant = choose_photo_variant(photo, size)
+        photo_url = src.get(variant) or src.get(PEXELS_DEFAULT_VARIANT)
+        if not photo_url:
+            return None
+        if (content := shared_photo_cache.get(photo_url)) is not None:
+            return content
+        if not allow_network or not self.photo_breaker.allow():
+            return None
+        try:
+            response = requests.get(photo_url, timeout=self.deadline.share(DEADLINE_IMAGE_SHARE, 20))
+            response.raise_for_status()
+        except Exception:
+            self.photo_breaker.record_failure()
+            raise
+        self.photo_breaker.record_success()
+        metrics.IMAGE_DOWNLOADED_BYTES.inc(len(response.content), variant=variant)
+        logging.info(f"已下载Pexels照片 {photo.get('id')} 的 {variant} 版本 ({len(response.content) / 1024:.0f}KB)。")
+        shared_photo_cache.put(photo_url, response.content)
+        return response.content
+
+    def _fetch_from_pexels(self, keyword: str, size: tuple[int, int] | None = None) -> BytesIO | None:
         """
         [已优化] 从Pexels获取图片，带有重试机制。
-        最多重试3次，每次间隔3秒。
+        一次搜索取回一整页候选照片并缓存，同一关键词在同一演示文稿中多次出现时轮换使用不同的照片。
+        size 为目标图框的像素尺寸，用于选择照片方向和下载的尺寸版本。
+        最多尝试 PEXELS_MAX_ATTEMPTS 次，每次间隔 PEXELS_RETRY_DELAY 秒；每次请求的超时从任务时间预算中分配。
+        预算不足或服务处于熔断状态时不再联网（也不再重试），只使用已缓存的搜索结果和照片。
         """
-        if not self.pexels_client:
+        if not self.pexels_key:
             return None
 
-        max_retries = 3
+        max_retries = PEXELS_MAX_ATTEMPTS
         for attempt in range(max_retries):
+            allow_network = not self.deadline.is_low()
+            if not allow_network:
+                logging.warning(f"任务时间预算不足 ({self.deadline})，'{keyword}' 只使用已缓存的图片。")
             try:
-                logging.info(f"正在从Pexels搜索 '{keyword}' (尝试 {attempt + 1}/{max_retries})...")
-                search_results = self.pexels_client.search(keyword, page=1, results_per_page=1)
-                if photos := search_results.get('photos'):
-                    photo_url = photos[0].get('src', {}).get('large2x')
-                    if photo_url:
-                        response = requests.get(photo_url, timeout=20)
-                        response.raise_for_status()
+                logging.info(f"正在获取 '{keyword}' 的Pexels图片 (尝试 {attempt + 1}/{max_retries})...")
+                photos = self._get_candidates(keyword, allow_network, search_orientation(size))
+                if photos:
+                    content = self._download_photo(self._pick_photo(photos, size), allow_network, size)
+                    if content:
                         logging.info(f"Pexels图片 '{keyword}' 获取成功。")
-                        return BytesIO(response.content)
+                        return BytesIO(content)
 
-                logging.warning(f"未在Pexels上找到 '{keyword}' 的图片。")
+                if allow_network and photos is not None and not photos:
+                    logging.warning(f"未在Pexels上找到 '{keyword}' 的图片。")
                 return None  # 如果搜索成功但没有图片，直接返回None，无需重试
 
             except Exception as e:
                 logging.warning(f"Pexels搜索 '{keyword}' 失败 (尝试 {attempt + 1}): {e}。")
-                if attempt < max_retries - 1:
-                    logging.info("将在3秒后重试...")
-                    time.sleep(3)
-                    self.pexels_client = None
-                    pexels_key = config.get_api_key("PEXELS_API_KEY")
-                    if pexels_key and pexels_key != "YOUR_PEXELS_API_KEY_HERE":
-                        try:
-                            self.pexels_client = PexelsAPI(pexels_key)
-                            logging.info("Pexels客户端初始化成功。")
-                        except Exception as e:
-                            logging.error(f"初始化Pexels客户端失败: {e}")
-                    else:
-                        logging.warning("未配置Pexels API密钥，将使用占位图片服务。")
+                if attempt < max_retries - 1 and not self.deadline.is_low() \
+                        and self.search_breaker.available() and self.photo_breaker.available():
+                    logging.info(f"将在{PEXELS_RETRY_DELAY}秒后重试...")
+                    time.sleep(PEXELS_RETRY_DELAY)
                 else:
-                    logging.error(f"Pexels搜索 '{keyword}' 在 {max_retries} 次尝试后彻底失败。")
+                    logging.error(f"Pexels搜索 '{keyword}' 在 {attempt + 1} 次尝试后彻底失败。")
+                    return None
 
         return None
 
-    def _fetch_from_fallback(self, keyword: str) -> BytesIO | None:
-        """从备用服务获取占位图片。"""
-        try:
-            logging.info(f"正在为 '{keyword}' 使用占位图片。")
-            placeholder_url = f"https://placehold.co/1280x720.png?text={keyword.replace(' ', '+')}&font=lato"
-            response = requests.get(placeholder_url, timeout=10)
-            response.raise_for_status()
-            return BytesIO(response.content)
-        except Exception as e:
-            logging.error(f"获取 '{keyword}' 的占位图片失败: {e}")
-            return None
+    def _fetch_from_fallback(self, keyword: str, size: tuple[int, int] | None = None) -> BytesIO:
+        """在本地按目标尺寸生成与配色匹配的占位图，无需任何网络请求。"""
+        size = tuple(size) if size else PLACEHOLDER_DEFAULT_SIZE
+        logging.info(f"正在为 '{keyword}' 使用本地占位图 ({size[0]}x{size[1]})。")
+        return BytesIO(render_placeholder(keyword, size, tuple(self.palette)))
 
-    def generate_image(self, keyword: str, opacity: float = 1.0) -> str | None:
+    def generate_image(self, keyword: str, opacity: float = 1.0, size: tuple[int, int] | None = None) -> str | None:
         """
         获取图片，应用透明度，保存到临时文件并返回路径。
+        :param size: 目标图框的像素尺寸 (宽, 高)。决定Pexels照片的方向和下载的尺寸版本，
+                     以及本地占位图的尺寸；None 时下载 large2x 版本。
         """
-        image_stream = self._fetch_from_pexels(keyword) or self._fetch_from_fallback(keyword)
+        # 同一关键词在演示文稿中的第几次出现，保证续跑时每次出现都对应到各自的图片
+        occurrence = self._keyword_uses[keyword]
+        self._keyword_uses[keyword] += 1
+        asset_key = f"{keyword}|{opacity}|{occurrence}"
+        cached_path = self.asset_cache.get(asset_key)
+        if cached_path and os.path.exists(cached_path):
+            logging.info(f"复用已解析的图片资源 '{keyword}': {cached_path}")
+            metrics.IMAGE_REQUESTS.inc(source="asset")
+            return cached_path
 
-        if not image_stream:
-            return None
+        image_stream = None if self.offline else self._fetch_from_pexels(keyword, size)
+        # 占位图生成只需几毫秒，不写入资源缓存，以便续跑时重新尝试获取真实图片
+        is_placeholder = image_stream is None
+        if is_placeholder:
+            image_stream = self._fetch_from_fallback(keyword, size)
+        metrics.IMAGE_REQUESTS.inc(source="fallback" if is_placeholder else "pexels")
 
         try:
-            os.makedirs(TEMP_DIR, exist_ok=True)
+            os.makedirs(self.asset_dir, exist_ok=True)
 
             img = Image.open(image_stream).convert("RGBA")
 
@@ -102,10 +402,27 @@ class ImageService:
                 new_alpha = alpha.point(lambda p: p * opacity)
                 img.putalpha(new_alpha)
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png', dir=TEMP_DIR) as temp_file:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.png', dir=self.asset_dir) as temp_file:
                 img.save(temp_file, format='PNG')
                 logging.info(f"已为 '{keyword}' (透明度={opacity}) 生成并保存临时图片: {temp_file.name}")
-                return temp_file.name
+            # 图片已解码在内存中，顺便计算区域统计，渲染时无需再次读取文件
+            self._image_stats[temp_file.name] = compute_image_stats(img)
+            if not is_placeholder:
+                self.asset_cache[asset_key] = temp_file.name
+            return temp_file.name
         except Exception as e:
             logging.error(f"处理或保存图片到临时文件时出错: {e}", exc_info=True)
-            return None
\ No newline at end of file
+            return None
+
+    def get_image_stats(self, image_path: str) -> dict | None:
+        """返回图片的区域统计（见 compute_image_stats）。复用的已有资源在第一次查询时读取文件计算并缓存。"""
+        if not image_path:
+            return None
+        if image_path not in self._image_stats:
+            try:
+                with Image.open(image_path) as img:
+                    self._image_stats[image_path] = compute_image_stats(img)
+            except Exception as e:
+                logging.warning(f"无法读取图片 '{image_path}' 计算区域统计: {e}")
+                self._image_stats[image_path] = None
+        return self._image_stats[image_path]
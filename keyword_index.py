@@ -0,0 +1,92 @@
+import re
+import threading
+from collections import OrderedDict
+
+# 对图片检索意义不大的英文停用词
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'of', 'and', 'or', 'with', 'in', 'on', 'at', 'for', 'to', 'from', 'by',
+    'as', 'is', 'are', 'its', 'their', 'his', 'her', 'into', 'over', 'under', 'some', 'very',
+    'image', 'photo', 'picture', 'background',
+})
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _stem(token: str) -> str:
+    """极简的复数还原，让 'portraits' 与 'portrait' 归为同一个词。"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def normalize_keyword(keyword: str) -> frozenset[str]:
+    """把关键词规范化为词集合：忽略大小写、标点、停用词和词序。"""
+    tokens = _TOKEN_PATTERN.findall(keyword.lower())
+    normalized = frozenset(_stem(t) for t in tokens if t not in STOPWORDS)
+    # 关键词全部由停用词组成时退回原始词集合，避免所有此类关键词互相匹配
+    return normalized or frozenset(tokens)
+
+
+class KeywordIndex:
+    """
+    图片关键词的相似度索引。
+    以规范化后的词集合为键保存已获取的资源；查询时先做精确匹配，
+    再通过倒排表只对至少共享一个词的候选计算 Jaccard 相似度，超过阈值即视为同一张图。
+    """
+
+    def __init__(self, threshold: float, max_entries: int = 128):
+        """
+        :param threshold: 相似度阈值 (0-1)，达到该值的关键词复用已有资源。
+        :param max_entries: 最多保留的条目数，超出时淘汰最早加入的条目。
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, keyword: str, value):
+        key = normalize_keyword(keyword)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = value
+            for token in key:
+                self._postings.setdefault(token, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def lookup(self, keyword: str):
+        """返回 (资源, 相似度)；没有足够相似的条目时返回None。"""
+        key = normalize_keyword(keyword)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key], 1.0
+
+            candidates = set()
+            for token in key:
+                candidates.update(self._postings.get(token, ()))
+
+            best_key, best_score = None, 0.0
+            for candidate in candidates:
+                score = len(key & candidate) / len(key | candidate)
+                if score > best_score:
+                    best_key, best_score = candidate, score
+
+            if best_key is not None and best_score >= self.threshold:
+                return self._entries[best_key], best_score
+            return None
+
+    def _evict(self, key: frozenset[str]):
+        del self._entries[key]
+        for token in key:
+            keys = self._postings.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[token]
@@ -2,91 +2,382 @@ import logging
 import argparse
 import json
 import os
-import shutil
-import atexit
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from datetime import datetime
 from ai_service import generate_presentation_plan
+from data_service import describe_datasets
+from deadline import Deadline
+from batch_state import BatchState, STATUS_PLANNED, STATUS_DONE, STATUS_FAILED
+from image_service import ImageService
 from ppt_builder.presentation import PresentationBuilder
-from config import OUTPUT_DIR
+from ppt_builder import preview
+from ppt_builder.layout_transform import rescale_plan
+import metrics
+import scratch
+from config import (OUTPUT_DIR, METRICS_PORT, METRICS_TEXTFILE, WORKER_MAX_TASKS, WORKER_MAX_RSS_MB,
+                    PLAN_COMPACT_PROMPT)
+from memory_usage import TaskMemoryTracker
+from worker_pool import RecyclingProcessPool
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
 
-# 定义临时目录和输出目录
-TEMP_DIR = "temp"
-
-
-def cleanup_temp_dir():
-    """清理临时目录。"""
-    if os.path.exists(TEMP_DIR):
-        try:
-            shutil.rmtree(TEMP_DIR)
-            logging.info(f"临时目录 '{TEMP_DIR}' 已被成功清理。")
-        except OSError as e:
-            logging.error(f"清理临时目录 '{TEMP_DIR}' 时出错: {e}")
+# 方案文件的扩展名
+PLAN_FILE_SUFFIX = ".plan.json"
+# 流水线模式的默认规划线程数（受LLM并发限制）和渲染进程数（受CPU限制）
+DEFAULT_PLANNERS = 4
+DEFAULT_RENDERERS = os.cpu_count() or 1
 
 
 def ensure_dirs_exist():
-    """确保输出目录和临时目录存在。"""
+    """确保输出目录存在。临时文件使用各任务独立的临时目录（见 scratch 模块），不再共用一个目录。"""
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
 
 
-def generate_single_ppt(theme: str, num_pages: int, aspect_ratio: str):
+def build_output_path(theme: str, plan: dict, aspect_ratio: str) -> str:
+    """根据主题、设计风格、日期和宽高比自动生成输出文件路径。"""
+    # 1. 从方案中获取设计风格
+    style = plan.get('design_concept', '未知风格')
+    # 2. 获取当前日期
+    date_str = datetime.now().strftime("%Y%m%d")
+
+    # 3. 清理文件名中的非法字符
+    sanitized_theme = theme.replace(' ', '_').replace('/', '_').replace('\\', '_').replace(':', '：').replace(
+        '《', '').replace('》', '')
+    sanitized_style = style.replace(' ', '_').replace('/', '_').replace('\\', '_').replace(':', '：')
+
+    # 4. 清理并格式化宽高比
+    ratio_str = aspect_ratio.replace(':', 'x')
+
+    # 5. 组合成最终文件名
+    output_filename = f"{sanitized_theme}_{sanitized_style}_{date_str}_{ratio_str}.pptx"
+    return os.path.join(OUTPUT_DIR, output_filename)
+
+
+def plan_file_path(output_path: str) -> str:
+    """演示文稿对应的方案文件路径：与输出文件同名，扩展名为 .plan.json。"""
+    return f"{os.path.splitext(output_path)[0]}{PLAN_FILE_SUFFIX}"
+
+
+def save_plan_file(path: str, theme: str, aspect_ratio: str, plan: dict):
+    """保存方案文件，连同主题和宽高比一起写入，供 --from-plan 在其他机器或进程中渲染。"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"theme": theme, "aspect_ratio": aspect_ratio, "plan": plan}, f, ensure_ascii=False, indent=2)
+    logging.info(f"方案已保存至 {path}")
+
+
+def load_plan_file(path: str, default_aspect_ratio: str) -> tuple[str, str, dict]:
+    """
+    读取方案文件，返回 (主题, 宽高比, 方案)。
+    也接受不带外层信息的原始方案JSON，此时主题取文件名，宽高比取 default_aspect_ratio。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    name = os.path.basename(path).removesuffix(PLAN_FILE_SUFFIX).removesuffix('.json')
+    if 'plan' in data and 'pages' not in data:
+        return data.get('theme') or name, data.get('aspect_ratio') or default_aspect_ratio, data['plan']
+    return name, default_aspect_ratio, data
+
+
+def collect_plan_files(path: str) -> list[str]:
+    """--from-plan 的参数可以是单个方案文件，也可以是目录（目录中所有 .plan.json 文件，没有时取所有 .json 文件）。"""
+    if not os.path.isdir(path):
+        return [path]
+    names = sorted(os.listdir(path))
+    plan_files = [n for n in names if n.endswith(PLAN_FILE_SUFFIX)] or [n for n in names if n.endswith('.json')]
+    return [os.path.join(path, n) for n in plan_files]
+
+
+def link_aspect_ratio_variants(tasks: list[dict]):
+    """
+    同一主题、同样页数、附带同样数据文件、只是宽高比不同的批量任务共用一份方案：每组的第一个任务调用AI，
+    其余任务记录 'plan_source'（第一个任务的键）和 'source_ratio'，由其方案经几何变换得到。
+    """
+    primaries = {}
+    for task in tasks:
+        data_files = tuple(sorted(os.path.abspath(path) for path in task.get('data_files') or ()))
+        primary = primaries.setdefault((task['theme'], task['pages'], data_files), task)
+        if primary is not task and task['aspect_ratio'] != primary['aspect_ratio']:
+            task['plan_source'], task['source_ratio'] = primary['key'], primary['aspect_ratio']
+
+
+def plan_source_for(task: dict, batch_state: BatchState) -> dict | None:
+    """任务的共用方案来源：{'aspect_ratio', 'plan', 'images'}；没有来源或来源任务尚无方案时返回None。"""
+    if not task.get('plan_source'):
+        return None
+    record = batch_state.get_task(task['plan_source'])
+    if not record.get('plan'):
+        return None
+    return {'aspect_ratio': task['source_ratio'], 'plan': record['plan'], 'images': dict(record.get('images', {}))}
+
+
+def plan_presentation(theme: str, num_pages: int, aspect_ratio: str, batch_state: BatchState | None = None,
+                      task_key: str | None = None, deadline: Deadline | None = None,
+                      source: dict | None = None, compact_prompt: bool = False,
+                      data_files: list[str] | None = None) -> dict | None:
+    """
+    方案阶段：调用AI生成方案（受LLM延迟限制）。compact_prompt 为True时只请求语义内容，几何由版式引擎计算。
+    data_files 为任务附带的CSV/Parquet文件：只把列名和类型告诉模型，模型用 data_ref 引用数据，
+    文件路径记录在方案的 'data_files' 中，渲染时才读取和聚合数据（见 data_service）。
+    若断点记录中已有方案则直接返回；失败时在断点状态中记录并返回None。
+    source 为另一宽高比的方案来源（见 plan_source_for）时不调用AI，由该方案几何变换得到，
+    并沿用其已解析的图片资源：图片在渲染时按图框裁剪，同一张图适用于两种画布。
+    """
+    record = batch_state.get_task(task_key) if batch_state else {}
+    if plan := record.get('plan'):
+        logging.info(f"已从断点状态恢复主题 '{theme}' 的方案，跳过AI调用。")
+        return plan
+
+    if source:
+        logging.info(f"主题 '{theme}' 的 {aspect_ratio} 方案由已有的 {source['aspect_ratio']} 方案变换得到，跳过AI调用。")
+        plan = rescale_plan(source['plan'], source['aspect_ratio'], aspect_ratio)
+        if batch_state:
+            batch_state.update_task(task_key, status=STATUS_PLANNED, theme=theme, plan=plan,
+                                    images={**source['images'], **record.get('images', {})})
+        return plan
+
+    logging.info(f"正在请求AI为主题 '{theme}' 生成 ({aspect_ratio}) 方案...")
+    datasets, dataset_prompt = describe_datasets(data_files) if data_files else ({}, "")
+    plan = generate_presentation_plan(theme, num_pages, aspect_ratio, deadline=deadline, compact=compact_prompt,
+                                      datasets=dataset_prompt)
+    if not plan:
+        logging.error(f"未能为主题 '{theme}' 生成演示文稿方案，任务中止。")
+        if batch_state:
+            batch_state.update_task(task_key, status=STATUS_FAILED, theme=theme, error="方案生成失败")
+        return None
+    if datasets:
+        plan['data_files'] = datasets
+    if batch_state:
+        batch_state.update_task(task_key, status=STATUS_PLANNED, theme=theme, plan=plan)
+    return plan
+
+
+def render_presentation(theme: str, plan: dict, aspect_ratio: str, record: dict, asset_dir: str | None = None,
+                        deadline: Deadline | None = None, offline: bool = False, make_preview: bool = False,
+                        incremental: bool = False) -> str:
+    """
+    渲染阶段：只根据方案构建演示文稿（受CPU限制），不调用AI，也不写断点状态，因此可以在独立的渲染进程中执行。
+    record 中的 'output_path' 决定输出文件（缺省时自动命名），'images' 资源记录会被就地更新。
+    未提供 asset_dir 时，图片保存在本任务专用的临时目录中，任务结束（含预览）后删除。
+    :return: 输出文件路径；失败时抛出异常。
+    """
+    full_output_path = record.get('output_path') or build_output_path(theme, plan, aspect_ratio)
+    logging.info(f"开始构建演示文稿: {os.path.basename(full_output_path)}")
+
+    # 批量模式下图片资源保存在状态文件旁的目录中，并登记到任务记录里供续跑复用
+    with scratch.create(theme) if asset_dir is None else contextlib.nullcontext(asset_dir) as job_asset_dir:
+        image_service = ImageService(asset_dir=job_asset_dir, asset_cache=record.setdefault('images', {}),
+                                     deadline=deadline, offline=offline)
+
+        builder = PresentationBuilder(plan, aspect_ratio, image_service=image_service, deadline=deadline)
+        builder.build_presentation(full_output_path, incremental=incremental)
+        logging.info(f"演示文稿生成完成，已保存至 {full_output_path}")
+        if make_preview:
+            preview.render_deck_preview(plan, aspect_ratio, preview.preview_dir_for(full_output_path),
+                                        preview.image_paths_from_assets(image_service.asset_cache), theme)
+    return full_output_path
+
+
+def _render_worker(job: dict) -> dict:
+    """渲染进程池的任务入口。返回输出路径和更新后的图片资源记录，由主进程写入断点状态。"""
+    record = {'output_path': job.get('output_path'), 'images': dict(job.get('images', {}))}
+    output_path = render_presentation(job['theme'], job['plan'], job['aspect_ratio'], record, job.get('asset_dir'),
+                                      Deadline.until(job.get('deadline_expires_at')), job.get('offline', False),
+                                      job.get('make_preview', False), job.get('incremental', False))
+    return {'output_path': output_path, 'images': record['images']}
+
+
+def _render_worker_process(job: dict) -> dict:
+    """在渲染子进程中执行任务，并附带本任务产生的指标，由主进程汇总。"""
+    # 子进程（fork）继承了主进程的指标数据，先清空以免重复计数
+    metrics.registry.reset()
+    result = _render_worker(job)
+    result['metrics'] = metrics.registry.snapshot()
+    return result
+
+
+def generate_single_ppt(theme: str, num_pages: int, aspect_ratio: str,
+                        batch_state: BatchState | None = None, task_key: str | None = None,
+                        deadline_seconds: float | None = None, offline: bool = False,
+                        make_preview: bool = False, incremental: bool = False, plan_only: bool = False,
+                        plan_source: dict | None = None, compact_prompt: bool = False,
+                        data_files: list[str] | None = None):
     """
     [已更新] 为单个主题生成演示文稿，并根据内容自动命名文件。
+    依次执行方案阶段 (plan_presentation) 和渲染阶段 (render_presentation)。
+    提供 batch_state 时，每完成一个阶段（方案、渲染）都会写入断点状态；
+    若记录中已有方案，则直接从方案开始渲染，不再调用AI。
+    提供 deadline_seconds 时，方案生成、图片获取和渲染共享这一时间预算，预算不足时降级以按时交付。
+    offline 为True时图片只使用本地占位图，不访问网络。
+    make_preview 为True时在输出文件旁生成逐页PNG预览和联系表。
+    incremental 为True且输出文件已存在时，只重新渲染方案中改动过的页面。
+    plan_only 为True时只生成方案并保存为 .plan.json 文件，不渲染。
+    plan_source 为另一宽高比的共用方案来源，提供时不调用AI（见 plan_presentation）。
+    compact_prompt 为True时使用紧凑提示词，模型只输出内容，版面由本地版式引擎计算。
+    data_files 为附带的CSV/Parquet数据文件，图表和表格可以引用其中的数据。
     """
     logging.info(f"任务开始 - 主题: '{theme}', 页数: {num_pages}, 宽高比: {aspect_ratio}")
+    deadline = Deadline(deadline_seconds or None)  # 配置中的 0 表示不限时
+    if not deadline.unlimited:
+        logging.info(f"任务时间预算: {deadline_seconds}s")
 
-    logging.info(f"正在请求AI为主题 '{theme}' 生成 ({aspect_ratio}) 方案...")
-    plan = generate_presentation_plan(theme, num_pages, aspect_ratio)
+    plan = plan_presentation(theme, num_pages, aspect_ratio, batch_state, task_key, deadline, plan_source,
+                             compact_prompt, data_files)
+    if not plan:
+        metrics.DECKS.inc(status="failed")
+        return False
+    if plan_only:
+        save_plan_file(plan_file_path(build_output_path(theme, plan, aspect_ratio)), theme, aspect_ratio, plan)
+        return True
 
-    if plan:
-        logging.info("AI方案生成成功，开始构建演示文稿。")
-        try:
-            # --- [核心修改] 自动生成文件名 ---
-            # 1. 从方案中获取设计风格
-            style = plan.get('design_concept', '未知风格')
-            # 2. 获取当前日期
-            date_str = datetime.now().strftime("%Y%m%d")
-
-            # 3. 清理文件名中的非法字符
-            sanitized_theme = theme.replace(' ', '_').replace('/', '_').replace('\\', '_').replace(':', '：').replace(
-                '《', '').replace('》', '')
-            sanitized_style = style.replace(' ', '_').replace('/', '_').replace('\\', '_').replace(':', '：')
-
-            # 4. 清理并格式化宽高比
-            ratio_str = aspect_ratio.replace(':', 'x')
-
-            # 5. 组合成最终文件名
-            output_filename = f"{sanitized_theme}_{sanitized_style}_{date_str}_{ratio_str}.pptx"
-            full_output_path = os.path.join(OUTPUT_DIR, output_filename)
-            logging.info(f"自动生成文件名: {output_filename}")
-            # --- 修改结束 ---
-
-            builder = PresentationBuilder(plan, aspect_ratio)
-            builder.build_presentation(full_output_path)
-            logging.info(f"演示文稿生成完成，已保存至 {full_output_path}")
-            return True
-        except Exception as e:
-            logging.error(f"为主题 '{theme}' 构建演示文稿失败: {e}", exc_info=True)
-            return False
-    else:
-        logging.error(f"未能为主题 '{theme}' 生成演示文稿方案，任务中止。")
+    logging.info("AI方案生成成功，开始构建演示文稿。")
+    record = batch_state.get_task(task_key) if batch_state else {}
+    try:
+        output_path = render_presentation(theme, plan, aspect_ratio, record,
+                                          batch_state.asset_dir if batch_state else None,
+                                          deadline, offline, make_preview, incremental)
+        if batch_state:
+            batch_state.update_task(task_key, status=STATUS_DONE, output_path=output_path)
+        metrics.DECKS.inc(status="done")
+        return True
+    except Exception as e:
+        logging.error(f"为主题 '{theme}' 构建演示文稿失败: {e}", exc_info=True)
+        if batch_state:
+            batch_state.update_task(task_key, status=STATUS_FAILED, error=str(e))
+        metrics.DECKS.inc(status="failed")
         return False
 
 
+def run_pipeline(tasks: list[dict], batch_state: BatchState, planners: int, render_pool_options: dict,
+                 offline: bool = False, make_preview: bool = False, incremental: bool = False, plan_only: bool = False,
+                 compact_prompt: bool = False):
+    """
+    流水线批量模式：方案阶段和渲染阶段使用各自独立的工作池。
+    规划线程池（大小 planners）并发等待LLM；每个方案一完成就提交给渲染进程池（大小按CPU核数设置），
+    渲染不必等待其他任务的方案，两个阶段都能保持满载。断点状态只由主进程写入。
+    :param tasks: 任务列表，每项包含 key、theme、pages、aspect_ratio、deadline、data_files，
+                  以及可选的 plan_source/source_ratio（见 link_aspect_ratio_variants）。
+    :param render_pool_options: 传给 RecyclingProcessPool 的参数（进程数、回收阈值、内存报告）。
+    """
+    def plan_task(task):
+        deadline = Deadline(task['deadline'] or None)
+        plan = plan_presentation(task['theme'], task['pages'], task['aspect_ratio'], batch_state, task['key'],
+                                 deadline, plan_source_for(task, batch_state), compact_prompt, task['data_files'])
+        return plan, deadline
+
+    # 共用方案的任务等来源任务结束（渲染完成或失败）后再开始，以便沿用其方案和已下载的图片
+    run_keys = {task['key'] for task in tasks}
+    waiting = {}
+    for task in tasks:
+        if task.get('plan_source') in run_keys:
+            waiting.setdefault(task['plan_source'], []).append(task)
+
+    with ThreadPoolExecutor(max_workers=planners) as plan_pool, \
+            RecyclingProcessPool(**render_pool_options) as render_pool:
+        pending = {plan_pool.submit(plan_task, task): ('plan', task)
+                   for task in tasks if task.get('plan_source') not in run_keys}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, task = pending.pop(future)
+                theme, key = task['theme'], task['key']
+                rendering = False
+                try:
+                    if stage == 'plan':
+                        plan, deadline = future.result()
+                        if not plan:
+                            metrics.DECKS.inc(status="failed")
+                            continue
+                        if plan_only:
+                            save_plan_file(plan_file_path(build_output_path(theme, plan, task['aspect_ratio'])),
+                                           theme, task['aspect_ratio'], plan)
+                            continue
+                        record = batch_state.get_task(key)
+                        job = {
+                            'theme': theme, 'plan': plan, 'aspect_ratio': task['aspect_ratio'],
+                            'output_path': record.get('output_path'), 'images': record.get('images', {}),
+                            'asset_dir': batch_state.asset_dir, 'deadline_expires_at': deadline.wall_expiry(),
+                            'offline': offline, 'make_preview': make_preview, 'incremental': incremental,
+                        }
+                        pending[render_pool.submit(_render_worker_process, job)] = ('render', task)
+                        rendering = True
+                        logging.info(f"主题 '{theme}' 的方案已就绪，已提交渲染。")
+                    else:
+                        result = future.result()
+                        metrics.registry.merge(result['metrics'])
+                        batch_state.update_task(key, status=STATUS_DONE, output_path=result['output_path'],
+                                                images=result['images'])
+                        metrics.DECKS.inc(status="done")
+                except Exception as e:
+                    logging.error(f"主题 '{theme}' 在{'方案' if stage == 'plan' else '渲染'}阶段失败: {e}",
+                                  exc_info=True)
+                    batch_state.update_task(key, status=STATUS_FAILED, theme=theme, error=str(e))
+                    metrics.DECKS.inc(status="failed")
+                finally:
+                    if not rendering:
+                        # 来源任务没有方案时，等待中的任务各自调用AI
+                        for follower in waiting.pop(key, []):
+                            pending[plan_pool.submit(plan_task, follower)] = ('plan', follower)
+
+
+def render_plan_files(plan_files: list[str], default_aspect_ratio: str, render_pool_options: dict,
+                      offline: bool = False, make_preview: bool = False, incremental: bool = False):
+    """
+    --from-plan：不调用AI，直接渲染已保存的方案文件。输出文件与方案文件同名（扩展名为 .pptx），
+    编辑方案后配合 --incremental 重新渲染即可只更新改动过的页面。多个文件时在渲染进程池中并行处理。
+    """
+    jobs = []
+    for path in plan_files:
+        try:
+            theme, aspect_ratio, plan = load_plan_file(path, default_aspect_ratio)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"读取方案文件 '{path}' 失败: {e}")
+            continue
+        output_path = f"{path.removesuffix(PLAN_FILE_SUFFIX).removesuffix('.json')}.pptx"
+        jobs.append({'theme': theme, 'plan': plan, 'aspect_ratio': aspect_ratio, 'output_path': output_path,
+                     'offline': offline, 'make_preview': make_preview, 'incremental': incremental})
+
+    if len(jobs) <= 1 or render_pool_options['max_workers'] <= 1:
+        for job in jobs:
+            try:
+                with TaskMemoryTracker(job['theme'], trace=True) if render_pool_options.get('memory_report') \
+                        else contextlib.nullcontext():
+                    _render_worker(job)
+                metrics.DECKS.inc(status="done")
+            except Exception as e:
+                logging.error(f"渲染方案 '{job['theme']}' 失败: {e}", exc_info=True)
+                metrics.DECKS.inc(status="failed")
+        return
+
+    with RecyclingProcessPool(**render_pool_options) as render_pool:
+        futures = {render_pool.submit(_render_worker_process, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                metrics.registry.merge(result['metrics'])
+                metrics.DECKS.inc(status="done")
+                logging.info(f"已渲染: {result['output_path']}")
+            except Exception as e:
+                logging.error(f"渲染方案 '{futures[future]['theme']}' 失败: {e}", exc_info=True)
+                metrics.DECKS.inc(status="failed")
+
+
 def main():
     """主函数，支持通过命令行参数进行单次生成，或通过配置文件进行批量生成。"""
-    atexit.register(cleanup_temp_dir)
-    ensure_dirs_exist()
-    cleanup_temp_dir()
     ensure_dirs_exist()
+    # 只清理已退出进程遗留的临时目录，同一台机器上其他正在运行的生成进程不受影响
+    scratch.sweep_stale_dirs()
 
     parser = argparse.ArgumentParser(description="AI PPT Generator")
     parser.add_argument("--theme", type=str, help="演示文稿的主题 (单次模式)。")
     parser.add_argument("--pages", type=int, default=10, help="演示文稿的页数。")
     parser.add_argument("--batch", type=str, help="用于批量处理的JSON文件路径。")
+    parser.add_argument("--state", type=str,
+                        help="批量处理的断点状态文件路径 (默认为批量文件同名的 .state.json)。")
+    parser.add_argument("--resume", action="store_true",
+                        help="从断点状态继续批量处理：跳过已完成的任务，并从已保存的方案继续未完成的任务。")
     parser.add_argument(
         "--aspect_ratio",
         type=str,
@@ -94,7 +385,48 @@ def main():
         choices=["16:9", "4:3"],
         help="演示文稿的宽高比 (可选 '16:9' 或 '4:3')。"
     )
+    parser.add_argument("--deadline", type=float,
+                        help="单个任务的时间预算 (秒)。预算不足时跳过重试并使用本地占位图片，以保证按时交付。")
+    parser.add_argument("--offline", action="store_true",
+                        help="离线模式：不请求图片服务，所有图片均使用本地生成的占位图。")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量重建：输出文件已存在时复用其中未改动的页面，只重新渲染方案中改动过的页面。")
+    parser.add_argument("--preview", action="store_true",
+                        help="为生成的演示文稿绘制PNG预览和联系表（无需LibreOffice）。批量模式下在全部任务结束后并行生成。")
+    parser.add_argument("--plan-only", action="store_true",
+                        help="只调用AI生成方案并保存为 .plan.json 文件，不渲染演示文稿。")
+    parser.add_argument("--from-plan", type=str,
+                        help="不调用AI，直接渲染已保存的方案文件，或目录中的全部方案文件。")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="批量流水线模式：方案生成与渲染使用独立的工作池并行执行。")
+    parser.add_argument("--planners", type=int, default=DEFAULT_PLANNERS,
+                        help=f"流水线模式下并发请求AI的规划线程数 (默认 {DEFAULT_PLANNERS})。")
+    parser.add_argument("--compact-prompt", action="store_true", default=PLAN_COMPACT_PROMPT,
+                        help="紧凑提示词：模型只输出每页的语义内容（标题、要点、图片关键词、图表数据），"
+                             "元素几何由本地版式引擎计算，方案生成更快、token更少。")
+    parser.add_argument("--data", type=str, nargs="+",
+                        help="附带的CSV/Parquet数据文件：图表和表格从中读取并聚合数据，原始数据不发送给AI "
+                             "(批量模式下也可在任务中用 data_files 指定)。")
+    parser.add_argument("--plan-per-ratio", action="store_true",
+                        help="批量模式下每个宽高比各自调用AI生成方案 (默认同一主题的不同宽高比共用一次AI调用，由几何变换得到)。")
+    parser.add_argument("--renderers", type=int, default=DEFAULT_RENDERERS,
+                        help=f"流水线模式和 --from-plan 的渲染进程数 (默认为CPU核数 {DEFAULT_RENDERERS})。")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="在该端口提供 Prometheus 格式的 /metrics 端点。")
+    parser.add_argument("--metrics-file", type=str, default=METRICS_TEXTFILE,
+                        help="任务结束后写出 Prometheus 文本格式指标的文件路径 (批量模式默认为批量文件同名的 .prom)。")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="为每个任务报告RSS峰值和 tracemalloc 分配热点（会减慢执行，用于排查内存增长）。")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=WORKER_MAX_TASKS,
+                        help=f"渲染工作进程完成该数量的任务后回收重建，0 表示不限 (默认 {WORKER_MAX_TASKS})。")
+    parser.add_argument("--max-worker-rss", type=float, default=WORKER_MAX_RSS_MB,
+                        help=f"渲染工作进程RSS超过该值 (MB) 时回收重建，0 表示不限 (默认 {WORKER_MAX_RSS_MB:g})。")
     args = parser.parse_args()
+    render_pool_options = {'max_workers': args.renderers, 'max_tasks_per_worker': args.max_tasks_per_worker,
+                           'max_rss_mb': args.max_worker_rss, 'memory_report': args.memory_report}
+
+    if args.metrics_port:
+        metrics.registry.start_http_server(args.metrics_port)
 
     if args.batch:
         logging.info("--- 开始批量生成PPT任务 ---")
@@ -102,9 +434,13 @@ def main():
             with open(args.batch, 'r', encoding='utf-8') as f:
                 batch_tasks = json.load(f)
 
+            state_path = args.state or f"{os.path.splitext(args.batch)[0]}.state.json"
+            batch_state = BatchState(state_path, resume=args.resume)
+            logging.info(f"断点状态文件: {state_path}")
+
             total_tasks = len(batch_tasks)
+            all_tasks = []
             for i, task in enumerate(batch_tasks):
-                logging.info(f"\n--- 正在生成第 {i + 1}/{total_tasks} 个演示文稿 ---")
                 theme = task.get("theme")
                 if not theme:
                     logging.warning(f"跳过任务 {i + 1}，原因：缺少'theme'。")
@@ -112,9 +448,54 @@ def main():
 
                 pages = task.get("pages", args.pages)
                 aspect_ratio = task.get("aspect_ratio", args.aspect_ratio)
+                task_key = BatchState.task_key(i, theme, pages, aspect_ratio)
+                # 数据文件的相对路径相对于批量文件所在目录
+                data_files = [os.path.join(os.path.dirname(os.path.abspath(args.batch)), path)
+                              for path in task.get("data_files", [])] or args.data
+                all_tasks.append({'key': task_key, 'theme': theme, 'pages': pages, 'aspect_ratio': aspect_ratio,
+                                  'deadline': task.get("deadline", args.deadline), 'data_files': data_files,
+                                  'index': i})
+
+            # 在跳过已完成任务之前建立关联，来源任务已在之前的运行中完成时也能沿用它的方案
+            if not args.plan_per_ratio:
+                link_aspect_ratio_variants(all_tasks)
+            tasks = []
+            for task in all_tasks:
+                if args.resume and batch_state.is_done(task['key']):
+                    logging.info(f"任务 {task['index'] + 1} 已在之前的运行中完成，跳过。")
+                    continue
+                tasks.append(task)
+
+            if args.pipeline:
+                logging.info(f"流水线模式: {args.planners} 个规划线程, {args.renderers} 个渲染进程。")
+                run_pipeline(tasks, batch_state, args.planners, render_pool_options, args.offline,
+                             make_preview=args.preview, incremental=args.incremental, plan_only=args.plan_only,
+                             compact_prompt=args.compact_prompt)
+            else:
+                for task in tasks:
+                    logging.info(f"\n--- 正在生成第 {task['index'] + 1}/{total_tasks} 个演示文稿 ---")
+                    with TaskMemoryTracker(task['theme'], trace=True) if args.memory_report \
+                            else contextlib.nullcontext():
+                        generate_single_ppt(task['theme'], task['pages'], task['aspect_ratio'], batch_state,
+                                            task['key'], task['deadline'], args.offline,
+                                            incremental=args.incremental, plan_only=args.plan_only,
+                                            plan_source=plan_source_for(task, batch_state),
+                                            compact_prompt=args.compact_prompt, data_files=task['data_files'])
 
-                # [已简化] 直接调用生成函数，无需再处理文件名
-                generate_single_ppt(theme, pages, aspect_ratio)
+                preview_jobs = []
+                for task in tasks:
+                    if args.preview and batch_state.is_done(task['key']):
+                        record = batch_state.get_task(task['key'])
+                        preview_jobs.append({
+                            'plan': record['plan'], 'aspect_ratio': task['aspect_ratio'], 'title': task['theme'],
+                            'output_dir': preview.preview_dir_for(record['output_path']),
+                            'image_paths': preview.image_paths_from_assets(record.get('images', {})),
+                        })
+                if preview_jobs:
+                    logging.info(f"--- 正在并行生成 {len(preview_jobs)} 套演示文稿的预览 ---")
+                    preview.preview_batch(preview_jobs)
+
+            metrics.registry.write_textfile(args.metrics_file or f"{os.path.splitext(args.batch)[0]}.prom")
 
         except FileNotFoundError:
             logging.error(f"批量处理文件未找到: {args.batch}")
@@ -123,12 +504,28 @@ def main():
         except Exception as e:
             logging.error(f"批量处理过程中发生错误: {e}", exc_info=True)
 
+    elif args.from_plan:
+        logging.info("--- 开始从方案文件渲染PPT ---")
+        plan_files = collect_plan_files(args.from_plan)
+        if not plan_files:
+            logging.error(f"未找到方案文件: {args.from_plan}")
+        render_plan_files(plan_files, args.aspect_ratio, render_pool_options, args.offline,
+                          make_preview=args.preview, incremental=args.incremental)
+        if args.metrics_file:
+            metrics.registry.write_textfile(args.metrics_file)
+
     elif args.theme:
         logging.info("--- 开始单次生成PPT任务 ---")
         # [已简化] 直接调用生成函数
-        generate_single_ppt(args.theme, args.pages, args.aspect_ratio)
+        with TaskMemoryTracker(args.theme, trace=True) if args.memory_report else contextlib.nullcontext():
+            generate_single_ppt(args.theme, args.pages, args.aspect_ratio,
+                                deadline_seconds=args.deadline, offline=args.offline, make_preview=args.preview,
+                                incremental=args.incremental, plan_only=args.plan_only,
+                                compact_prompt=args.compact_prompt, data_files=args.data)
+        if args.metrics_file:
+            metrics.registry.write_textfile(args.metrics_file)
     else:
-        logging.warning("未指定操作。请使用 --theme 进行单次生成，或使用 --batch 进行批量处理。")
+        logging.warning("未指定操作。请使用 --theme 进行单次生成，--batch 进行批量处理，或 --from-plan 渲染已有方案。")
         parser.print_help()
 
 
@@ -0,0 +1,130 @@
+import logging
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import metrics
+
+# 分配热点报告中列出的条目数
+MEMORY_REPORT_TOP = 10
+
+
+def _read_status_kb(field: str) -> int | None:
+    """从 /proc/self/status 读取内存字段 (kB)，非 Linux 平台返回None。"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss_bytes() -> int | None:
+    """当前进程的常驻内存 (RSS)。"""
+    if (kb := _read_status_kb('VmRSS')) is not None:
+        return kb * 1024
+    return None
+
+
+def peak_rss_bytes() -> int | None:
+    """进程的RSS峰值。Linux 上可以被 reset_peak_rss() 重置，因而能得到单个任务的峰值。"""
+    if (kb := _read_status_kb('VmHWM')) is not None:
+        return kb * 1024
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 的单位是字节，Linux 是 kB
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """重置RSS峰值（Linux 4.0+ 写 /proc/self/clear_refs）。不支持时返回False，此时峰值为进程生命期内的峰值。"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _mb(value: int | None) -> str:
+    return "未知" if value is None else f"{value / 1024 / 1024:.1f}MB"
+
+
+class TaskMemoryTracker:
+    """
+    单个任务的内存统计（上下文管理器）。
+    退出时记录任务期间的RSS峰值和RSS增量；trace 为True时同时用 tracemalloc 统计Python对象分配的峰值
+    和按代码行汇总的分配热点（会明显拖慢执行，只用于排查）。统计结果保存在 report 中并写入日志。
+    """
+
+    def __init__(self, label: str, trace: bool = False, top: int = MEMORY_REPORT_TOP, log: bool = True):
+        """
+        :param label: 日志中标识任务的名称。
+        :param trace: 是否启用 tracemalloc 分配统计。
+        :param top: 报告的分配热点条数。
+        :param log: 是否在退出时直接写日志；工作进程中为False，由主进程统一记录。
+        """
+        self.label = label
+        self.log = log
+        self.trace = trace
+        self.top = top
+        self.report = {}
+        self._started_tracing = False
+
+    def __enter__(self):
+        self._peak_is_per_task = reset_peak_rss()
+        self._rss_before = current_rss_bytes()
+        self._start_time = time.monotonic()
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.trace:
+            tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        rss_after = current_rss_bytes()
+        self.report = {
+            'label': self.label,
+            'seconds': round(time.monotonic() - self._start_time, 3),
+            'peak_rss': peak_rss_bytes(),
+            'peak_is_per_task': self._peak_is_per_task,
+            'rss_delta': rss_after - self._rss_before if rss_after is not None and self._rss_before else None,
+        }
+        if self.trace and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            _, traced_peak = tracemalloc.get_traced_memory()
+            self.report['traced_peak'] = traced_peak
+            self.report['top_allocations'] = [
+                (str(stat.traceback[0]), stat.size, stat.count) for stat in snapshot.statistics('lineno')[:self.top]
+            ]
+            if self._started_tracing:
+                tracemalloc.stop()
+        if self.log:
+            log_report(self.report)
+        return False
+
+
+def log_report(report: dict):
+    """把 TaskMemoryTracker 的统计结果写入日志，并记录到指标中。"""
+    if report.get('peak_rss') is not None:
+        metrics.TASK_PEAK_RSS_BYTES.observe(report['peak_rss'])
+    scope = "任务" if report.get('peak_is_per_task') else "进程"
+    logging.info(f"[内存] '{report['label']}' 耗时 {report['seconds']}s，{scope}RSS峰值 {_mb(report.get('peak_rss'))}，"
+                 f"RSS增量 {_mb(report.get('rss_delta'))}")
+    if 'traced_peak' in report:
+        lines = [f"  {size / 1024:.0f}KB / {count} 块  {where}" for where, size, count in report['top_allocations']]
+        logging.info(f"[内存] '{report['label']}' Python分配峰值 {_mb(report['traced_peak'])}，仍存活的分配热点:\n"
+                     + "\n".join(lines))
+
@@ -0,0 +1,284 @@
+import bisect
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """指标的公共部分：名称、说明、标签名，以及按标签值保存的数据。"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器。"""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Gauge(_Metric):
+    """可任意设置的瞬时值。"""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def merge(self, values: dict):
+        with self._lock:
+            self._values.update(values)
+
+
+class Histogram(_Metric):
+    """直方图：按上界累计的桶计数、观测值总和与观测次数。"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    @staticmethod
+    def _copy(value):
+        counts, total, count = value
+        return list(counts), total, count
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文：退出时记录耗时（秒），即使代码块抛出异常也会记录。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                if key in self._values:
+                    own_counts, own_total, own_count = self._values[key]
+                    counts = [a + b for a, b in zip(own_counts, counts)]
+                    total, count = own_total + total, own_count + count
+                self._values[key] = (list(counts), total, count)
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表，以 Prometheus 文本格式导出。
+    渲染进程池中的子进程各有一份注册表：子进程在任务开始时 reset()，结束时把 snapshot() 返回给主进程，
+    由主进程 merge() 汇总，这样导出的始终是整个批量任务的总量。
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = ()) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def snapshot(self) -> dict:
+        """所有指标当前数据的可序列化副本，可跨进程传递。"""
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def merge(self, snapshot: dict):
+        """把另一个进程的 snapshot() 累加到本注册表。"""
+        for name, values in snapshot.items():
+            if metric := self._metrics.get(name):
+                metric.merge(values)
+
+    def render(self) -> str:
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """原子写入文本文件，供 node_exporter 的 textfile collector 采集。"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.metrics_', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+            logging.info(f"指标已写入 {path}")
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def start_http_server(self, port: int, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """在后台线程中启动 /metrics HTTP 端点。"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logging.info(f"指标HTTP端点已启动: http://{addr}:{server.server_port}/metrics")
+        return server
+
+
+registry = MetricsRegistry()
+
+# --- LLM ---
+LLM_REQUEST_SECONDS = registry.histogram(
+    "ppt_llm_request_seconds", "LLM方案请求耗时（秒），按端点和结果 (success/parse_error/error) 区分。",
+    ("endpoint", "outcome"), buckets=(1, 2, 5, 10, 20, 30, 60, 90, 120, 180, 300))
+LLM_TOKENS = registry.histogram(
+    "ppt_llm_tokens", "单次LLM请求的token数，按端点和类型 (prompt/cached_prompt/completion) 区分。",
+    ("endpoint", "kind"), buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+PLAN_PARSE_FAILURES = registry.counter(
+    "ppt_plan_parse_failures_total", "模型响应无法解析为方案JSON的次数。", ("endpoint",))
+
+# --- 图片 ---
+IMAGE_REQUESTS = registry.counter(
+    "ppt_image_requests_total", "图片请求次数，按来源区分: asset (复用已解析资源) / pexels / fallback (本地占位图)。",
+    ("source",))
+PEXELS_SEARCHES = registry.counter(
+    "ppt_pexels_searches_total", "Pexels候选照片查询次数: hit (命中缓存的搜索结果) / miss (发起网络搜索)。",
+    ("result",))
+BREAKER_TRANSITIONS = registry.counter(
+    "ppt_breaker_transitions_total", "外部服务熔断器的状态切换次数，按服务和新状态 (open/half_open/closed) 区分。",
+    ("provider", "state"))
+BREAKER_REJECTIONS = registry.counter(
+    "ppt_breaker_rejections_total", "因服务处于熔断状态而未发出、直接降级的请求数，按服务区分。", ("provider",))
+IMAGE_DOWNLOADED_BYTES = registry.counter(
+    "ppt_image_downloaded_bytes_total", "从Pexels下载的照片字节数（不含缓存命中），按尺寸版本区分。", ("variant",))
+
+# --- 数据 ---
+DATA_ROWS_SCANNED = registry.counter(
+    "ppt_data_rows_scanned_total", "为图表和表格的数据引用扫描的数据文件行数，按格式 (csv/parquet) 区分。", ("format",))
+DATA_RESOLVE_SECONDS = registry.histogram(
+    "ppt_data_resolve_seconds", "解析单个数据引用（读取、聚合、降采样）的耗时（秒），按元素类型区分。", ("type",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+# --- 渲染 ---
+ELEMENT_RENDER_SECONDS = registry.histogram(
+    "ppt_element_render_seconds", "单个页面元素的渲染耗时（秒），含图片获取。", ("type",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+SAVE_SECONDS = registry.histogram(
+    "ppt_save_seconds", "打包写出演示文稿的耗时（秒）。", buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+PACKAGE_MEDIA_DEDUPED = registry.counter(
+    "ppt_package_media_deduped_total", "保存时因内容相同而合并掉的媒体部件数量。")
+LAYOUT_ISSUES = registry.counter(
+    "ppt_layout_issues_total", "渲染前布局检查发现的问题数，按类型 (out_of_bounds/overlap/obscured) 和是否已修正区分。",
+    ("kind", "fixed"))
+TEXT_CONTRAST_FIXES = registry.counter(
+    "ppt_text_contrast_fixes_total", "渲染时修正的低对比度文本框数量，按方式 (recolor/scrim) 区分。", ("action",))
+TASK_PEAK_RSS_BYTES = registry.histogram(
+    "ppt_task_peak_rss_bytes", "单个任务期间的进程RSS峰值（字节）。",
+    buckets=tuple(mb * 1024 * 1024 for mb in (128, 256, 512, 768, 1024, 1536, 2048, 4096)))
+WORKER_RECYCLES = registry.counter(
+    "ppt_worker_recycles_total", "渲染工作进程被回收重建的次数，按原因 (tasks/rss/crash) 区分。", ("reason",))
+DECKS = registry.counter(
+    "ppt_decks_total", "完成的演示文稿任务数，按状态 (done/failed) 区分；rate() 即每分钟产出。", ("status",))
@@ -0,0 +1,134 @@
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+
+from pptx.chart.chart import Chart
+from pptx.chart.data import ChartData
+from pptx.opc.constants import CONTENT_TYPE as CT
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.packuri import PackURI
+from pptx.parts.chart import ChartPart
+from pptx.parts.embeddedpackage import EmbeddedXlsxPart
+
+# 已样式化图表XML模板的缓存容量
+TEMPLATE_CACHE_SIZE = 64
+
+
+class _PartnameAllocator:
+    """
+    为单个演示文稿包分配图表与内嵌工作簿的部件名。
+    python-pptx 的 next_partname 每次都要遍历包内的全部部件，图表越多越慢；
+    这里只在第一次使用时扫描一次，之后递增计数。
+    """
+
+    def __init__(self, package):
+        self._package = package
+        self._next_index = {}
+
+    def next_partname(self, template: str) -> PackURI:
+        if template not in self._next_index:
+            prefix = template[:(template % 42).find("42")]
+            taken = {str(p.partname) for p in self._package.iter_parts() if p.partname.startswith(prefix)}
+            index = 1
+            while template % index in taken:
+                index += 1
+            self._next_index[template] = index
+        index = self._next_index[template]
+        self._next_index[template] = index + 1
+        return PackURI(template % index)
+
+
+_allocators = weakref.WeakKeyDictionary()
+_templates = OrderedDict()
+_lock = threading.Lock()
+
+
+def _get_allocator(package) -> _PartnameAllocator:
+    with _lock:
+        if package not in _allocators:
+            _allocators[package] = _PartnameAllocator(package)
+        return _allocators[package]
+
+
+def allocate_partname(package, template: str) -> PackURI:
+    """按包分配下一个可用的部件名，template 形如 '/ppt/charts/chart%d.xml'。"""
+    return _get_allocator(package).next_partname(template)
+
+
+def data_signature(categories, series) -> tuple:
+    """把图表数据转换为可哈希的签名，用作工作簿与模板缓存的键。"""
+    return (
+        tuple(categories),
+        tuple((s.get('name', ''), tuple(s.get('values', []))) for s in series)
+    )
+
+
+def build_chart_data(signature: tuple) -> ChartData:
+    categories, series = signature
+    chart_data = ChartData()
+    chart_data.categories = list(categories)
+    for name, values in series:
+        chart_data.add_series(name, list(values))
+    return chart_data
+
+
+@lru_cache(maxsize=128)
+def _xlsx_blob(signature: tuple) -> bytes:
+    """内嵌工作簿的生成（xlsxwriter）开销较大，相同数据的图表共用同一份生成结果。"""
+    return build_chart_data(signature).xlsx_blob
+
+
+def _get_template(key) -> bytes | None:
+    with _lock:
+        if key in _templates:
+            _templates.move_to_end(key)
+            return _templates[key]
+        return None
+
+
+def _put_template(key, blob: bytes):
+    with _lock:
+        _templates[key] = blob
+        while len(_templates) > TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+
+
+def add_chart_fast(slide, chart_type, x, y, cx, cy, signature: tuple, style_key, style_chart) -> Chart:
+    """
+    向幻灯片添加图表的快速路径。
+    - 部件名由按包缓存的分配器给出，不再每次遍历整个包；
+    - 相同数据的内嵌工作簿只生成一次；
+    - 图表XML在第一次出现时按 python-pptx 的方式生成并由 style_chart(chart) 样式化，
+      之后以 (图表类型, 数据, style_key) 为键缓存，完全相同的图表直接克隆已样式化的XML，跳过全部样式写入。
+
+    :param signature: data_signature() 返回的数据签名。
+    :param style_key: 影响样式结果的全部参数组成的可哈希值。
+    :param style_chart: 对新建的 Chart 对象应用样式的回调。
+    """
+    package = slide.part.package
+    allocator = _get_allocator(package)
+    template_key = (chart_type, signature, style_key)
+
+    partname = allocator.next_partname(ChartPart.partname_template)
+    if (template := _get_template(template_key)) is not None:
+        chart_part = ChartPart.load(partname, CT.DML_CHART, package, template)
+        chart = chart_part.chart
+        logging.info("复用已缓存的图表模板。")
+    else:
+        xml_bytes = build_chart_data(signature).xml_bytes(chart_type)
+        chart_part = ChartPart.load(partname, CT.DML_CHART, package, xml_bytes)
+        chart = chart_part.chart
+        style_chart(chart)
+        # 模板中不包含 c:externalData，工作簿关系在每次克隆后单独建立
+        _put_template(template_key, chart_part.blob)
+
+    xlsx_part = EmbeddedXlsxPart(allocator.next_partname(EmbeddedXlsxPart.partname_template),
+                                 EmbeddedXlsxPart.content_type, package, _xlsx_blob(signature))
+    chart_part.chart_workbook.xlsx_part = xlsx_part
+
+    rId = slide.part.relate_to(chart_part, RT.CHART)
+    slide.shapes._add_chart_graphicFrame(rId, x, y, cx, cy)
+    slide.shapes._recalculate_extents()
+    return chart
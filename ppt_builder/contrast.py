@@ -0,0 +1,189 @@
+import logging
+
+import metrics
+from ppt_builder.styles import PresentationStyle
+
+# WCAG 2.x 的最低对比度：普通文本 4.5:1，大号文本（≥24pt，或≥18.66pt且加粗）3:1
+MIN_CONTRAST = 4.5
+MIN_CONTRAST_LARGE = 3.0
+LARGE_TEXT_PT = 24
+LARGE_BOLD_TEXT_PT = 18.66
+# 在每个文本框内取样背景颜色的网格 (列, 行)
+SAMPLE_GRID = (6, 3)
+# 改换文字颜色仍不达标时添加半透明遮罩，按以下不透明度从低到高尝试
+SCRIM_OPACITY_STEPS = (0.35, 0.45, 0.55, 0.65, 0.75, 0.85)
+LIGHT_TEXT = '#FFFFFF'
+DARK_TEXT = '#212121'
+# 椭圆形状按内切椭圆判断覆盖范围，其余形状按外接矩形
+_ELLIPSE_SHAPES = ('oval',)
+
+
+def parse_hex(hex_color: str) -> tuple[int, int, int] | None:
+    hex_color = str(hex_color).lstrip('#')
+    try:
+        return int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
+    except (ValueError, IndexError):
+        return None
+
+
+def relative_luminance(rgb) -> float:
+    """WCAG 定义的相对亮度 (0-1)。"""
+    def linear(channel):
+        c = channel / 255
+        return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+    r, g, b = rgb[:3]
+    return 0.2126 * linear(r) + 0.7152 * linear(g) + 0.0722 * linear(b)
+
+
+def contrast_ratio(luminance_a: float, luminance_b: float) -> float:
+    lighter, darker = max(luminance_a, luminance_b), min(luminance_a, luminance_b)
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+def _blend(top, alpha: float, bottom) -> tuple[float, float, float]:
+    return tuple(t * alpha + b * (1 - alpha) for t, b in zip(top[:3], bottom[:3]))
+
+
+def _box(element: dict, defaults: tuple) -> tuple[float, float, float, float]:
+    return tuple(float(element.get(key, default)) for key, default in zip(('x', 'y', 'width', 'height'), defaults))
+
+
+class Backdrop:
+    """
+    一张幻灯片上文本之下的背景：画布背景（纯色或全局背景图片）加上按渲染顺序叠放的图片和形状。
+    图片使用 ImageService 缓存的区域平均颜色，不需要重新读取图片文件。
+    渲染器每添加一个图片或形状就登记一层，渲染文本框之前用 check_text_box 检查并修正对比度。
+    """
+
+    def __init__(self, canvas_width: float, canvas_height: float, background_color: str,
+                 background_stats: dict | None = None):
+        self.canvas = (0.0, 0.0, canvas_width, canvas_height)
+        self.background = parse_hex(background_color) or (255, 255, 255)
+        self.background_stats = background_stats
+        self._layers = []  # (sampler, 外接矩形)
+
+    def add_image(self, element: dict, stats: dict | None):
+        """登记一个图片元素，与 elements.add_image 的居中裁剪和圆形裁剪保持一致。"""
+        if not stats:
+            return
+        box = _box(element, (0, 0, 1280, 720))
+        circle = element.get('style', {}).get('crop') == 'circle'
+        if circle:
+            diameter = min(box[2], box[3])
+            box = (box[0], box[1], diameter, diameter)
+        self._layers.append((lambda x, y: self._sample_image(stats, box, x, y, crop=True, circle=circle), box))
+
+    def add_shape(self, element: dict):
+        """登记一个形状元素；没有填充的形状不影响背景。"""
+        style = element.get('style', {})
+        if 'gradient' in style:
+            colors = [c for c in map(parse_hex, style['gradient'].get('colors', [])) if c]
+            color = tuple(sum(channel) / len(colors) for channel in zip(*colors)) if colors else None
+        else:
+            color = parse_hex(style['fill_color']) if style.get('fill_color') else None
+        if color is None:
+            return
+        opacity = style.get('opacity')
+        alpha = float(opacity) if isinstance(opacity, (int, float)) and 0 <= opacity <= 1 else 1.0
+        box = _box(element, (50, 50, 200, 200))
+        ellipse = str(element.get('shape_type', 'rectangle')).lower() in _ELLIPSE_SHAPES
+
+        def sampler(x, y):
+            if ellipse and not _in_ellipse(box, x, y):
+                return None
+            return color, alpha
+        self._layers.append((sampler, box))
+
+    @staticmethod
+    def _sample_image(stats: dict, box: tuple, x: float, y: float, crop: bool, circle: bool = False):
+        if circle and not _in_ellipse(box, x, y):
+            return None
+        bx, by, bw, bh = box
+        u, v = (x - bx) / bw, (y - by) / bh
+        if crop:
+            # 图片按图框宽高比居中裁剪后拉伸填满图框
+            image_aspect = stats['size'][0] / max(1, stats['size'][1])
+            box_aspect = bw / bh
+            if image_aspect > box_aspect:
+                visible = box_aspect / image_aspect
+                u = (1 - visible) / 2 + u * visible
+            else:
+                visible = image_aspect / box_aspect
+                v = (1 - visible) / 2 + v * visible
+        columns, rows = stats['grid']
+        column = min(columns - 1, max(0, int(u * columns)))
+        row = min(rows - 1, max(0, int(v * rows)))
+        r, g, b, a = stats['cells'][row * columns + column]
+        return (r, g, b), a / 255
+
+    def color_at(self, x: float, y: float) -> tuple[float, float, float]:
+        """画布上一点自下而上合成后的背景颜色。"""
+        color = self.background
+        if self.background_stats:
+            # 全局背景图片不裁剪，直接拉伸到整个画布
+            image_color, alpha = self._sample_image(self.background_stats, self.canvas, x, y, crop=False)
+            color = _blend(image_color, alpha, color)
+        for sampler, (bx, by, bw, bh) in self._layers:
+            if bx <= x < bx + bw and by <= y < by + bh and (sample := sampler(x, y)):
+                color = _blend(sample[0], sample[1], color)
+        return color
+
+    def sample(self, box: tuple) -> list[tuple]:
+        bx, by, bw, bh = box
+        columns, rows = SAMPLE_GRID
+        return [self.color_at(bx + bw * (i + 0.5) / columns, by + bh * (j + 0.5) / rows)
+                for j in range(rows) for i in range(columns)]
+
+    def check_text_box(self, element: dict, style_manager: PresentationStyle) -> tuple[str | None, dict | None]:
+        """
+        检查文本颜色与其下方背景的对比度（取文本框内各取样点中最差的一个）。
+        不达标时依次尝试调色板的文字色、背景色和黑白两色；都不达标时（背景明暗混杂，如照片）
+        在文本框下加一层半透明遮罩。遮罩会登记为新的一层，后续文本框也会考虑它。
+        :return: (新的文字颜色或None, 需要先渲染的遮罩形状元素或None)
+        """
+        font_style = element.get('style', {}).get('font', {})
+        text_hex = font_style.get('color') or f"#{style_manager.text_color}"
+        text_rgb = parse_hex(text_hex)
+        if text_rgb is None:
+            return None, None
+        size = font_style.get('size', 18)
+        is_large = size >= LARGE_TEXT_PT or (font_style.get('bold') and size >= LARGE_BOLD_TEXT_PT)
+        threshold = MIN_CONTRAST_LARGE if is_large else MIN_CONTRAST
+
+        box = _box(element, (50, 50, 1180, 100))
+        samples = self.sample(box)
+        luminances = [relative_luminance(color) for color in samples]
+
+        def worst_contrast(rgb, backgrounds=luminances):
+            text_luminance = relative_luminance(rgb)
+            return min(contrast_ratio(text_luminance, lum) for lum in backgrounds)
+
+        if worst_contrast(text_rgb) >= threshold:
+            return None, None
+
+        for candidate in (f"#{style_manager.text_color}", f"#{style_manager.background}", DARK_TEXT, LIGHT_TEXT):
+            if (rgb := parse_hex(candidate)) and worst_contrast(rgb) >= threshold:
+                logging.info(f"文本 '{str(element.get('content', ''))[:20]}' 与背景对比度不足，文字颜色改为 {candidate}。")
+                metrics.TEXT_CONTRAST_FIXES.inc(action="recolor")
+                return candidate, None
+
+        # 背景以深色为主时用黑色遮罩配白字，否则用白色遮罩配深色字；0.18 是与黑、白两色对比度相等的亮度
+        dark_background = sum(luminances) / len(luminances) < 0.18
+        scrim_hex, new_text = ('#000000', LIGHT_TEXT) if dark_background else ('#FFFFFF', DARK_TEXT)
+        scrim_rgb = parse_hex(scrim_hex)
+        for opacity in SCRIM_OPACITY_STEPS:
+            covered = [relative_luminance(_blend(scrim_rgb, opacity, color)) for color in samples]
+            if worst_contrast(parse_hex(new_text), covered) >= threshold:
+                break
+        scrim = {'type': 'shape', 'shape_type': 'rectangle', 'x': box[0], 'y': box[1], 'width': box[2],
+                 'height': box[3], 'style': {'fill_color': scrim_hex, 'opacity': opacity}}
+        self.add_shape(scrim)
+        metrics.TEXT_CONTRAST_FIXES.inc(action="scrim")
+        logging.info(f"文本 '{str(element.get('content', ''))[:20]}' 下方背景明暗混杂，已添加不透明度 {opacity} 的遮罩。")
+        return new_text, scrim
+
+
+def _in_ellipse(box: tuple, x: float, y: float) -> bool:
+    bx, by, bw, bh = box
+    dx, dy = (x - bx) / bw - 0.5, (y - by) / bh - 0.5
+    return dx * dx + dy * dy <= 0.25
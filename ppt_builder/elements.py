@@ -1,16 +1,19 @@
 import logging
 import re
 import io
+from functools import lru_cache
+from xml.sax.saxutils import escape as xml_escape
 
 from PIL import Image, ImageOps, ImageDraw
 from pptx.util import Pt
 from pptx.enum.shapes import MSO_SHAPE
-from pptx.chart.data import ChartData
 from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION, XL_MARKER_STYLE
 from pptx.dml.color import RGBColor
 from pptx.enum.text import PP_ALIGN
 # [新增] 导入底层XML操作所需的工具
-from pptx.oxml.ns import qn
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn, nsdecls
+from ppt_builder import chart_builder, table_builder
 from ppt_builder.styles import px_to_emu, hex_to_rgb, PresentationStyle
 
 # 形状类型映射
@@ -162,8 +165,39 @@ def add_shape(slide, element_data: dict, style_manager: PresentationStyle):
         logging.error(f"添加形状时发生意外错误: {e}", exc_info=True)
 
 
-# --- 其他函数 (add_text_box, add_image, add_chart, add_table) 保持不变 ---
-# ... (将您文件中其他未改动的函数复制到这里)
+# Markdown风格加粗 (**文本**) 的拆分模式，全局只编译一次
+MARKDOWN_BOLD_PATTERN = re.compile(r'\*\*(.*?)\*\*')
+# 与 python-pptx 一致：除制表符和换行符外的控制字符转义为 _xHHHH_ 形式
+_CTRL_CHAR_PATTERN = re.compile(r"([\x00-\x08\x0B-\x1F])")
+
+
+@lru_cache(maxsize=256)
+def _run_template(font_name: str, size_centipoints: int, italic: bool, bold: bool, color_hex: str) -> tuple[str, str]:
+    """
+    为一种文本样式生成文本块 (a:r) 的XML模板，返回 (前缀, 后缀)，中间插入转义后的文本。
+    同一演示文稿中相同样式的文本块共用一个模板，不再逐个设置字体属性。
+    """
+    typeface = xml_escape(font_name, {'"': '&quot;'})
+    prefix = (f'<a:r><a:rPr sz="{size_centipoints}" i="{int(italic)}" b="{int(bold)}">'
+              f'<a:solidFill><a:srgbClr val="{color_hex}"/></a:solidFill>'
+              f'<a:latin typeface="{typeface}"/></a:rPr><a:t>')
+    return prefix, '</a:t></a:r>'
+
+
+def _runs_xml(text: str, template_for_bold) -> str:
+    """把一段文本按Markdown加粗标记拆分为文本块XML。template_for_bold(bool) 返回对应的模板。"""
+    if '**' in text:
+        parts = [(part, i % 2 == 1) for i, part in enumerate(MARKDOWN_BOLD_PATTERN.split(text)) if part]
+    else:
+        parts = [(text, False)]
+    xml = []
+    for part, is_bold in parts:
+        prefix, suffix = template_for_bold(is_bold)
+        escaped = xml_escape(_CTRL_CHAR_PATTERN.sub(lambda m: "_x%04X_" % ord(m.group(1)), part))
+        xml.append(f'{prefix}{escaped}{suffix}')
+    return ''.join(xml)
+
+
 def add_text_box(slide, element_data: dict, style_manager: PresentationStyle):
     """
     [已更新] 添加文本框，实现灵活的字体控制和项目符号列表。
@@ -171,6 +205,7 @@ def add_text_box(slide, element_data: dict, style_manager: PresentationStyle):
     - 如果未指定，则根据 `font.type` ('heading'/'body') 回退到全局默认字体。
     - 兼容处理Markdown风格的加粗。
     - **[新功能]** 如果`content`是列表，则自动生成项目符号列表。
+    段落和文本块由按样式缓存的XML模板拼接而成，整个文本框只解析一次XML。
     """
     try:
         x, y, width, height = map(px_to_emu, [
@@ -181,7 +216,6 @@ def add_text_box(slide, element_data: dict, style_manager: PresentationStyle):
         txBox = slide.shapes.add_textbox(x, y, width, height)
         tf = txBox.text_frame
         tf.word_wrap = True
-        tf.clear()
 
         content = element_data.get('content', '')
         style = element_data.get('style', {})
@@ -198,56 +232,36 @@ def add_text_box(slide, element_data: dict, style_manager: PresentationStyle):
         is_italic_from_json = font_style.get('italic', False)
         is_bold_from_json = font_style.get('bold', False)
 
-        def apply_run_style(run, text_part, is_markdown_bold=False):
-            """辅助函数，用于应用样式到文本块"""
-            run.text = text_part
-            font = run.font
-            font.name = font_name
-            font.size = Pt(font_size_pt)
-            font.italic = is_italic_from_json
-            font.color.rgb = default_font_color
-            font.bold = is_bold_from_json or is_markdown_bold
+        size_centipoints = Pt(font_size_pt).centipoints
+        color_hex = str(default_font_color)
+
+        def template_for_bold(is_markdown_bold):
+            return _run_template(font_name, size_centipoints, bool(is_italic_from_json),
+                                 bool(is_bold_from_json or is_markdown_bold), color_hex)
+
+        # 为每个段落设置对齐方式
+        if alignment_str := style.get('alignment'):
+            alignment = ALIGNMENT_MAP.get(alignment_str.upper(), PP_ALIGN.LEFT)
+        else:
+            alignment = PP_ALIGN.LEFT
+        paragraph_prefix = f'<a:p><a:pPr algn="{PP_ALIGN.to_xml(alignment)}"/>'
 
         # ================== 新增逻辑：项目符号列表 ==================
         if isinstance(content, list):
             logging.info(f"检测到项目符号列表，共 {len(content)} 项。")
-            for i, item_text in enumerate(content):
-                if i == 0:
-                    p = tf.paragraphs[0]
-                else:
-                    p = tf.add_paragraph()
-
-                p.level = 0  # 可根据需要设置缩进级别
-
-                if '**' in item_text:
-                    parts = re.split(r'\*\*(.*?)\*\*', item_text)
-                    for j, part in enumerate(parts):
-                        if not part: continue
-                        apply_run_style(p.add_run(), part, is_markdown_bold=(j % 2 == 1))
-                else:
-                    apply_run_style(p.add_run(), item_text)
-
-                # 为每个段落设置对齐方式
-                if alignment_str := style.get('alignment'):
-                    p.alignment = ALIGNMENT_MAP.get(alignment_str.upper(), PP_ALIGN.LEFT)
-                else:
-                    p.alignment = PP_ALIGN.LEFT
+            items = content
         # ================== 原有逻辑：处理单个字符串 ==================
         else:
-            p = tf.paragraphs[0]
-            if '**' in content:
-                parts = re.split(r'\*\*(.*?)\*\*', content)
-                for i, part in enumerate(parts):
-                    if not part: continue
-                    apply_run_style(p.add_run(), part, is_markdown_bold=(i % 2 == 1))
-            else:
-                apply_run_style(p.add_run(), content)
+            items = [content]
 
-            # 设置段落对齐
-            if alignment_str := style.get('alignment'):
-                p.alignment = ALIGNMENT_MAP.get(alignment_str.upper(), PP_ALIGN.LEFT)
-            else:
-                p.alignment = PP_ALIGN.LEFT
+        paragraphs_xml = ''.join(f'{paragraph_prefix}{_runs_xml(item_text, template_for_bold)}</a:p>'
+                                 for item_text in items)
+        # 新建文本框自带一个空段落；内容为空列表时保留它
+        if paragraphs_xml:
+            txBody = tf._txBody
+            for p in txBody.p_lst:
+                txBody.remove(p)
+            txBody.extend(parse_xml(f'<a:txBody {nsdecls("a")}>{paragraphs_xml}</a:txBody>').p_lst)
 
         log_content = str(content)
         logging.info(f"添加文本框 (字体: {font_name}): '{log_content[:30]}...'")
@@ -309,13 +323,10 @@ def add_image(slide, image_path: str, element_data: dict):
         logging.error(f"添加或裁剪图片 {image_path} 时出错: {e}", exc_info=True)
 
 
-# 在 elements.py 文件中，请用下面的函数替换旧的 add_chart 函数
-
-# 在 elements.py 文件中，请用下面的函数替换旧的 add_chart 函数
-
 def add_chart(slide, element_data: dict, style_manager: PresentationStyle):
     """
     [终极美化版] 添加图表并进行深度样式化，以实现商业级报告外观。
+    通过 chart_builder 的快速路径创建：内嵌工作簿按数据缓存，完全相同的图表直接克隆已样式化的XML。
     """
     try:
         x, y, width, height = map(px_to_emu, [element_data.get('x', 100), element_data.get('y', 150),
@@ -323,88 +334,97 @@ def add_chart(slide, element_data: dict, style_manager: PresentationStyle):
         chart_type_map = {'BAR': XL_CHART_TYPE.COLUMN_CLUSTERED, 'PIE': XL_CHART_TYPE.PIE, 'LINE': XL_CHART_TYPE.LINE}
         chart_type = chart_type_map.get(element_data.get('chart_type', 'bar').upper())
 
-        chart_data = ChartData()
         chart_data_info = element_data.get('data', {})
-        chart_data.categories = chart_data_info.get('categories', [])
-        for series_data in chart_data_info.get('series', []):
-            chart_data.add_series(series_data.get('name', ''), series_data.get('values', []))
-
-        chart = slide.shapes.add_chart(chart_type, x, y, width, height, chart_data).chart
-
-        # --- 1. 标题和图例 ---
-        if title_text := element_data.get('title'):
-            chart.has_title = True
-            p = chart.chart_title.text_frame.paragraphs[0]
-            p.font.size, p.font.bold = Pt(20), True
-            p.font.color.rgb = style_manager.text_color
-            p.font.name = style_manager.heading_font
-
-        # [最终修复] 强制为图表创建图例
-        chart.has_legend = True
-        chart.legend.position, chart.legend.include_in_layout = XL_LEGEND_POSITION.BOTTOM, False
-        chart.legend.font.size = Pt(12)
-        chart.legend.font.color.rgb = style_manager.text_color
-
-        # --- 2. 绘图区和数据标签 ---
-        plot = chart.plots[0]
-        # 仅对非饼图设置 vary_by_categories = False
-        if chart_type != XL_CHART_TYPE.PIE:
-            plot.vary_by_categories = False
-
-        plot.has_data_labels = True
-        data_labels = plot.data_labels
-        data_labels.font.size, data_labels.font.bold = Pt(14), True
-        data_labels.font.color.rgb = RGBColor(255, 255,
-                                              255) if chart_type == XL_CHART_TYPE.PIE else style_manager.text_color
-        if chart_type == XL_CHART_TYPE.PIE:
-            data_labels.show_percentage = True
-            data_labels.number_format = '0%'
-
-        # --- 3. [核心] 系列的深度样式化 ---
-        if chart_type in [XL_CHART_TYPE.COLUMN_CLUSTERED, XL_CHART_TYPE.LINE]:
-            for i, series in enumerate(getattr(plot, 'series', [])):
-                series_color = style_manager.get_chart_color(i)
-                series.format.fill.solid()
-                series.format.fill.fore_color.rgb = series_color
-
-                line = series.format.line
-                if chart_type == XL_CHART_TYPE.COLUMN_CLUSTERED:
-                    line.color.rgb = RGBColor(255, 255, 255)
-                    line.width = Pt(0.75)
-                elif chart_type == XL_CHART_TYPE.LINE:
-                    line.color.rgb = series_color
-                    line.width = Pt(2.5)
-                    series.smooth = True
-                    marker = series.marker
-                    marker.style, marker.size = XL_MARKER_STYLE.CIRCLE, 8
-                    marker.format.fill.solid()
-                    marker.format.fill.fore_color.rgb = series_color
-                    marker.format.line.color.rgb = RGBColor(255, 255, 255)
-                    marker.format.line.width = Pt(1.0)
-
-        elif chart_type == XL_CHART_TYPE.PIE and hasattr(plot, 'series') and plot.series:
-            for j, point in enumerate(plot.series[0].points):
-                point_color = style_manager.get_chart_color(j)
-                point.format.fill.solid()
-                point.format.fill.fore_color.rgb = point_color
-                point.format.line.color.rgb = RGBColor(255, 255, 255)
-                point.format.line.width = Pt(1.5)
-
-        # --- 4. 坐标轴样式 ---
-        if chart_type != XL_CHART_TYPE.PIE:
-            for axis in [chart.category_axis, chart.value_axis]:
-                axis.tick_labels.font.size = Pt(12)
-                axis.tick_labels.font.color.rgb = style_manager.text_color
-            if chart.value_axis.has_major_gridlines:
-                chart.value_axis.major_gridlines.format.line.color.rgb = hex_to_rgb("#E0E0E0")
-
+        signature = chart_builder.data_signature(chart_data_info.get('categories', []),
+                                                 chart_data_info.get('series', []))
+        has_title = bool(element_data.get('title'))
+        style_key = (has_title, style_manager.get_chart_style_signature())
+
+        chart_builder.add_chart_fast(
+            slide, chart_type, x, y, width, height, signature, style_key,
+            lambda chart: _style_chart(chart, chart_type, has_title, style_manager)
+        )
         logging.info("成功添加并深度美化了图表。")
     except Exception as e:
         logging.error(f"添加图表时出错: {e}", exc_info=True)
 
 
+def _style_chart(chart, chart_type, has_title: bool, style_manager: PresentationStyle):
+    """对新建的图表应用标题、图例、数据标签、系列配色和坐标轴样式。"""
+    # --- 1. 标题和图例 ---
+    if has_title:
+        chart.has_title = True
+        p = chart.chart_title.text_frame.paragraphs[0]
+        p.font.size, p.font.bold = Pt(20), True
+        p.font.color.rgb = style_manager.text_color
+        p.font.name = style_manager.heading_font
+
+    # [最终修复] 强制为图表创建图例
+    chart.has_legend = True
+    chart.legend.position, chart.legend.include_in_layout = XL_LEGEND_POSITION.BOTTOM, False
+    chart.legend.font.size = Pt(12)
+    chart.legend.font.color.rgb = style_manager.text_color
+
+    # --- 2. 绘图区和数据标签 ---
+    plot = chart.plots[0]
+    # 仅对非饼图设置 vary_by_categories = False
+    if chart_type != XL_CHART_TYPE.PIE:
+        plot.vary_by_categories = False
+
+    plot.has_data_labels = True
+    data_labels = plot.data_labels
+    data_labels.font.size, data_labels.font.bold = Pt(14), True
+    data_labels.font.color.rgb = RGBColor(255, 255,
+                                          255) if chart_type == XL_CHART_TYPE.PIE else style_manager.text_color
+    if chart_type == XL_CHART_TYPE.PIE:
+        data_labels.show_percentage = True
+        data_labels.number_format = '0%'
+
+    # --- 3. [核心] 系列的深度样式化 ---
+    if chart_type in [XL_CHART_TYPE.COLUMN_CLUSTERED, XL_CHART_TYPE.LINE]:
+        for i, series in enumerate(getattr(plot, 'series', [])):
+            series_color = style_manager.get_chart_color(i)
+            series.format.fill.solid()
+            series.format.fill.fore_color.rgb = series_color
+
+            line = series.format.line
+            if chart_type == XL_CHART_TYPE.COLUMN_CLUSTERED:
+                line.color.rgb = RGBColor(255, 255, 255)
+                line.width = Pt(0.75)
+            elif chart_type == XL_CHART_TYPE.LINE:
+                line.color.rgb = series_color
+                line.width = Pt(2.5)
+                series.smooth = True
+                marker = series.marker
+                marker.style, marker.size = XL_MARKER_STYLE.CIRCLE, 8
+                marker.format.fill.solid()
+                marker.format.fill.fore_color.rgb = series_color
+                marker.format.line.color.rgb = RGBColor(255, 255, 255)
+                marker.format.line.width = Pt(1.0)
+
+    elif chart_type == XL_CHART_TYPE.PIE and hasattr(plot, 'series') and plot.series:
+        for j, point in enumerate(plot.series[0].points):
+            point_color = style_manager.get_chart_color(j)
+            point.format.fill.solid()
+            point.format.fill.fore_color.rgb = point_color
+            point.format.line.color.rgb = RGBColor(255, 255, 255)
+            point.format.line.width = Pt(1.5)
+
+    # --- 4. 坐标轴样式 ---
+    if chart_type != XL_CHART_TYPE.PIE:
+        for axis in [chart.category_axis, chart.value_axis]:
+            axis.tick_labels.font.size = Pt(12)
+            axis.tick_labels.font.color.rgb = style_manager.text_color
+        if chart.value_axis.has_major_gridlines:
+            chart.value_axis.major_gridlines.format.line.color.rgb = hex_to_rgb("#E0E0E0")
+
+
 def add_table(slide, element_data: dict, style_manager: PresentationStyle):
-    """添加表格并应用样式。"""
+    """
+    添加表格并应用样式。
+    整个 a:tbl 由 table_builder 一次性生成，每种单元格样式只构建一次模板，避免逐个单元格操作属性。
+    行数超出图框容量时的截断或分页由 SlideRenderer 通过 table_builder.split_table 处理。
+    """
     try:
         x, y, width, height = map(px_to_emu, [
             element_data.get('x', 100), element_data.get('y', 150),
@@ -417,40 +437,19 @@ def add_table(slide, element_data: dict, style_manager: PresentationStyle):
             logging.warning("表格数据缺少表头或行数据，已跳过。")
             return
 
-        num_rows, num_cols = len(rows_data) + 1, len(headers)
-        shape = slide.shapes.add_table(num_rows, num_cols, x, y, width, height)
-        table = shape.table
-
-        for c in range(num_cols):
-            table.columns[c].width = int(width / num_cols)
-        for r in range(num_rows):
-            table.rows[r].height = int(height / num_rows)
-
         style = element_data.get('style', {})
         header_color = hex_to_rgb(style.get('header_color')) if 'header_color' in style else style_manager.primary
         row_colors = [hex_to_rgb(c) for c in style.get('row_colors', [])]
 
-        for i, header in enumerate(headers):
-            cell = table.cell(0, i)
-            cell.text = header
-            cell.fill.solid()
-            cell.fill.fore_color.rgb = header_color
-            p = cell.text_frame.paragraphs[0]
-            p.font.color.rgb = RGBColor(255, 255, 255)
-            p.font.bold = True
-            p.font.name = style_manager.heading_font
-
-        for r, row_data in enumerate(rows_data):
-            for c, cell_data in enumerate(row_data):
-                cell = table.cell(r + 1, c)
-                cell.text = str(cell_data)
-                if row_colors:
-                    cell.fill.solid()
-                    cell.fill.fore_color.rgb = row_colors[r % len(row_colors)]
-                p = cell.text_frame.paragraphs[0]
-                p.font.color.rgb = style_manager.text_color
-                p.font.name = style_manager.body_font
+        tbl_xml = table_builder.build_tbl_xml(
+            headers, rows_data, width, height,
+            header_fill=str(header_color),
+            row_fills=[str(c) for c in row_colors],
+            header_font=(str(RGBColor(255, 255, 255)), style_manager.heading_font),
+            body_font=(str(style_manager.text_color), style_manager.body_font)
+        )
+        table_builder.add_table_fast(slide, x, y, width, height, tbl_xml)
 
         logging.info(f"添加了包含 {len(rows_data)} 行的表格。")
     except Exception as e:
-        logging.error(f"添加表格时出错: {e}", exc_info=True)
\ No newline at end of file
+        logging.error(f"添加表格时出错: {e}", exc_info=True)
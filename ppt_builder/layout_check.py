@@ -0,0 +1,295 @@
+import argparse
+import copy
+import json
+import logging
+import math
+import time
+
+import metrics
+from ppt_builder.layout_transform import DEFAULT_BOXES, canvas_size
+from ppt_builder.slide_renderer import ELEMENT_LAYER_ORDER
+
+# 承载文字或数据的元素：这些元素互相重叠、超出画布或被不透明元素遮挡时内容无法阅读
+TEXT_TYPES = ('text_box', 'text', 'chart', 'table')
+# 两个文字元素的重叠面积达到较小者面积的该比例，且重叠区域宽高都不小于 OVERLAP_MIN_PX 时才视为重叠，
+# 忽略标题与副标题之间常见的图框边缘轻微相交
+OVERLAP_MIN_RATIO = 0.1
+OVERLAP_MIN_PX = 4
+# 文字元素被渲染在其上的不透明元素覆盖了自身面积的该比例以上时视为被遮挡
+OBSCURED_MIN_RATIO = 0.1
+# 不透明度达到该值的图片和形状视为不透明
+OPAQUE_MIN_OPACITY = 0.9
+# 超出画布不超过该像素数的文字元素不报告
+BOUNDS_TOLERANCE_PX = 2
+# 图片和形状常有意出血到画布外，只有可见部分不足该比例时才报告
+MIN_VISIBLE_RATIO = 0.5
+# 推开重叠元素时与另一元素保持的间距 (px)
+NUDGE_GAP = 8
+# 空间索引的网格边长 (px)：元素只登记到其覆盖的网格中，只有落在同一网格中的元素才需要两两比较。
+# 每页取元素边长的中位数，限制在该范围内，使每个网格中的元素数保持在常数级别
+GRID_CELL_PX = 160
+MIN_GRID_CELL_PX = 8
+
+
+class GridIndex:
+    """
+    矩形的均匀网格空间索引。每个矩形登记到它覆盖的所有网格中，查询时只检查与查询矩形共享网格的矩形，
+    页面元素分布稀疏时插入和查询都接近常数时间，整页的重叠检测接近线性。
+    """
+
+    def __init__(self, cell: float = GRID_CELL_PX):
+        self.cell = cell
+        self._cells = {}
+        self._boxes = {}
+
+    def _cells_for(self, box: tuple):
+        x, y, w, h = box
+        for column in range(math.floor(x / self.cell), math.floor((x + max(w, 0)) / self.cell) + 1):
+            for row in range(math.floor(y / self.cell), math.floor((y + max(h, 0)) / self.cell) + 1):
+                yield column, row
+
+    def insert(self, key, box: tuple):
+        self._boxes[key] = box
+        for cell in self._cells_for(box):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        box = self._boxes.pop(key)
+        for cell in self._cells_for(box):
+            self._cells[cell].discard(key)
+
+    def query(self, box: tuple) -> set:
+        """与 box 相交（面积大于0）的所有矩形的键。"""
+        candidates = set()
+        for cell in self._cells_for(box):
+            candidates.update(self._cells.get(cell, ()))
+        return {key for key in candidates if intersection_area(box, self._boxes[key]) > 0}
+
+    def pairs(self) -> set[tuple]:
+        """所有相交的矩形对 (键a, 键b)，键a < 键b。"""
+        result = set()
+        for keys in self._cells.values():
+            if len(keys) < 2:
+                continue
+            ordered = sorted(keys)
+            for i, a in enumerate(ordered):
+                for b in ordered[i + 1:]:
+                    if (a, b) not in result and intersection_area(self._boxes[a], self._boxes[b]) > 0:
+                        result.add((a, b))
+        return result
+
+
+def intersection(a: tuple, b: tuple) -> tuple[float, float]:
+    """两个矩形 (x, y, 宽, 高) 相交区域的 (宽, 高)，不相交时为0。"""
+    width = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    height = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    return max(0.0, width), max(0.0, height)
+
+
+def intersection_area(a: tuple, b: tuple) -> float:
+    width, height = intersection(a, b)
+    return width * height
+
+
+def element_box(element: dict) -> tuple | None:
+    """元素的图框 (x, y, 宽, 高)，缺省的几何属性取渲染器的默认值；几何属性无效时返回None。"""
+    defaults = DEFAULT_BOXES.get(element.get('type'), DEFAULT_BOXES['shape'])
+    try:
+        x, y, width, height = (float(element.get(key, default))
+                               for key, default in zip(('x', 'y', 'width', 'height'), defaults))
+    except (TypeError, ValueError):
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    return x, y, width, height
+
+
+def _cell_size(boxes: list) -> float:
+    sides = sorted(max(box[2], box[3]) for box in boxes if box is not None)
+    return max(MIN_GRID_CELL_PX, min(GRID_CELL_PX, sides[len(sides) // 2])) if sides else GRID_CELL_PX
+
+
+def _is_opaque(element: dict) -> bool:
+    """会完全遮住下方内容的元素：不透明的图片、有填充的不透明形状，以及单元格有底色的表格。"""
+    element_type = element.get('type')
+    style = element.get('style', {}) if isinstance(element.get('style'), dict) else {}
+    opacity = style.get('opacity', 1.0)
+    opaque = not isinstance(opacity, (int, float)) or opacity >= OPAQUE_MIN_OPACITY
+    if element_type == 'image':
+        return opaque
+    if element_type == 'shape':
+        return opaque and bool(style.get('fill_color') or style.get('gradient'))
+    return element_type == 'table'
+
+
+def _describe(element: dict) -> str:
+    label = element.get('content') or element.get('title') or element.get('image_keyword') or ''
+    return f"{element.get('type', '?')} '{str(label)[:20]}'" if label else str(element.get('type', '?'))
+
+
+def _significant_overlap(a: tuple, b: tuple) -> bool:
+    width, height = intersection(a, b)
+    return (width >= OVERLAP_MIN_PX and height >= OVERLAP_MIN_PX
+            and width * height >= OVERLAP_MIN_RATIO * min(a[2] * a[3], b[2] * b[3]))
+
+
+def _clamp(box: tuple, canvas: tuple) -> tuple:
+    """把图框移回画布内，比画布大时先缩小到画布尺寸。"""
+    x, y, width, height = box
+    width, height = min(width, canvas[0]), min(height, canvas[1])
+    return min(max(x, 0.0), canvas[0] - width), min(max(y, 0.0), canvas[1] - height), width, height
+
+
+def _set_box(element: dict, box: tuple):
+    for key, value in zip(('x', 'y', 'width', 'height'), box):
+        element[key] = round(value, 1)
+
+
+def _nudge(key: int, other: int, boxes: list, index: GridIndex, canvas: tuple) -> tuple | None:
+    """
+    把元素 key 移到与 other 不重叠的最近位置（上下左右四个方向），新位置必须仍在画布内，
+    且不与其他任何文字元素明显重叠。找不到这样的位置时返回None。
+    """
+    x, y, width, height = boxes[key]
+    ox, oy, ow, oh = boxes[other]
+    candidates = [(x, oy + oh + NUDGE_GAP), (x, oy - NUDGE_GAP - height),
+                  (ox + ow + NUDGE_GAP, y), (ox - NUDGE_GAP - width, y)]
+    for new_x, new_y in sorted(candidates, key=lambda p: abs(p[0] - x) + abs(p[1] - y)):
+        box = (new_x, new_y, width, height)
+        if new_x < 0 or new_y < 0 or new_x + width > canvas[0] or new_y + height > canvas[1]:
+            continue
+        if not any(_significant_overlap(box, boxes[k]) for k in index.query(box) if k != key):
+            return box
+    return None
+
+
+def check_page(page: dict, canvas: tuple, page_number: int = 0, fix: bool = False) -> list[dict]:
+    """
+    检查一页的元素布局，返回问题列表；每个问题为
+    {'page', 'kind' (out_of_bounds/overlap/obscured), 'elements' (元素下标), 'message', 'fixed'}。
+    - out_of_bounds：文字元素超出画布，或图片、形状大部分在画布外。
+    - overlap：两个文字元素（文本框、图表、表格）明显重叠。
+    - obscured：文字元素被按 ELEMENT_LAYER_ORDER 渲染在其上的不透明图片、形状遮挡。
+    fix 为True时就地修正元素：越界的移回画布内（必要时缩小），重叠的把后渲染的一个推到最近的空位；
+    遮挡没有安全的局部修正，只报告。
+    """
+    elements = [e for e in page.get('elements', []) if isinstance(e, dict)]
+    boxes = [element_box(e) for e in elements]
+    # 渲染器按图层稳定排序后依次绘制，rank 越大越靠上
+    order = sorted(range(len(elements)),
+                   key=lambda i: ELEMENT_LAYER_ORDER.get(elements[i].get('type'), ELEMENT_LAYER_ORDER['default']))
+    rank = {i: position for position, i in enumerate(order)}
+    is_text = [e.get('type') in TEXT_TYPES for e in elements]
+    issues = []
+
+    def report(kind, indices, message, fixed=False):
+        issues.append({'page': page_number, 'kind': kind, 'elements': list(indices), 'message': message,
+                       'fixed': fixed})
+
+    for i, (element, box) in enumerate(zip(elements, boxes)):
+        if box is None:
+            continue
+        clamped = _clamp(box, canvas)
+        if is_text[i]:
+            off_canvas = any(abs(a - b) > BOUNDS_TOLERANCE_PX for a, b in zip(box, clamped))
+        else:
+            off_canvas = intersection_area(box, (0, 0, *canvas)) < MIN_VISIBLE_RATIO * box[2] * box[3]
+        if off_canvas:
+            if fix:
+                boxes[i] = clamped
+                _set_box(element, clamped)
+            report('out_of_bounds', (i,), f"{_describe(element)} 超出 {canvas[0]}x{canvas[1]} 画布", fix)
+
+    cell = _cell_size(boxes)
+    text_index = GridIndex(cell)
+    for i, box in enumerate(boxes):
+        if box is not None and is_text[i]:
+            text_index.insert(i, box)
+    for a, b in sorted(text_index.pairs()):
+        if not _significant_overlap(boxes[a], boxes[b]):
+            continue  # 之前的修正已经把其中一个移开
+        message = f"{_describe(elements[a])} 与 {_describe(elements[b])} 重叠"
+        fixed = False
+        if fix:
+            # 优先移动后渲染（在上层）的元素
+            for key, other in sorted(((a, b), (b, a)), key=lambda pair: -rank[pair[0]]):
+                if new_box := _nudge(key, other, boxes, text_index, canvas):
+                    text_index.remove(key)
+                    boxes[key] = new_box
+                    text_index.insert(key, new_box)
+                    _set_box(elements[key], new_box)
+                    fixed = True
+                    break
+        report('overlap', (a, b), message, fixed)
+
+    opaque_index = GridIndex(cell)
+    for j, box in enumerate(boxes):
+        if box is not None and not is_text[j] and _is_opaque(elements[j]):
+            opaque_index.insert(j, box)
+    for i, box in enumerate(boxes):
+        if box is None or not is_text[i]:
+            continue
+        for j in sorted(opaque_index.query(box)):
+            if rank[j] > rank[i] and intersection_area(box, boxes[j]) >= OBSCURED_MIN_RATIO * box[2] * box[3]:
+                report('obscured', (i, j), f"{_describe(elements[i])} 被上层的 {_describe(elements[j])} 遮挡")
+    return issues
+
+
+def check_plan(plan: dict, aspect_ratio: str = "16:9", fix: bool = False, report: bool = True) -> tuple[dict, list]:
+    """
+    检查方案中所有页面的元素布局（见 check_page），返回 (方案, 问题列表)。
+    fix 为True且发现问题时返回修正后的新方案，原方案不变；否则原样返回方案。
+    report 为True时记录日志和指标。每页使用独立的空间索引，耗时与元素总数近似成线性关系。
+    """
+    start = time.perf_counter()
+    canvas = canvas_size(aspect_ratio)
+    pages = plan.get('pages', [])
+    issues = [issue for number, page in enumerate(pages, 1) for issue in check_page(page, canvas, number)]
+    if issues and fix:
+        plan = copy.deepcopy(plan)
+        issues = [issue for number, page in enumerate(plan.get('pages', []), 1)
+                  for issue in check_page(page, canvas, number, fix=True)]
+
+    if report and issues:
+        for issue in issues:
+            metrics.LAYOUT_ISSUES.inc(kind=issue['kind'], fixed=str(issue['fixed']).lower())
+            logging.warning(f"第 {issue['page']} 页布局问题: {issue['message']}{' (已修正)' if issue['fixed'] else ''}")
+        fixed = sum(issue['fixed'] for issue in issues)
+        logging.info(f"布局检查完成: {len(pages)} 页中发现 {len(issues)} 个问题，修正 {fixed} 个，"
+                     f"耗时 {time.perf_counter() - start:.3f}s。")
+    return plan, issues
+
+
+# ---------------------------------------------------------------------------
+# 检查已保存的方案文件：python -m ppt_builder.layout_check 方案文件 ... [--fix]
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="检查方案文件中的元素重叠、越界和遮挡问题")
+    parser.add_argument("paths", nargs="+", help="方案文件 (.plan.json 或原始方案JSON)")
+    parser.add_argument("--aspect-ratio", type=str, default="16:9", choices=["16:9", "4:3"],
+                        help="方案文件未记录宽高比时使用的画布 (默认 16:9)。")
+    parser.add_argument("--fix", action="store_true", help="就地修正越界和重叠的元素并写回方案文件。")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+
+    total = 0
+    for path in args.paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 与 main.load_plan_file 相同：方案文件外层带有主题和宽高比，原始方案JSON则直接是方案
+        wrapped = 'plan' in data and 'pages' not in data
+        plan, aspect_ratio = (data['plan'], data.get('aspect_ratio') or args.aspect_ratio) if wrapped \
+            else (data, args.aspect_ratio)
+        logging.info(f"检查 {path} ({aspect_ratio})")
+        fixed_plan, issues = check_plan(plan, aspect_ratio, fix=args.fix)
+        total += sum(not issue['fixed'] for issue in issues)
+        if args.fix and fixed_plan is not plan:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(dict(data, plan=fixed_plan) if wrapped else fixed_plan, f, ensure_ascii=False, indent=2)
+            logging.info(f"已写回修正后的方案: {path}")
+    raise SystemExit(1 if total else 0)
+
+
+if __name__ == "__main__":
+    main()
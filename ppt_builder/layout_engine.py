@@ -0,0 +1,467 @@
+import logging
+import math
+
+from ppt_builder.layout_transform import CANVAS_SIZES, MIN_FONT_SCALE, canvas_size
+
+# 网格参数按画布尺寸的比例给出，16:9 和 4:3 两种画布共用同一套版式
+MARGIN_X = 0.06
+MARGIN_TOP = 0.08
+MARGIN_BOTTOM = 0.1  # 底部留出母版页脚和页码的位置
+GUTTER = 0.025
+TITLE_HEIGHT = 0.12
+# 各级文字在 1280x720 画布上的字号 (pt)，其他画布按面积缩放
+FONT_SIZES = {
+    'cover_title': 54,
+    'cover_subtitle': 24,
+    'title': 36,
+    'subtitle': 22,
+    'body': 20,
+    'card_heading': 22,
+    'card_text': 16,
+    'quote': 36,
+    'caption': 16,
+}
+# 正文按估算的行数自动缩小字号，不小于该值 (pt)
+MIN_BODY_SIZE = 14
+# 估算文字所占宽度：中日韩字符约一个字号宽，其余字符约半个；行高为字号的倍数
+CJK_CHAR_WIDTH = 1.0
+LATIN_CHAR_WIDTH = 0.55
+LINE_SPACING = 1.3
+PX_PER_PT = 96 / 72
+# 文本框的左右内边距之和 (px)，与 PowerPoint 默认的 0.1 英寸一致
+TEXT_INSET_PX = 20
+# 图片上的文字下方的遮罩不透明度
+IMAGE_SCRIM_OPACITY = 0.45
+# 表格每行（含表头）的高度 (px)；行数较少时表格不拉伸到整个内容区，放不下时由渲染器截断或分页
+TABLE_ROW_HEIGHT = 48
+# 多栏、流程和团队版式最多排列的条目数，超出的条目被丢弃
+MAX_ITEMS = {'three_column_comparison': 4, 'process_flow': 6, 'team_introduction': 5}
+# 方案没有提供调色板时使用的颜色，与 PresentationStyle 的默认值一致
+DEFAULT_PALETTE = {'primary': '#0D47A1', 'secondary': '#42A5F5', 'background': '#F5F5F5', 'text': '#333333',
+                   'accent': '#FFC107'}
+
+
+def _round_box(x: float, y: float, width: float, height: float) -> dict:
+    return {'x': round(x), 'y': round(y), 'width': round(width), 'height': round(height)}
+
+
+def _text_width_em(text: str) -> float:
+    return sum(CJK_CHAR_WIDTH if ord(ch) >= 0x2E80 else LATIN_CHAR_WIDTH for ch in text)
+
+
+def fit_font_size(content, width: float, height: float, size: float, min_size: float = MIN_BODY_SIZE) -> float:
+    """估算文字在图框内折行后的总高度，放不下时逐磅缩小字号，直到放下或达到 min_size。"""
+    lines = [line for item in (content if isinstance(content, list) else [content])
+             for line in str(item).split('\n')]
+    usable_width = max(1.0, width - TEXT_INSET_PX)
+    while size > min_size:
+        em_px = size * PX_PER_PT
+        line_count = sum(max(1, math.ceil(_text_width_em(line) * em_px / usable_width)) for line in lines)
+        if line_count * em_px * LINE_SPACING <= height:
+            break
+        size -= 1
+    return size
+
+
+class _Grid:
+    """一个画布上的版面网格：页边距、栏间距、标题区和按画布缩放的字号。"""
+
+    def __init__(self, aspect_ratio: str, palette: dict):
+        self.width, self.height = canvas_size(aspect_ratio)
+        self.left = round(self.width * MARGIN_X)
+        self.right = self.width - self.left
+        self.top = round(self.height * MARGIN_TOP)
+        self.bottom = self.height - round(self.height * MARGIN_BOTTOM)
+        self.gutter = round(self.width * GUTTER)
+        base_width, base_height = CANVAS_SIZES["16:9"]
+        self.font_scale = max(MIN_FONT_SCALE, min(1.0, math.sqrt(self.width * self.height /
+                                                                  (base_width * base_height))))
+        self.palette = palette
+
+    def font_size(self, role: str) -> float:
+        return round(FONT_SIZES[role] * self.font_scale * 2) / 2
+
+    def columns(self, count: int, left: float | None = None, right: float | None = None) -> list[tuple[float, float]]:
+        """把 [left, right] 等分为 count 栏，返回每栏的 (x, 宽)。"""
+        left = self.left if left is None else left
+        right = self.right if right is None else right
+        width = (right - left - self.gutter * (count - 1)) / count
+        return [(left + i * (width + self.gutter), width) for i in range(count)]
+
+    def title(self, page: dict, left: float | None = None, right: float | None = None,
+              top: float | None = None) -> tuple[list[dict], float]:
+        """页面标题（以及可选的副标题），返回 (元素列表, 标题区下方的y坐标)。"""
+        left = self.left if left is None else left
+        right = self.right if right is None else right
+        y = self.top if top is None else top
+        title_height = self.height * TITLE_HEIGHT
+        result = []
+        if title := page.get('title'):
+            size = fit_font_size(title, right - left, title_height, self.font_size('title'),
+                                 min_size=self.font_size('subtitle'))
+            result.append(text_element(title, _round_box(left, y, right - left, title_height), size,
+                                       font_type='heading', bold=True, color=self.palette['primary']))
+            y += title_height
+        if subtitle := page.get('subtitle'):
+            subtitle_height = self.height * 0.07
+            result.append(text_element(subtitle, _round_box(left, y, right - left, subtitle_height),
+                                       self.font_size('subtitle'), font_type='heading',
+                                       color=self.palette['secondary']))
+            y += subtitle_height
+        return result, y + self.gutter
+
+
+def text_element(content, box: dict, size: float, font_type: str = 'body', bold: bool = False,
+                 color: str | None = None, alignment: str = 'LEFT', italic: bool = False) -> dict:
+    font = {'type': font_type, 'size': size}
+    if bold:
+        font['bold'] = True
+    if italic:
+        font['italic'] = True
+    if color:
+        font['color'] = color
+    return {'type': 'text_box', 'content': content, **box, 'style': {'font': font, 'alignment': alignment}}
+
+
+def _shape(shape_type: str, box: dict, fill_color: str, opacity: float | None = None) -> dict:
+    style = {'fill_color': fill_color}
+    if opacity is not None:
+        style['opacity'] = opacity
+    return {'type': 'shape', 'shape_type': shape_type, **box, 'style': style}
+
+
+def _image(keyword: str, box: dict, crop: str | None = None) -> dict:
+    element = {'type': 'image', 'image_keyword': keyword, **box}
+    if crop:
+        element['style'] = {'crop': crop}
+    return element
+
+
+def _body_content(page: dict):
+    """正文内容：只有段落时为字符串，有要点时为列表（段落在前）。"""
+    bullets = [str(b) for b in page.get('bullets') or []]
+    body = page.get('body')
+    if bullets:
+        return ([str(body)] if body else []) + bullets
+    return str(body) if body else None
+
+
+def _body_element(page: dict, grid: _Grid, box: dict) -> list[dict]:
+    content = _body_content(page)
+    if content is None:
+        return []
+    size = fit_font_size(content, box['width'], box['height'], grid.font_size('body'))
+    return [text_element(content, box, size)]
+
+
+# ---------------------------------------------------------------------------
+# 版式库：每个函数根据页面的语义内容和网格计算元素
+# ---------------------------------------------------------------------------
+
+def _layout_title_slide(page: dict, grid: _Grid) -> list[dict]:
+    w, h = grid.width, grid.height
+    elements, text_color = [], grid.palette['primary']
+    if keyword := page.get('image_keyword'):
+        elements.append(_image(keyword, _round_box(0, 0, w, h)))
+        elements.append(_shape('rectangle', _round_box(0, 0, w, h), grid.palette['primary'], 0.55))
+        text_color = '#FFFFFF'
+    title_box = _round_box(grid.left, h * 0.3, grid.right - grid.left, h * 0.22)
+    title_size = fit_font_size(page.get('title', ''), title_box['width'], title_box['height'],
+                               grid.font_size('cover_title'), min_size=grid.font_size('title'))
+    elements.append(text_element(page.get('title', ''), title_box, title_size, font_type='heading', bold=True,
+                                 color=text_color, alignment='CENTER'))
+    line_width = w * 0.1
+    elements.append(_shape('rectangle', _round_box((w - line_width) / 2, h * 0.54, line_width, 4),
+                           grid.palette['accent']))
+    if subtitle := page.get('subtitle') or page.get('body'):
+        elements.append(text_element(subtitle, _round_box(grid.left, h * 0.58, grid.right - grid.left, h * 0.12),
+                                     grid.font_size('cover_subtitle'), color=text_color, alignment='CENTER'))
+    return elements
+
+
+def _layout_section_header(page: dict, grid: _Grid) -> list[dict]:
+    h = grid.height
+    bar_width = 8
+    elements = [_shape('rectangle', _round_box(grid.left, h * 0.36, bar_width, h * 0.28), grid.palette['accent'])]
+    text_left = grid.left + bar_width + grid.gutter
+    title_box = _round_box(text_left, h * 0.36, grid.right - text_left, h * 0.16)
+    elements.append(text_element(page.get('title', ''), title_box, grid.font_size('cover_title'),
+                                 font_type='heading', bold=True, color=grid.palette['primary']))
+    if subtitle := page.get('subtitle') or page.get('body'):
+        elements.append(text_element(subtitle, _round_box(text_left, h * 0.52, grid.right - text_left, h * 0.12),
+                                     grid.font_size('subtitle'), color=grid.palette['secondary']))
+    return elements
+
+
+def _layout_title_and_content(page: dict, grid: _Grid) -> list[dict]:
+    elements, y = grid.title(page)
+    elements += _body_element(page, grid, _round_box(grid.left, y, grid.right - grid.left, grid.bottom - y))
+    return elements
+
+
+def _layout_image_side(page: dict, grid: _Grid, image_on_left: bool) -> list[dict]:
+    """图片满高占画布的一侧，标题和正文在另一侧。"""
+    image_width = grid.width * 0.45
+    image_x = 0 if image_on_left else grid.width - image_width
+    elements = [_image(page['image_keyword'], _round_box(image_x, 0, image_width, grid.height))]
+    if image_on_left:
+        text_left, text_right = image_width + grid.left, grid.right
+    else:
+        text_left, text_right = grid.left, grid.width - image_width - grid.left
+    title_elements, y = grid.title(page, text_left, text_right, top=grid.height * 0.18)
+    elements += title_elements
+    elements += _body_element(page, grid, _round_box(text_left, y, text_right - text_left, grid.bottom - y))
+    return elements
+
+
+def _layout_image_left(page: dict, grid: _Grid) -> list[dict]:
+    return _layout_image_side(page, grid, image_on_left=True)
+
+
+def _layout_image_right(page: dict, grid: _Grid) -> list[dict]:
+    return _layout_image_side(page, grid, image_on_left=False)
+
+
+def _layout_quote(page: dict, grid: _Grid) -> list[dict]:
+    w, h = grid.width, grid.height
+    if keyword := page.get('image_keyword'):
+        elements = [_image(keyword, _round_box(0, 0, w, h)),
+                    _shape('rectangle', _round_box(0, 0, w, h), '#000000', IMAGE_SCRIM_OPACITY)]
+        text_color = '#FFFFFF'
+    else:
+        elements = [_shape('rectangle', _round_box(0, 0, w, h), grid.palette['primary'], 0.08)]
+        text_color = grid.palette['primary']
+    quote_box = _round_box(w * 0.12, h * 0.28, w * 0.76, h * 0.34)
+    quote = page.get('quote') or page.get('title', '')
+    elements.append(text_element(f"“{quote}”", quote_box,
+                                 fit_font_size(quote, quote_box['width'], quote_box['height'],
+                                               grid.font_size('quote'), min_size=grid.font_size('subtitle')),
+                                 font_type='heading', italic=True, color=text_color, alignment='CENTER'))
+    if author := page.get('author'):
+        elements.append(text_element(f"—— {author}", _round_box(w * 0.12, h * 0.64, w * 0.76, h * 0.08),
+                                     grid.font_size('caption'), color=text_color, alignment='RIGHT'))
+    return elements
+
+
+def _layout_columns(page: dict, grid: _Grid) -> list[dict]:
+    """等宽的卡片并排比较，每张卡片包含可选的图片、小标题和说明。"""
+    elements, y = grid.title(page)
+    items = page['items'][:MAX_ITEMS['three_column_comparison']]
+    padding = grid.gutter * 0.6
+    for item, (x, width) in zip(items, grid.columns(len(items))):
+        elements.append(_shape('rounded_rectangle', _round_box(x, y, width, grid.bottom - y),
+                               grid.palette['secondary'], 0.15))
+        inner_y = y + padding
+        if keyword := item.get('image_keyword'):
+            image_height = (grid.bottom - y) * 0.38
+            elements.append(_image(keyword, _round_box(x + padding, inner_y, width - 2 * padding, image_height)))
+            inner_y += image_height + padding
+        heading_height = grid.height * 0.08
+        elements.append(text_element(item.get('heading', ''), _round_box(x + padding, inner_y, width - 2 * padding,
+                                                                         heading_height),
+                                     grid.font_size('card_heading'), font_type='heading', bold=True,
+                                     color=grid.palette['primary']))
+        inner_y += heading_height
+        if text := item.get('text'):
+            box = _round_box(x + padding, inner_y, width - 2 * padding, grid.bottom - padding - inner_y)
+            elements.append(text_element(text, box, fit_font_size(text, box['width'], box['height'],
+                                                                  grid.font_size('card_text'), min_size=12)))
+    return elements
+
+
+def _layout_process_flow(page: dict, grid: _Grid) -> list[dict]:
+    """编号圆点沿水平连线排列，每一步下方是小标题和说明。"""
+    elements, y = grid.title(page)
+    items = page['items'][:MAX_ITEMS['process_flow']]
+    columns = grid.columns(len(items))
+    diameter = min(columns[0][1] * 0.45, grid.height * 0.14)
+    circle_y = y + grid.gutter
+    if len(columns) > 1:
+        first_center = columns[0][0] + columns[0][1] / 2
+        last_center = columns[-1][0] + columns[-1][1] / 2
+        elements.append(_shape('rectangle', _round_box(first_center, circle_y + diameter / 2 - 2,
+                                                       last_center - first_center, 4),
+                               grid.palette['secondary'], 0.6))
+    for number, (item, (x, width)) in enumerate(zip(items, columns), start=1):
+        circle_x = x + (width - diameter) / 2
+        elements.append(_shape('oval', _round_box(circle_x, circle_y, diameter, diameter), grid.palette['primary']))
+        elements.append(text_element(str(number), _round_box(circle_x, circle_y + diameter * 0.2, diameter,
+                                                             diameter * 0.6),
+                                     grid.font_size('card_heading'), font_type='heading', bold=True,
+                                     color='#FFFFFF', alignment='CENTER'))
+        text_y = circle_y + diameter + grid.gutter
+        heading_height = grid.height * 0.08
+        elements.append(text_element(item.get('heading', ''), _round_box(x, text_y, width, heading_height),
+                                     grid.font_size('card_heading'), font_type='heading', bold=True,
+                                     color=grid.palette['primary'], alignment='CENTER'))
+        if text := item.get('text'):
+            box = _round_box(x, text_y + heading_height, width, grid.bottom - text_y - heading_height)
+            elements.append(text_element(text, box, fit_font_size(text, box['width'], box['height'],
+                                                                  grid.font_size('card_text'), min_size=12),
+                                         alignment='CENTER'))
+    return elements
+
+
+def _layout_team(page: dict, grid: _Grid) -> list[dict]:
+    """圆形头像等距排列，下方是姓名和职位。"""
+    elements, y = grid.title(page)
+    items = page['items'][:MAX_ITEMS['team_introduction']]
+    columns = grid.columns(len(items))
+    diameter = min(columns[0][1] * 0.7, grid.height * 0.3)
+    for item, (x, width) in zip(items, columns):
+        photo_y = y + grid.gutter
+        if keyword := item.get('image_keyword'):
+            elements.append(_image(keyword, _round_box(x + (width - diameter) / 2, photo_y, diameter, diameter),
+                                   crop='circle'))
+        else:
+            elements.append(_shape('oval', _round_box(x + (width - diameter) / 2, photo_y, diameter, diameter),
+                                   grid.palette['secondary'], 0.3))
+        name_y = photo_y + diameter + grid.gutter
+        elements.append(text_element(item.get('heading', ''), _round_box(x, name_y, width, grid.height * 0.07),
+                                     grid.font_size('card_heading'), font_type='heading', bold=True,
+                                     color=grid.palette['primary'], alignment='CENTER'))
+        if text := item.get('text'):
+            elements.append(text_element(text, _round_box(x, name_y + grid.height * 0.07, width, grid.height * 0.12),
+                                         grid.font_size('card_text'), alignment='CENTER'))
+    return elements
+
+
+def _layout_chart(page: dict, grid: _Grid) -> list[dict]:
+    """图表占左侧六成，要点在右侧；没有要点时图表占满内容区。"""
+    elements, y = grid.title(page)
+    chart = page['chart']
+    has_text = _body_content(page) is not None
+    chart_right = grid.left + (grid.right - grid.left) * 0.6 if has_text else grid.right
+    elements.append({'type': 'chart', 'chart_type': chart.get('chart_type', 'bar'), 'title': chart.get('title', ''),
+                     'data': chart.get('data', {}),
+                     **_round_box(grid.left, y, chart_right - grid.left, grid.bottom - y)})
+    if chart.get('data_ref'):
+        elements[-1]['data_ref'] = chart['data_ref']
+    if has_text:
+        text_left = chart_right + grid.gutter
+        elements += _body_element(page, grid, _round_box(text_left, y, grid.right - text_left, grid.bottom - y))
+    return elements
+
+
+def _layout_table(page: dict, grid: _Grid) -> list[dict]:
+    elements, y = grid.title(page)
+    table = page['table']
+    rows = table.get('rows', [])
+    # 引用数据文件的表格在排版时还不知道行数，先占满内容区
+    height = grid.bottom - y if table.get('data_ref') else min(grid.bottom - y, (len(rows) + 1) * TABLE_ROW_HEIGHT)
+    element = {'type': 'table', 'headers': table.get('headers', []), 'rows': rows,
+               **_round_box(grid.left, y, grid.right - grid.left, height)}
+    if table.get('data_ref'):
+        element['data_ref'] = table['data_ref']
+    if table.get('style'):
+        element['style'] = table['style']
+    elements.append(element)
+    return elements
+
+
+# 版式名 -> (计算函数, 必需的内容字段, 给模型的说明)；缺少必需字段时按内容推断版式
+LAYOUTS = {
+    'title_slide': (_layout_title_slide, None, "封面/结尾页：title、subtitle，可选 image_keyword 作为满版背景"),
+    'section_header': (_layout_section_header, None, "章节过渡页：title、subtitle"),
+    'title_and_content': (_layout_title_and_content, None, "标题+正文：title、可选 subtitle、body 和/或 bullets"),
+    'image_left_content_right': (_layout_image_left, 'image_keyword',
+                                 "左图右文：image_keyword、title、body 和/或 bullets"),
+    'image_right_content_left': (_layout_image_right, 'image_keyword',
+                                 "左文右图：image_keyword、title、body 和/或 bullets"),
+    'full_screen_image_with_quote': (_layout_quote, 'quote', "满版图片配引言：quote、可选 author、image_keyword"),
+    'three_column_comparison': (_layout_columns, 'items',
+                                "2-4 栏卡片对比：title、items（每项 heading、text，可选 image_keyword）"),
+    'process_flow': (_layout_process_flow, 'items', "流程步骤：title、items（2-6 项，每项 heading、text）"),
+    'team_introduction': (_layout_team, 'items',
+                          "团队/人物介绍：title、items（每项 heading 为姓名、text 为职位、image_keyword 为人像）"),
+    'data_chart_summary': (_layout_chart, 'chart', "图表+要点：title、chart（chart_type、title、data 或 data_ref）、可选 bullets"),
+    'data_table': (_layout_table, 'table', "表格：title、table（headers、rows 或 data_ref）"),
+}
+# 模型常用的其他版式名
+LAYOUT_ALIASES = {
+    'cover': 'title_slide',
+    'closing': 'title_slide',
+    'closing_slide': 'title_slide',
+    'section': 'section_header',
+    'bullet_list': 'title_and_content',
+    'content': 'title_and_content',
+    'agenda': 'title_and_content',
+    'quote': 'full_screen_image_with_quote',
+    'comparison': 'three_column_comparison',
+    'timeline': 'process_flow',
+    'team': 'team_introduction',
+    'chart': 'data_chart_summary',
+    'table': 'data_table',
+}
+
+
+def _infer_layout(page: dict) -> str:
+    """版式名未知或缺少必需内容时，按页面实际提供的内容选择版式。"""
+    if page.get('chart'):
+        return 'data_chart_summary'
+    if page.get('table'):
+        return 'data_table'
+    if page.get('quote'):
+        return 'full_screen_image_with_quote'
+    if page.get('items'):
+        return 'three_column_comparison'
+    if page.get('image_keyword') and _body_content(page) is not None:
+        return 'image_left_content_right'
+    if _body_content(page) is not None:
+        return 'title_and_content'
+    return 'title_slide'
+
+
+def needs_layout(page: dict) -> bool:
+    """只有语义内容、没有元素几何的页面（紧凑模式的方案）需要由版式引擎排版。"""
+    return not page.get('elements')
+
+
+def _normalize_items(items) -> list[dict]:
+    """模型偶尔把 items 写成字符串列表或混入其他值：字符串视为只有小标题的项，其余非字典项丢弃。"""
+    if not isinstance(items, list):
+        return []
+    return [{'heading': item} if isinstance(item, str) else item for item in items
+            if isinstance(item, (str, dict))]
+
+
+def _layout_page(page: dict, grid: _Grid) -> dict:
+    content = dict(page, items=_normalize_items(page['items'])) if 'items' in page else page
+    layout_type = str(page.get('layout_type', ''))
+    layout_type = layout_type if layout_type in LAYOUTS else LAYOUT_ALIASES.get(layout_type, layout_type)
+    if layout_type not in LAYOUTS or (LAYOUTS[layout_type][1] and not content.get(LAYOUTS[layout_type][1])):
+        layout_type = _infer_layout(content)
+    # 单个页面的内容有问题时依次退回推断的版式和纯文本版式，不让一页拖垮整份演示文稿
+    for candidate in dict.fromkeys([layout_type, _infer_layout(content), 'title_and_content']):
+        try:
+            return dict(page, elements=LAYOUTS[candidate][0](content, grid))
+        except Exception as e:
+            logging.warning(f"页面 '{page.get('title', '')}' 按版式 '{candidate}' 排版失败: {e}")
+    return dict(page, elements=[])
+
+
+def layout_page(page: dict, aspect_ratio: str = "16:9", palette: dict | None = None) -> dict:
+    """
+    根据页面的 layout_type 和语义内容（title、subtitle、body、bullets、image_keyword、quote/author、
+    items、chart、table）计算元素，返回带 elements 的新页面，语义内容原样保留。
+    """
+    return _layout_page(page, _Grid(aspect_ratio, {**DEFAULT_PALETTE, **(palette or {})}))
+
+
+def layout_plan(plan: dict, aspect_ratio: str) -> dict:
+    """
+    为方案中所有需要排版的页面计算元素，返回新方案（不修改原方案）；所有页面都已有元素时原样返回。
+    版式只取决于内容和画布，同一份紧凑方案可以直接用于不同的宽高比。
+    """
+    pages = plan.get('pages', [])
+    if not any(needs_layout(page) for page in pages):
+        return plan
+    grid = _Grid(aspect_ratio, {**DEFAULT_PALETTE, **plan.get('color_palette', {})})
+    laid_out = [_layout_page(page, grid) if needs_layout(page) else page for page in pages]
+    logging.info(f"版式引擎已为 {sum(needs_layout(page) for page in pages)} 个页面计算 {aspect_ratio} 画布的元素几何。")
+    return {**plan, 'pages': laid_out}
+
+
+def describe_layouts() -> str:
+    """供紧凑模式提示词使用的版式说明，每行一个版式。"""
+    return '\n'.join(f"- `{name}`: {description}" for name, (_, _, description) in LAYOUTS.items())
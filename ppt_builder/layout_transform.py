@@ -0,0 +1,121 @@
+import copy
+import logging
+import math
+
+# 各宽高比的画布像素尺寸，与 PresentationBuilder 和方案提示词中的画布一致
+CANVAS_SIZES = {"16:9": (1280, 720), "4:3": (1024, 768)}
+# 元素在两个方向上都覆盖画布的该比例以上时视为满版元素，变换后正好铺满新画布
+FULL_BLEED_COVERAGE = 0.95
+# 元素中心与画布中心的偏差小于画布尺寸的该比例时视为居中
+CENTER_TOLERANCE = 0.02
+# 宽高比与1相差不超过该值的形状视为圆形/正方形，等比缩放以免变形
+SQUARE_TOLERANCE = 0.05
+# 文本框字号缩放的下限，避免极端比例下文字过小
+MIN_FONT_SCALE = 0.75
+# 方案省略几何属性时各元素类型的默认图框，与 elements.py 中的默认值一致
+DEFAULT_BOXES = {
+    'text_box': (50, 50, 1180, 100),
+    'text': (50, 50, 1180, 100),
+    'image': (0, 0, 1280, 720),
+    'shape': (50, 50, 200, 200),
+    'chart': (100, 150, 1080, 450),
+    'table': (100, 150, 1080, 420),
+}
+_GEOMETRY_KEYS = ('x', 'y', 'width', 'height')
+
+
+def canvas_size(aspect_ratio: str) -> tuple[int, int]:
+    return CANVAS_SIZES.get(aspect_ratio, CANVAS_SIZES["16:9"])
+
+
+def _anchored_start(start: float, length: float, source_extent: float, target_extent: float,
+                    new_length: float) -> float:
+    """
+    尺寸没有按该方向的比例缩放时，按元素的锚点计算新的起点：
+    居中的元素保持居中，靠近起始边的保持与起始边的（按比例缩放的）距离，靠近末端边的同理。
+    """
+    scale = target_extent / source_extent
+    before, after = start, source_extent - start - length
+    if abs(before - after) <= CENTER_TOLERANCE * source_extent:
+        return (target_extent - new_length) / 2
+    if before <= after:
+        return before * scale
+    return target_extent - new_length - after * scale
+
+
+def _is_uniform(element: dict, width: float, height: float) -> bool:
+    """圆形裁剪的图片、圆形和正方形形状必须等比缩放；其余元素的图框可以分别缩放两个方向。"""
+    style = element.get('style', {})
+    if element.get('type') == 'image':
+        return style.get('crop') == 'circle'
+    if element.get('type') == 'shape':
+        return height > 0 and abs(width / height - 1) <= SQUARE_TOLERANCE
+    return False
+
+
+def rescale_element(element: dict, source: tuple[int, int], target: tuple[int, int]):
+    """
+    把一个元素的几何属性从 source 画布就地变换到 target 画布。
+    - 满版元素（背景图、整页色块）铺满新画布。
+    - 一般元素的图框按两个方向的比例分别缩放；图片由渲染器按图框居中裁剪，不会变形。
+    - 需要保持比例的元素（圆形图片、圆形和正方形）按较小的比例等比缩放，再按锚点定位。
+    - 文本框的字号随可用面积缩小（面积变大时不放大），并且保证文本框完全位于画布内。
+    """
+    (source_width, source_height), (target_width, target_height) = source, target
+    scale_x, scale_y = target_width / source_width, target_height / source_height
+    defaults = DEFAULT_BOXES.get(element.get('type'), (0, 0, 200, 200))
+    x, y, width, height = (float(element.get(key, default)) for key, default in zip(_GEOMETRY_KEYS, defaults))
+
+    margin = 1 - FULL_BLEED_COVERAGE
+    full_bleed = (x <= margin * source_width and width >= FULL_BLEED_COVERAGE * source_width
+                  and y <= margin * source_height and height >= FULL_BLEED_COVERAGE * source_height)
+    if _is_uniform(element, width, height):
+        scale = min(scale_x, scale_y)
+        new_width, new_height = width * scale, height * scale
+        new_box = (_anchored_start(x, width, source_width, target_width, new_width),
+                   _anchored_start(y, height, source_height, target_height, new_height),
+                   new_width, new_height)
+    elif full_bleed:
+        new_box = (0, 0, target_width, target_height)
+    else:
+        new_box = (x * scale_x, y * scale_y, width * scale_x, height * scale_y)
+
+    if element.get('type') in ('text_box', 'text'):
+        new_x, new_y, new_width, new_height = new_box
+        new_width, new_height = min(new_width, target_width), min(new_height, target_height)
+        new_box = (min(max(new_x, 0), target_width - new_width), min(max(new_y, 0), target_height - new_height),
+                   new_width, new_height)
+        # 同样的文字所需面积与字号的平方成正比
+        font_scale = min(1.0, math.sqrt(scale_x * scale_y))
+        font = element.get('style', {}).get('font', {})
+        if font_scale < 1 and isinstance(font.get('size'), (int, float)):
+            font['size'] = round(font['size'] * max(font_scale, MIN_FONT_SCALE) * 2) / 2
+
+    element.update({key: round(value, 1) for key, value in zip(_GEOMETRY_KEYS, new_box)})
+
+
+def rescale_plan(plan: dict, source_ratio: str, target_ratio: str) -> dict:
+    """
+    由为 source_ratio 画布生成的方案得到 target_ratio 画布的方案（返回新对象，不修改原方案）。
+    文字、配色和图片关键词都保持不变，只变换元素和母版页脚的几何属性，
+    因此同一主题的多个宽高比只需要一次AI调用，图片资源也可以共用。
+    """
+    result = copy.deepcopy(plan)
+    if source_ratio == target_ratio:
+        return result
+    source, target = canvas_size(source_ratio), canvas_size(target_ratio)
+
+    for page in result.get('pages', []):
+        for element in page.get('elements', []):
+            rescale_element(element, source, target)
+
+    # 母版页脚和页码只在指定了位置时才需要变换，缺省位置由渲染器按画布计算
+    scale_x, scale_y = target[0] / source[0], target[1] / source[1]
+    for key in ('footer', 'page_number'):
+        style = result.get('master_slide', {}).get(key, {}).get('style', {})
+        for geometry_key, scale in zip(_GEOMETRY_KEYS, (scale_x, scale_y, scale_x, scale_y)):
+            if isinstance(style.get(geometry_key), (int, float)):
+                style[geometry_key] = round(style[geometry_key] * scale, 1)
+
+    logging.info(f"已将 {source_ratio} 方案变换为 {target_ratio} 画布 ({source[0]}x{source[1]} -> {target[0]}x{target[1]})。")
+    return result
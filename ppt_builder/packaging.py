@@ -0,0 +1,164 @@
+import argparse
+import hashlib
+import io
+import logging
+import os
+import statistics
+import time
+import zipfile
+import zlib
+
+from pptx import Presentation
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from pptx.opc.serialized import _ContentTypesItem
+
+from config import PPTX_DEFLATE_LEVEL
+import metrics
+
+# 这些格式本身已经压缩过，再次 deflate 通常几乎不会变小，只会白白消耗CPU。
+# BMP、TIFF、EMF/WMF 和 WAV 等未压缩格式不在此列，始终按 PPTX_DEFLATE_LEVEL 压缩。
+COMPRESSED_EXTENSIONS = frozenset({
+    'png', 'jpg', 'jpeg', 'jpe', 'jfif', 'gif', 'webp', 'wdp', 'jxr',
+    'mp4', 'm4v', 'mov', 'mp3', 'm4a', 'wma', 'wmv',
+    'xlsx', 'xlsm', 'docx', 'pptx',  # 图表数据等嵌入的 OOXML 文件本身就是zip
+})
+# 已压缩格式的部件先用最快的级别试压开头的一段：能再缩小该比例以上才 deflate，否则直接存储（ZIP_STORED）。
+# 照片几乎压不动；本地占位图这类大面积纯色/渐变的 PNG 还能明显变小，仍然值得压缩。
+COMPRESSION_PROBE_BYTES = 64 * 1024
+MIN_COMPRESSION_SAVING = 0.05
+# 参与去重的部件内容类型前缀。嵌入的图表工作簿不参与：两个图表共用一个工作簿时，
+# 在PowerPoint中编辑其中一个图表的数据会改掉另一个图表的数据源。
+DEDUPE_CONTENT_TYPE_PREFIXES = ('image/', 'video/', 'audio/')
+
+
+def _compression_for(partname, blob: bytes) -> int:
+    if partname.ext.lower() not in COMPRESSED_EXTENSIONS:
+        return zipfile.ZIP_DEFLATED
+    probe = blob[:COMPRESSION_PROBE_BYTES]
+    if probe and len(zlib.compress(probe, 1)) < len(probe) * (1 - MIN_COMPRESSION_SAVING):
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+
+def dedupe_media_parts(package) -> int:
+    """
+    把内容完全相同（按SHA-1）的媒体部件合并为一个：所有指向重复部件的关系改为指向第一个出现的部件，
+    重复部件不再被任何关系引用，保存时也就不会写入包中。返回合并掉的部件数量。
+    python-pptx 通过 add_picture 添加的图片在包内已经按哈希复用；这里处理绕过该路径进入包的部件，
+    例如增量重建时随其他部件一并从旧文件移植过来的媒体。
+    """
+    canonical = {}  # 内容哈希 -> 第一个出现的部件
+    replacements = {}  # 重复部件 -> 保留的部件
+    for part in package.iter_parts():
+        if not part.content_type.startswith(DEDUPE_CONTENT_TYPE_PREFIXES):
+            continue
+        digest = hashlib.sha1(part.blob).hexdigest()
+        kept = canonical.setdefault(digest, part)
+        if kept is not part:
+            replacements[part] = kept
+    if not replacements:
+        return 0
+
+    for rel in package.iter_rels():
+        if not rel.is_external and rel.target_part in replacements:
+            kept = replacements[rel.target_part]
+            # _Relationship 没有公开的修改接口；target_part 是惰性属性，需要一并替换已缓存的值
+            rel._target = kept
+            rel.__dict__['target_part'] = kept
+            rel.__dict__.pop('target_partname', None)
+            rel.__dict__.pop('target_ref', None)
+    metrics.PACKAGE_MEDIA_DEDUPED.inc(len(replacements))
+    logging.info(f"打包时合并了 {len(replacements)} 个内容重复的媒体部件。")
+    return len(replacements)
+
+
+def save_presentation(prs: Presentation, pkg_file, deflate_level: int | None = None, dedupe: bool = True):
+    """
+    保存演示文稿，代替 prs.save：写入的部件与 python-pptx 相同，区别只在打包方式——
+    已压缩且压不动的媒体直接存储，XML 等其余部件按 deflate_level（默认 PPTX_DEFLATE_LEVEL）压缩，
+    dedupe 为True时先合并内容重复的媒体部件。
+    :param pkg_file: 文件路径或可写的二进制文件对象。
+    """
+    level = PPTX_DEFLATE_LEVEL if deflate_level is None else deflate_level
+    package = prs.part.package
+    if dedupe:
+        dedupe_media_parts(package)
+    parts = tuple(package.iter_parts())
+
+    with zipfile.ZipFile(pkg_file, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=level,
+                         strict_timestamps=False) as zipf:
+        zipf.writestr(CONTENT_TYPES_URI.membername, serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+        zipf.writestr(PACKAGE_URI.rels_uri.membername, package._rels.xml)
+        for part in parts:
+            blob = part.blob
+            zipf.writestr(part.partname.membername, blob, compress_type=_compression_for(part.partname, blob))
+            if part._rels:
+                zipf.writestr(part.partname.rels_uri.membername, part.rels.xml)
+
+
+# ---------------------------------------------------------------------------
+# 保存耗时基准：python -m ppt_builder.packaging 输出目录或文件 ...
+# ---------------------------------------------------------------------------
+
+def _time_save(deck_path: str, save, repeat: int) -> tuple[float, int]:
+    """重新打开 deck_path 并保存到内存中 repeat 次，返回 (耗时中位数, 输出字节数)。"""
+    timings, size = [], 0
+    for _ in range(repeat):
+        prs = Presentation(deck_path)
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        save(prs, buffer)
+        timings.append(time.perf_counter() - start)
+        size = buffer.tell()
+    return statistics.median(timings), size
+
+
+def benchmark(deck_paths: list[str], levels: list[int], repeat: int = 5) -> list[dict]:
+    """
+    对每个演示文稿比较 python-pptx 默认保存与本模块在各压缩级别下的保存耗时和文件大小。
+    每次保存前都重新打开文件，去重的效果也计入其中。
+    """
+    results = []
+    for path in deck_paths:
+        baseline_seconds, baseline_size = _time_save(path, lambda prs, out: prs.save(out), repeat)
+        rows = [{'deck': path, 'mode': 'prs.save', 'seconds': baseline_seconds, 'bytes': baseline_size}]
+        for level in levels:
+            seconds, size = _time_save(path, lambda prs, out, lv=level: save_presentation(prs, out, lv), repeat)
+            rows.append({'deck': path, 'mode': f'level={level}', 'seconds': seconds, 'bytes': size})
+        for row in rows:
+            row['speedup'] = baseline_seconds / row['seconds'] if row['seconds'] else 0.0
+            row['size_ratio'] = row['bytes'] / baseline_size if baseline_size else 0.0
+        results.extend(rows)
+    return results
+
+
+def _collect_decks(paths: list[str]) -> list[str]:
+    decks = []
+    for path in paths:
+        if os.path.isdir(path):
+            decks.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.pptx'))
+        else:
+            decks.append(path)
+    return decks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较 python-pptx 默认保存与优化打包的耗时和文件大小")
+    parser.add_argument("paths", nargs="+", help="要测试的 .pptx 文件或包含它们的目录（例如 AI_Generated_PPTs）")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, PPTX_DEFLATE_LEVEL, 9],
+                        help="要比较的 deflate 压缩级别")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式重复保存的次数，取中位数")
+    args = parser.parse_args()
+
+    decks = _collect_decks(args.paths)
+    if not decks:
+        parser.error("没有找到 .pptx 文件。")
+    print(f"{'演示文稿':<40} {'方式':<10} {'耗时(ms)':>10} {'加速':>7} {'大小(KB)':>10} {'大小比':>7}")
+    for row in benchmark(decks, sorted(set(args.levels)), args.repeat):
+        print(f"{os.path.basename(row['deck'])[:40]:<40} {row['mode']:<10} {row['seconds'] * 1000:>10.1f} "
+              f"{row['speedup']:>6.2f}x {row['bytes'] / 1024:>10.1f} {row['size_ratio']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 import logging
 from pptx import Presentation
 from pptx.dml.color import RGBColor
+from ppt_builder.layout_check import check_plan
+from ppt_builder.layout_engine import layout_plan
+from ppt_builder.packaging import save_presentation
+from ppt_builder.slide_cache import SlideCache, design_signature, page_hash, tag_slide
 from ppt_builder.slide_renderer import SlideRenderer
 from ppt_builder.styles import PresentationStyle, px_to_emu, hex_to_rgb
 from image_service import ImageService
+from data_service import resolve_data_refs
+from deadline import Deadline
+import metrics
+from config import LAYOUT_AUTOFIX
 
 
 class PresentationBuilder:
@@ -11,23 +19,32 @@ class PresentationBuilder:
     [已更新] 根据AI生成的计划构建完整的演示文稿，并支持不同宽高比。
     """
 
-    def __init__(self, plan: dict, aspect_ratio: str = "16:9"):
+    def __init__(self, plan: dict, aspect_ratio: str = "16:9", image_service: ImageService | None = None,
+                 deadline: Deadline | None = None, fix_layout: bool = LAYOUT_AUTOFIX):
         """
         初始化构建器。
-        :param plan: AI生成的JSON方案。
+        :param plan: AI生成的JSON方案。只有语义内容的页面（紧凑模式）先由版式引擎按画布计算元素。
         :param aspect_ratio: 演示文稿的宽高比 ('16:9' 或 '4:3')。
+        :param image_service: 可选的图片服务实例（例如携带断点续跑的资源缓存），默认新建。
+        :param deadline: 任务时间预算，会同步给图片服务，预算不足时渲染循环降级为本地图片。
+        :param fix_layout: 渲染前的布局检查是否同时修正越界和重叠的元素（见 ppt_builder.layout_check）。
         """
-        self.plan = plan
+        self.plan, _ = check_plan(resolve_data_refs(layout_plan(plan, aspect_ratio)), aspect_ratio, fix=fix_layout)
         self.prs = Presentation()
         self.aspect_ratio = aspect_ratio # 存储宽高比
         self.style_manager = PresentationStyle(plan)
-        self.image_service = ImageService()
+        self.deadline = deadline or Deadline()
+        self.image_service = image_service or ImageService(deadline=self.deadline)
+        if deadline is not None:
+            self.image_service.deadline = deadline
+        self.image_service.palette = self.style_manager.get_palette_hex()
 
         self.background_image_path = None
         master_data = self.plan.get('master_slide', {})
         if keyword := master_data.get('background', {}).get('image_keyword'):
             logging.info(f"正在为全局背景预生成图片: '{keyword}'")
-            self.background_image_path = self.image_service.generate_image(keyword)
+            canvas_size = (1024, 768) if aspect_ratio == "4:3" else (1280, 720)
+            self.background_image_path = self.image_service.generate_image(keyword, size=canvas_size)
             if not self.background_image_path:
                 logging.warning(f"无法为关键词 '{keyword}' 生成背景图片。")
 
@@ -64,9 +81,16 @@ class PresentationBuilder:
             fill.solid()
             fill.fore_color.rgb = RGBColor(255, 255, 255)
 
-    def build_presentation(self, output_path: str):
-        """构建并保存演示文稿。"""
+    def build_presentation(self, output_path: str, incremental: bool = False):
+        """
+        构建并保存演示文稿。
+        每张幻灯片都在名称中记录其页面哈希；incremental 为True且 output_path 已存在时，
+        内容与设计系统都未变化的页面直接从旧文件移植，只重新渲染改动过的页面。
+        """
         try:
+            slide_cache = SlideCache.load(output_path) if incremental else SlideCache()
+            design = design_signature(self.plan, self.aspect_ratio)
+
             # --- [核心修改] 根据宽高比设置幻灯片尺寸 ---
             if self.aspect_ratio == "4:3":
                 self.prs.slide_width = px_to_emu(1024)
@@ -78,14 +102,34 @@ class PresentationBuilder:
                 logging.info("已将演示文稿尺寸设置为 16:9 (1280x720)。")
 
             self._apply_master_slide_styles()
+            self.slide_renderer.prepare_layout(self.plan.get('master_slide', {}))
 
             pages = self.plan.get('pages', [])
             total_pages = len(pages)
+            degraded_logged = False
+            reused_pages = 0
             for i, page_data in enumerate(pages):
+                digest = page_hash(page_data, design)
+                if digest in slide_cache:
+                    slide_cache.splice(self.prs, self.slide_renderer.layout, digest)
+                    reused_pages += 1
+                    logging.info(f"--- 页面 {i + 1}/{total_pages} 未改动，已从缓存复用 ---")
+                    continue
+
                 logging.info(f"--- 正在构建页面 {i + 1}/{total_pages} ---")
+                if self.deadline.is_low() and not degraded_logged:
+                    logging.warning(f"任务时间预算即将耗尽 ({self.deadline})，"
+                                    f"剩余 {total_pages - i} 页将使用缓存或本地占位图片渲染。")
+                    degraded_logged = True
+                first_new_slide = len(self.prs.slides)
                 self.slide_renderer.render_slide(page_data, self.image_service)
+                for slide in list(self.prs.slides)[first_new_slide:]:
+                    tag_slide(slide, digest)
 
-            self.prs.save(output_path)
+            if incremental:
+                logging.info(f"增量重建: 复用 {reused_pages} 页，重新渲染 {total_pages - reused_pages} 页。")
+            with metrics.SAVE_SECONDS.time():
+                save_presentation(self.prs, output_path)
             logging.info(f"演示文稿已成功保存至 {output_path}")
         except Exception as e:
             logging.error(f"构建演示文稿过程中发生严重错误: {e}", exc_info=True)
@@ -0,0 +1,446 @@
+import io
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from config import LAYOUT_AUTOFIX
+from data_service import resolve_data_refs
+from image_service import render_placeholder
+from ppt_builder import table_builder
+from ppt_builder.layout_check import check_plan
+from ppt_builder.layout_engine import layout_plan
+from ppt_builder.slide_renderer import ELEMENT_LAYER_ORDER
+from ppt_builder.styles import PresentationStyle
+
+# 预览缩略图的宽度 (px)，高度按宽高比计算
+PREVIEW_WIDTH = 640
+# 联系表（整套幻灯片的缩略图总览）每行的缩略图数量、缩略图宽度和间距 (px)
+CONTACT_SHEET_COLUMNS = 4
+CONTACT_SHEET_THUMB_WIDTH = 320
+CONTACT_SHEET_GAP = 16
+# 预览使用的字体，按顺序查找；都不存在时使用 Pillow 自带的字体（不含中文字形）
+PREVIEW_FONTS = ("NotoSansCJK-Regular.ttc", "NotoSansSC-Regular.otf", "msyh.ttc", "simhei.ttf",
+                 "wqy-microhei.ttc", "DejaVuSans.ttf", "arial.ttf")
+# 磅到幻灯片像素的换算 (96 DPI)
+PX_PER_PT = 96 / 72
+
+
+def _rgb(hex_color: str, default=(0, 0, 0)) -> tuple[int, int, int]:
+    hex_color = str(hex_color).lstrip('#')
+    try:
+        return int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
+    except (ValueError, IndexError):
+        return default
+
+
+@lru_cache(maxsize=64)
+def _load_font(size_px: int):
+    size_px = max(6, size_px)
+    for font_name in PREVIEW_FONTS:
+        try:
+            return ImageFont.truetype(font_name, size_px)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size_px)
+    except TypeError:  # Pillow < 10.1 的内置字体不支持指定字号
+        return ImageFont.load_default()
+
+
+def image_paths_from_assets(asset_cache: dict) -> dict[str, str]:
+    """
+    把 ImageService 的资源记录（键为 '关键词|透明度|序号'）转换为 关键词 -> 图片路径，
+    每个关键词取第一张仍然存在的图片。
+    """
+    image_paths = {}
+    for asset_key, path in sorted(asset_cache.items()):
+        keyword = asset_key.rsplit('|', 2)[0]
+        if keyword not in image_paths and path and os.path.exists(path):
+            image_paths[keyword] = path
+    return image_paths
+
+
+class SlidePreviewer:
+    """
+    直接根据方案 (plan) 用 PIL 绘制幻灯片的近似预览，不经过 pptx 文件，也不需要 LibreOffice。
+    绘制内容包括：背景、形状（纯色/渐变/透明度/边框）、图片（来自资源缓存，缺失时用本地占位图）、
+    文本框、表格、图表的简化示意以及母版页脚和页码。预览只用于快速质检，不追求与 PowerPoint 像素一致。
+    """
+
+    def __init__(self, plan: dict, aspect_ratio: str = "16:9", image_paths: dict | None = None,
+                 width: int = PREVIEW_WIDTH):
+        """
+        :param plan: AI生成的演示文稿方案。
+        :param aspect_ratio: '16:9' 或 '4:3'，决定画布尺寸。
+        :param image_paths: 关键词 -> 本地图片路径，通常由 image_paths_from_assets 得到。
+        :param width: 输出缩略图的宽度 (px)。
+        """
+        self.plan = resolve_data_refs(layout_plan(plan, aspect_ratio))
+        if LAYOUT_AUTOFIX:
+            # 与渲染器看到相同的修正后布局；问题已在渲染时报告过，这里不再重复记录
+            self.plan, _ = check_plan(self.plan, aspect_ratio, fix=True, report=False)
+        self.canvas_size = (1024, 768) if aspect_ratio == "4:3" else (1280, 720)
+        self.scale = width / self.canvas_size[0]
+        self.size = (width, round(self.canvas_size[1] * self.scale))
+        self.image_paths = image_paths or {}
+        self.style_manager = PresentationStyle(plan)
+        self.master_data = plan.get('master_slide', {})
+        self._background = self._render_background()
+
+    def _box(self, element: dict, defaults: tuple) -> tuple[int, int, int, int]:
+        """元素的 (x, y, 宽, 高)，已换算为缩略图像素。"""
+        values = [element.get(k, d) for k, d in zip(('x', 'y', 'width', 'height'), defaults)]
+        x, y, w, h = [round(float(v) * self.scale) for v in values]
+        return x, y, max(1, w), max(1, h)
+
+    def _font(self, size_pt: float):
+        return _load_font(round(size_pt * PX_PER_PT * self.scale))
+
+    def _load_image(self, keyword: str, size: tuple[int, int]) -> Image.Image:
+        """从资源缓存读取图片，缺失时使用与渲染时相同的本地占位图。"""
+        path = self.image_paths.get(keyword)
+        if path:
+            try:
+                with Image.open(path) as img:
+                    return img.convert("RGBA")
+            except OSError as e:
+                logging.warning(f"预览时读取图片 '{path}' 失败，改用占位图: {e}")
+        data = render_placeholder(keyword, size, self.style_manager.get_palette_hex())
+        return Image.open(io.BytesIO(data)).convert("RGBA")
+
+    def _render_background(self) -> Image.Image:
+        background_info = self.master_data.get('background', {})
+        if keyword := background_info.get('image_keyword'):
+            image = self._load_image(keyword, self.canvas_size)
+            return ImageOps.fit(image, self.size).convert("RGBA")
+        color = background_info.get('color') or self.style_manager.color_palette.get('background', '#FFFFFF')
+        return Image.new("RGBA", self.size, _rgb(color, (255, 255, 255)) + (255,))
+
+    # ------------------------------------------------------------------ 元素绘制
+
+    def _draw_image(self, canvas: Image.Image, element: dict):
+        keyword = element.get('image_keyword')
+        if not keyword:
+            return
+        x, y, w, h = self._box(element, (0, 0, 1280, 720))
+        image = self._load_image(keyword, (element.get('width', 1280), element.get('height', 720)))
+        if element.get('style', {}).get('crop') == 'circle':
+            diameter = min(w, h)
+            image = ImageOps.fit(image, (diameter, diameter))
+            mask = Image.new('L', image.size, 0)
+            ImageDraw.Draw(mask).ellipse((0, 0) + image.size, fill=255)
+            image.putalpha(mask)
+        else:
+            image = ImageOps.fit(image, (w, h))
+        canvas.alpha_composite(image, (x, y))
+
+    def _gradient(self, size: tuple[int, int], colors: list, angle: float) -> Image.Image:
+        """按 PowerPoint 的角度约定（0 为从左到右，90 为从上到下）近似绘制两色线性渐变。"""
+        start, end = _rgb(colors[0]), _rgb(colors[-1])
+        mask = Image.linear_gradient('L').resize((363, 363)).rotate(90 - angle, resample=Image.BILINEAR)
+        mask = mask.crop((53, 53, 309, 309)).resize(size)
+        return Image.composite(Image.new("RGB", size, end), Image.new("RGB", size, start), mask)
+
+    def _draw_shape(self, canvas: Image.Image, element: dict):
+        x, y, w, h = self._box(element, (50, 50, 200, 200))
+        style = element.get('style', {})
+        shape_type = element.get('shape_type', 'rectangle').lower()
+        opacity = style.get('opacity', 1.0)
+        alpha = round(255 * opacity) if isinstance(opacity, (int, float)) and 0 <= opacity <= 1 else 255
+
+        if 'gradient' in style and len(style['gradient'].get('colors', [])) >= 1:
+            fill = self._gradient((w, h), style['gradient']['colors'], style['gradient'].get('angle', 0))
+        elif style.get('fill_color'):
+            fill = Image.new("RGB", (w, h), _rgb(style['fill_color']))
+        else:
+            fill = None
+
+        mask = Image.new('L', (w, h), 0)
+        draw = ImageDraw.Draw(mask)
+        outline = (0, 0, w - 1, h - 1)
+        if shape_type == 'oval':
+            draw.ellipse(outline, fill=alpha)
+        elif shape_type == 'rounded_rectangle':
+            draw.rounded_rectangle(outline, radius=min(w, h) // 6, fill=alpha)
+        elif shape_type == 'triangle':
+            draw.polygon([(w / 2, 0), (w - 1, h - 1), (0, h - 1)], fill=alpha)
+        elif shape_type == 'star':
+            points = [(w / 2 + (w / 2 if i % 2 == 0 else w / 5) * math.sin(i * math.pi / 5),
+                       h / 2 - (h / 2 if i % 2 == 0 else h / 5) * math.cos(i * math.pi / 5)) for i in range(10)]
+            draw.polygon(points, fill=alpha)
+        else:
+            draw.rectangle(outline, fill=alpha)
+
+        if fill is not None:
+            layer = fill.convert("RGBA")
+            layer.putalpha(mask)
+            canvas.alpha_composite(layer, (x, y))
+        if border := style.get('border'):
+            width = max(1, round(border.get('width', 1) * PX_PER_PT * self.scale))
+            ImageDraw.Draw(canvas).rectangle((x, y, x + w, y + h), outline=_rgb(border.get('color', '#000000')),
+                                             width=width)
+
+    def _wrap(self, text: str, font, max_width: int) -> list[str]:
+        """按字符贪心换行，兼容没有空格的中文文本。"""
+        lines = []
+        for raw_line in text.split('\n'):
+            line = ''
+            for char in raw_line:
+                if line and font.getlength(line + char) > max_width:
+                    lines.append(line)
+                    line = char
+                else:
+                    line += char
+            lines.append(line)
+        return lines
+
+    def _draw_text(self, canvas: Image.Image, text: str, box: tuple, font, color, alignment: str = 'LEFT',
+                   bold: bool = False):
+        x, y, w, h = box
+        draw = ImageDraw.Draw(canvas)
+        line_height = round(font.size * 1.2)
+        for line in self._wrap(text, font, w):
+            line_width = font.getlength(line)
+            if alignment == 'CENTER':
+                line_x = x + (w - line_width) / 2
+            elif alignment == 'RIGHT':
+                line_x = x + w - line_width
+            else:
+                line_x = x
+            draw.text((line_x, y), line, font=font, fill=color, stroke_width=1 if bold else 0, stroke_fill=color)
+            y += line_height
+        return y
+
+    def _draw_text_box(self, canvas: Image.Image, element: dict):
+        x, y, w, h = self._box(element, (50, 50, 1180, 100))
+        style = element.get('style', {})
+        font_style = style.get('font', {})
+        font = self._font(font_style.get('size', 18))
+        color = _rgb(font_style['color']) if 'color' in font_style else _rgb(str(self.style_manager.text_color))
+        alignment = str(style.get('alignment', 'LEFT')).upper()
+
+        content = element.get('content', '')
+        items = content if isinstance(content, list) else [content]
+        for item in items:
+            text = str(item).replace('**', '')
+            y = self._draw_text(canvas, text, (x, y, w, h), font, color, alignment, font_style.get('bold', False))
+
+    def _draw_table(self, canvas: Image.Image, element: dict):
+        headers, rows = element.get('headers', []), element.get('rows', [])
+        if not headers or not rows:
+            return
+        x, y, w, h = self._box(element, (100, 150, 1080, 420))
+        style = element.get('style', {})
+        header_fill = _rgb(style.get('header_color', f"#{self.style_manager.primary}"))
+        row_fills = [_rgb(c) for c in style.get('row_colors', [])]
+        text_color = _rgb(str(self.style_manager.text_color))
+        num_cols, num_rows = len(headers), len(rows) + 1
+        cell_w, cell_h = w / num_cols, h / num_rows
+        font = self._font(14)
+        draw = ImageDraw.Draw(canvas)
+
+        for r, row in enumerate([headers] + list(rows)):
+            top = y + r * cell_h
+            fill = header_fill if r == 0 else (row_fills[(r - 1) % len(row_fills)] if row_fills else None)
+            if fill:
+                draw.rectangle((x, top, x + w, top + cell_h), fill=fill)
+            for c, cell in enumerate(list(row)[:num_cols]):
+                left = x + c * cell_w
+                text = str(cell).split('\n')[0]
+                while text and font.getlength(text) > cell_w - 4:
+                    text = text[:-1]
+                draw.text((left + 2, top + 2), text, font=font, fill=(255, 255, 255) if r == 0 else text_color)
+        for r in range(num_rows + 1):
+            draw.line((x, y + r * cell_h, x + w, y + r * cell_h), fill=(200, 200, 200))
+        for c in range(num_cols + 1):
+            draw.line((x + c * cell_w, y, x + c * cell_w, y + h), fill=(200, 200, 200))
+
+    def _draw_chart(self, canvas: Image.Image, element: dict):
+        """图表的简化示意：柱状图画簇状柱，折线图画折线，饼图画扇区；坐标轴和标签从简。"""
+        x, y, w, h = self._box(element, (100, 150, 1080, 450))
+        data = element.get('data', {})
+        categories = data.get('categories', [])
+        series = [s for s in data.get('series', []) if s.get('values')]
+        chart_type = element.get('chart_type', 'bar').upper()
+        draw = ImageDraw.Draw(canvas)
+        text_color = _rgb(str(self.style_manager.text_color))
+
+        if title := element.get('title'):
+            font = self._font(20)
+            self._draw_text(canvas, str(title), (x, y, w, h), font, text_color, 'CENTER', bold=True)
+            top_margin = round(font.size * 1.6)
+            y, h = y + top_margin, max(1, h - top_margin)
+        if not series:
+            return
+
+        if chart_type == 'PIE':
+            values = [max(0.0, float(v or 0)) for v in series[0]['values']]
+            total = sum(values) or 1.0
+            diameter = min(w, h)
+            bbox = (x + (w - diameter) / 2, y + (h - diameter) / 2,
+                    x + (w + diameter) / 2, y + (h + diameter) / 2)
+            start = -90.0
+            for j, value in enumerate(values):
+                end = start + 360.0 * value / total
+                draw.pieslice(bbox, start, end, fill=_rgb(str(self.style_manager.get_chart_color(j))),
+                              outline=(255, 255, 255))
+                start = end
+            return
+
+        all_values = [float(v or 0) for s in series for v in s['values']]
+        low, high = min(0.0, min(all_values)), max(0.0, max(all_values))
+        span = (high - low) or 1.0
+        count = max(len(categories), max(len(s['values']) for s in series))
+
+        def value_y(value):
+            return y + h - (float(value or 0) - low) / span * h
+
+        draw.line((x, value_y(0), x + w, value_y(0)), fill=(160, 160, 160))
+        slot = w / count
+        for i, s in enumerate(series):
+            color = _rgb(str(self.style_manager.get_chart_color(i)))
+            if chart_type == 'LINE':
+                points = [(x + slot * (k + 0.5), value_y(v)) for k, v in enumerate(s['values'])]
+                if len(points) > 1:
+                    draw.line(points, fill=color, width=max(1, round(3 * self.scale)))
+                for px, py in points:
+                    r = max(2, round(4 * self.scale))
+                    draw.ellipse((px - r, py - r, px + r, py + r), fill=color)
+            else:
+                bar_w = slot * 0.8 / len(series)
+                for k, v in enumerate(s['values']):
+                    left = x + slot * k + slot * 0.1 + bar_w * i
+                    top, bottom = sorted((value_y(v), value_y(0)))
+                    draw.rectangle((left, top, left + bar_w, bottom), fill=color)
+
+    def _draw_master_text(self, canvas: Image.Image, page_number: int):
+        canvas_w, canvas_h = self.canvas_size
+        entries = []
+        if (footer := self.master_data.get('footer')) and footer.get('text'):
+            entries.append((footer.get('style', {}), 'LEFT', footer['text'], 0.03, 0.6))
+        if page_info := self.master_data.get('page_number'):
+            entries.append((page_info.get('style', {}), 'RIGHT', str(page_number), 0.87, 0.1))
+        for style, default_alignment, text, x_ratio, width_ratio in entries:
+            box = self._box(style, (canvas_w * x_ratio, canvas_h - 40, canvas_w * width_ratio, 30))
+            color = _rgb(style['color']) if 'color' in style else _rgb(str(self.style_manager.text_color))
+            self._draw_text(canvas, text, box, self._font(style.get('font_size', 12)), color,
+                            str(style.get('alignment', default_alignment)).upper())
+
+    # ------------------------------------------------------------------ 页面
+
+    def expand_pages(self) -> list[dict]:
+        """与 SlideRenderer 一致地展开表格续页，保证预览页数与生成的演示文稿相同。"""
+        pages = []
+        for page in self.plan.get('pages', []):
+            continuation_pages = []
+            page_elements = []
+            for element in page.get('elements', []):
+                if element.get('type') == 'table':
+                    first_part, *rest = table_builder.split_table(element)
+                    page_elements.append(first_part)
+                    continuation_pages.extend({'elements': [part]} for part in rest)
+                else:
+                    page_elements.append(element)
+            pages.append(dict(page, elements=page_elements))
+            pages.extend(continuation_pages)
+        return pages
+
+    def render_page(self, page: dict, page_number: int) -> Image.Image:
+        canvas = self._background.copy()
+        self._draw_master_text(canvas, page_number)
+        page_elements = sorted(page.get('elements', []),
+                               key=lambda e: ELEMENT_LAYER_ORDER.get(e.get('type'), ELEMENT_LAYER_ORDER['default']))
+        for element in page_elements:
+            element_type = element.get('type')
+            try:
+                if element_type in ('text_box', 'text'):
+                    self._draw_text_box(canvas, element)
+                elif element_type == 'image':
+                    self._draw_image(canvas, element)
+                elif element_type == 'shape':
+                    self._draw_shape(canvas, element)
+                elif element_type == 'chart':
+                    self._draw_chart(canvas, element)
+                elif element_type == 'table':
+                    self._draw_table(canvas, element)
+            except Exception as e:
+                logging.warning(f"预览第 {page_number} 页的 '{element_type}' 元素失败: {e}")
+        return canvas.convert("RGB")
+
+    def render_all(self) -> list[Image.Image]:
+        return [self.render_page(page, i + 1) for i, page in enumerate(self.expand_pages())]
+
+
+def build_contact_sheet(thumbnails: list[Image.Image], title: str = "") -> Image.Image:
+    """把整套幻灯片的缩略图按网格排成一张联系表，每张下方标注页码。"""
+    if not thumbnails:
+        return Image.new("RGB", (CONTACT_SHEET_THUMB_WIDTH, CONTACT_SHEET_THUMB_WIDTH // 2), (235, 235, 235))
+    thumb_w = CONTACT_SHEET_THUMB_WIDTH
+    thumb_h = round(thumbnails[0].height * thumb_w / thumbnails[0].width)
+    gap, label_h = CONTACT_SHEET_GAP, 20
+    title_h = 36 if title else 0
+    columns = min(CONTACT_SHEET_COLUMNS, len(thumbnails))
+    rows = math.ceil(len(thumbnails) / columns)
+
+    sheet = Image.new("RGB", (gap + columns * (thumb_w + gap), title_h + gap + rows * (thumb_h + label_h + gap)),
+                      (235, 235, 235))
+    draw = ImageDraw.Draw(sheet)
+    font = _load_font(14)
+    if title:
+        draw.text((gap, gap), title, font=_load_font(20), fill=(40, 40, 40))
+    for i, thumbnail in enumerate(thumbnails):
+        left = gap + (i % columns) * (thumb_w + gap)
+        top = title_h + gap + (i // columns) * (thumb_h + label_h + gap)
+        sheet.paste(thumbnail.resize((thumb_w, thumb_h), Image.LANCZOS), (left, top))
+        draw.rectangle((left - 1, top - 1, left + thumb_w, top + thumb_h), outline=(180, 180, 180))
+        draw.text((left, top + thumb_h + 3), str(i + 1), font=font, fill=(80, 80, 80))
+    return sheet
+
+
+def render_deck_preview(plan: dict, aspect_ratio: str, output_dir: str, image_paths: dict | None = None,
+                        title: str = "") -> str:
+    """
+    为一套演示文稿生成逐页PNG预览 (slide_01.png ...) 和联系表 (contact_sheet.png)。
+    :return: 联系表的路径。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    thumbnails = SlidePreviewer(plan, aspect_ratio, image_paths).render_all()
+    for i, thumbnail in enumerate(thumbnails):
+        thumbnail.save(os.path.join(output_dir, f"slide_{i + 1:02d}.png"))
+    sheet_path = os.path.join(output_dir, "contact_sheet.png")
+    build_contact_sheet(thumbnails, title).save(sheet_path)
+    logging.info(f"已生成 {len(thumbnails)} 页预览，联系表: {sheet_path}")
+    return sheet_path
+
+
+def preview_dir_for(output_path: str) -> str:
+    """演示文稿对应的预览目录：与输出文件同名、以 _preview 结尾的目录。"""
+    return f"{os.path.splitext(output_path)[0]}_preview"
+
+
+def _render_job(job: dict) -> str:
+    return render_deck_preview(job['plan'], job.get('aspect_ratio', '16:9'), job['output_dir'],
+                               job.get('image_paths'), job.get('title', ''))
+
+
+def preview_batch(jobs: list[dict], max_workers: int | None = None) -> list[str]:
+    """
+    在进程池中并行生成多套演示文稿的预览。
+    每个任务是包含 plan、aspect_ratio、output_dir，以及可选的 image_paths、title 的字典。
+    :return: 成功生成的联系表路径列表。
+    """
+    if not jobs:
+        return []
+    sheets = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_render_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                sheets.append(future.result())
+            except Exception as e:
+                logging.error(f"生成预览 '{futures[future]['output_dir']}' 失败: {e}", exc_info=True)
+    return sheets
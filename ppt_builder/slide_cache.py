@@ -0,0 +1,122 @@
+import copy
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+
+from pptx import Presentation
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+from config import TABLE_PAGINATE
+from ppt_builder import chart_builder
+
+# 渲染逻辑变化导致旧的幻灯片不能再复用时递增，使所有旧缓存失效
+CACHE_VERSION = 2
+# 幻灯片名称 (p:cSld 的 name 属性) 中记录页面哈希的前缀，PowerPoint 界面中不可见
+SLIDE_NAME_PREFIX = "page:"
+
+_R_ATTRIBUTES = ('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed',
+                 '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id',
+                 '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}link')
+_PARTNAME_INDEX_PATTERN = re.compile(r"\d+(\.\w+)$")
+
+
+def design_signature(plan: dict, aspect_ratio: str) -> str:
+    """影响每一页渲染结果的全局设计参数：配色、字体、母版背景、宽高比、表格分页设置和缓存版本。"""
+    return json.dumps([CACHE_VERSION, aspect_ratio, plan.get('color_palette', {}), plan.get('font_pairing', {}),
+                       plan.get('master_slide', {}).get('background'), TABLE_PAGINATE],
+                      sort_keys=True, ensure_ascii=False, default=str)
+
+
+def page_hash(page_data: dict, design: str) -> str:
+    """页面内容与设计系统共同决定的哈希。必须在渲染前计算，渲染会就地重排元素顺序。"""
+    payload = json.dumps([design, page_data], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def tag_slide(slide, digest: str):
+    """在幻灯片名称中记录生成它的页面哈希，使输出文件本身可以作为下次重建的缓存。"""
+    slide._element.cSld.set('name', f"{SLIDE_NAME_PREFIX}{digest}")
+
+
+class SlideCache:
+    """
+    增量重建的幻灯片缓存。
+    以上一次生成的演示文稿为缓存来源：每张幻灯片的名称记录了生成它的页面哈希
+    （一个页面因表格分页可能对应多张幻灯片）。重建时，哈希未变的页面直接把旧幻灯片的XML
+    连同其图片、图表和内嵌工作簿部件移植到新演示文稿中，不再获取图片或生成图表。
+    """
+
+    def __init__(self, source=None):
+        """:param source: 作为缓存来源的 Presentation 对象，None 表示空缓存。"""
+        self._slides = {}
+        self._spliced = set()
+        if source is not None:
+            for slide in source.slides:
+                name = slide._element.cSld.get('name', '')
+                if name.startswith(SLIDE_NAME_PREFIX):
+                    self._slides.setdefault(name[len(SLIDE_NAME_PREFIX):], []).append(slide)
+
+    @classmethod
+    def load(cls, pptx_path: str) -> "SlideCache":
+        """从已有的演示文稿加载缓存；文件不存在或无法读取时返回空缓存。"""
+        if not pptx_path or not os.path.exists(pptx_path):
+            return cls()
+        try:
+            cache = cls(Presentation(pptx_path))
+            logging.info(f"已从 '{pptx_path}' 加载增量重建缓存，共 {len(cache)} 个页面。")
+            return cache
+        except Exception as e:
+            logging.warning(f"读取增量重建缓存 '{pptx_path}' 失败，将完整重建: {e}")
+            return cls()
+
+    def __len__(self):
+        return len(self._slides)
+
+    def __contains__(self, digest: str):
+        # 同一页面内容在方案中重复出现时，只有第一次使用缓存，避免两张幻灯片共用同一个图表部件
+        return digest in self._slides and digest not in self._spliced
+
+    def splice(self, prs, layout, digest: str) -> int:
+        """把哈希对应的旧幻灯片依次追加到 prs 中，返回追加的幻灯片数量。"""
+        package = prs.part.package
+        for old_slide in self._slides[digest]:
+            slide = prs.slides.add_slide(layout)
+            rId_map = {}
+            for rId, rel in old_slide.part.rels.items():
+                if rel.is_external:
+                    rId_map[rId] = slide.part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+                elif rel.reltype in (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE):
+                    continue
+                elif rel.reltype == RT.IMAGE:
+                    # 图片按内容去重，与新渲染页面中的相同图片共用同一个部件
+                    _, rId_map[rId] = slide.part.get_or_add_image_part(io.BytesIO(rel.target_part.blob))
+                else:
+                    self._adopt(rel.target_part, package, set())
+                    rId_map[rId] = slide.part.relate_to(rel.target_part, rel.reltype)
+
+            cSld = copy.deepcopy(old_slide._element.cSld)
+            for element in cSld.iter():
+                for attribute in _R_ATTRIBUTES:
+                    if (value := element.get(attribute)) in rId_map:
+                        element.set(attribute, rId_map[value])
+            slide._element.replace(slide._element.cSld, cSld)
+
+        self._spliced.add(digest)
+        return len(self._slides[digest])
+
+    @staticmethod
+    def _adopt(part, package, seen: set):
+        """把旧包中的部件（及其关联部件，如图表的内嵌工作簿）改名后并入新包，避免部件名冲突。"""
+        if id(part) in seen:
+            return
+        seen.add(id(part))
+        template = _PARTNAME_INDEX_PATTERN.sub(r"%d\1", str(part.partname))
+        if template != str(part.partname):
+            part.partname = chart_builder.allocate_partname(package, template)
+        part._package = package
+        for rel in part.rels.values():
+            if not rel.is_external:
+                SlideCache._adopt(rel.target_part, package, seen)
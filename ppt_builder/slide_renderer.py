@@ -1,9 +1,24 @@
 import logging
 import os
+import time
 
 from pptx import Presentation
-from ppt_builder import elements
-from ppt_builder.styles import PresentationStyle, px_to_emu
+from pptx.enum.text import PP_ALIGN
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.shapes.shapetree import SlideShapes
+from pptx.text.text import Font
+from pptx.util import Pt
+import metrics
+from ppt_builder import contrast, elements, table_builder
+from ppt_builder.styles import PresentationStyle, px_to_emu, hex_to_rgb
+
+# 所有页面使用的版式：默认模板中的“空白”版式
+BLANK_LAYOUT_INDEX = 6
+# 每像素对应的EMU数，与 px_to_emu 一致
+EMU_PER_PX = 9525
+# 页码字段的固定标识
+SLIDE_NUMBER_FIELD_ID = '{B6F15528-21DE-4FAA-801E-634DDDAF4B2B}'
 
 ELEMENT_LAYER_ORDER = {
     'image': 0,
@@ -28,11 +43,36 @@ class SlideRenderer:
         self.prs = prs
         self.style_manager = style_manager
         self.background_image_path = background_image_path
+        # 画布背景色，用于文字对比度检查；由 prepare_layout 根据母版设置确定
+        self.background_color = f"#{style_manager.background}"
         logging.info("SlideRenderer已使用样式管理器和背景信息初始化。")
 
-    def _add_background_image(self, slide, image_path: str):
+    @property
+    def layout(self):
+        """所有页面共用的空白版式。"""
+        return self.prs.slide_layouts[BLANK_LAYOUT_INDEX]
+
+    def prepare_layout(self, master_data: dict):
+        """
+        把全局背景图片、页脚和页码放到所有页面共用的空白版式上。
+        这些内容只在版式中添加一次，每张幻灯片自动继承，没有逐页的渲染开销，也不会在包中产生重复的形状。
+        必须在渲染任何页面之前调用一次。
+        """
+        layout_shapes = SlideShapes(self.layout.shapes._spTree, self.layout)
+        self.background_color = master_data.get('background', {}).get('color') or self.background_color
+        self._add_background_image(layout_shapes, self.background_image_path)
+
+        if footer := master_data.get('footer'):
+            if footer_text := footer.get('text'):
+                self._add_layout_text(layout_shapes, footer.get('style', {}), 'LEFT', footer_text, 0.03, 0.6)
+                logging.info(f"已在版式上添加页脚: '{footer_text}'")
+        if page_number := master_data.get('page_number'):
+            self._add_layout_text(layout_shapes, page_number.get('style', {}), 'RIGHT', None, 0.87, 0.1)
+            logging.info("已在版式上添加自动更新的页码。")
+
+    def _add_background_image(self, layout_shapes, image_path: str):
         """
-        [FIXED] Adds a background image and moves it to the back.
+        [FIXED] Adds a background image to the shared layout, behind everything else.
         Now includes checks to prevent errors with invalid paths.
         """
         if not image_path:
@@ -43,28 +83,61 @@ class SlideRenderer:
             return
 
         try:
-            picture = slide.shapes.add_picture(
+            picture = layout_shapes.add_picture(
                 image_path, 0, 0,
                 width=self.prs.slide_width,
                 height=self.prs.slide_height
             )
-            # 将图片移动到最底层
+            # 将图片移动到最底层（紧跟在形状树自身的属性元素之后）
             pic_element = picture.element
-            slide.shapes._spTree.remove(pic_element)
-            slide.shapes._spTree.insert(0, pic_element)
+            layout_shapes._spTree.remove(pic_element)
+            layout_shapes._spTree.insert(2, pic_element)
 
             logging.info(f"Successfully added background image: {image_path}")
         except Exception as e:
             logging.error(f"An unexpected error occurred while adding background image '{image_path}': {e}",
                           exc_info=True)
 
+    def _add_layout_text(self, layout_shapes, style: dict, default_alignment: str, text: str | None,
+                         default_x_ratio: float, default_width_ratio: float):
+        """
+        在版式上添加页脚文本框；text 为None时添加幻灯片编号字段，每页显示各自的页码。
+        未指定位置时放在画布底部，水平位置和宽度按画布宽度的比例给出。
+        """
+        try:
+            canvas_width = self.prs.slide_width / EMU_PER_PX
+            canvas_height = self.prs.slide_height / EMU_PER_PX
+            x, y, width, height = map(px_to_emu, [
+                style.get('x', canvas_width * default_x_ratio), style.get('y', canvas_height - 40),
+                style.get('width', canvas_width * default_width_ratio), style.get('height', 30)
+            ])
+            text_frame = layout_shapes.add_textbox(x, y, width, height).text_frame
+            text_frame.word_wrap = True
+            p = text_frame.paragraphs[0]
+            p.alignment = elements.ALIGNMENT_MAP.get(str(style.get('alignment', default_alignment)).upper(),
+                                                     PP_ALIGN.LEFT)
+
+            if text is None:
+                # 幻灯片编号字段：PowerPoint 在每一页显示该页自己的页码
+                fld = parse_xml(f'<a:fld {nsdecls("a")} id="{SLIDE_NUMBER_FIELD_ID}" type="slidenum">'
+                                f'<a:rPr lang="zh-CN"/><a:t>‹#›</a:t></a:fld>')
+                p._p.append(fld)
+                font = Font(fld.rPr)
+            else:
+                run = p.add_run()
+                run.text = text
+                font = run.font
+
+            font.size = Pt(style.get('font_size', 12))
+            font.name = style.get('font_name', self.style_manager.body_font)
+            font.color.rgb = hex_to_rgb(style['color']) if 'color' in style else self.style_manager.text_color
+        except Exception as e:
+            logging.error(f"在版式上添加页脚/页码时出错: {e}", exc_info=True)
+
     def render_slide(self, slide_data: dict, image_service):
         """根据给定的数据渲染一张幻灯片。"""
-        blank_slide_layout = self.prs.slide_layouts[6]
-        slide = self.prs.slides.add_slide(blank_slide_layout)
-
-        # 首先添加全局背景图片（如果存在）
-        self._add_background_image(slide, self.background_image_path)
+        # 全局背景图片、页脚和页码已由 prepare_layout 放在版式上，幻灯片自动继承
+        slide = self.prs.slides.add_slide(self.layout)
 
         # ===================== 核心修改：元素排序 =====================
         elements_to_render = slide_data.get('elements', [])
@@ -79,19 +152,36 @@ class SlideRenderer:
         logging.info("页面元素已按图层顺序重排，渲染开始...")
         # ===================== 修改结束 ============================
 
+        # 超出图框容量且启用分页的表格：本页只渲染第一部分，其余行放到紧随其后的续页
+        continuation_pages = []
+        # 文本之下的背景层，文本框在所有图片和形状之后渲染，渲染前据此修正文字对比度
+        backdrop = contrast.Backdrop(self.prs.slide_width / EMU_PER_PX, self.prs.slide_height / EMU_PER_PX,
+                                     self.background_color, image_service.get_image_stats(self.background_image_path))
+
         # 遍历排序后的列表进行渲染
         for element in elements_to_render:
             element_type = element.get('type')
+            render_start = time.perf_counter()
             try:
                 if element_type in ['text_box', 'text']:
+                    text_color, scrim = backdrop.check_text_box(element, self.style_manager)
+                    if scrim:
+                        elements.add_shape(slide, scrim, self.style_manager)
+                    if text_color:
+                        # 只修改渲染用的副本，方案本身保持模型的原始输出
+                        style = element.get('style', {})
+                        font = {**style.get('font', {}), 'color': text_color}
+                        element = {**element, 'style': {**style, 'font': font}}
                     elements.add_text_box(slide, element, self.style_manager)
 
                 elif element_type == 'image':
                     if image_keyword := element.get('image_keyword'):
                         opacity = element.get('style', {}).get('opacity', 1.0)
-                        image_path = image_service.generate_image(image_keyword, opacity)
+                        size = (element.get('width', 1280), element.get('height', 720))
+                        image_path = image_service.generate_image(image_keyword, opacity, size=size)
                         if image_path:
                             elements.add_image(slide, image_path, element)
+                            backdrop.add_image(element, image_service.get_image_stats(image_path))
                         else:
                             logging.warning(f"无法为关键词生成图片: '{image_keyword}'。已跳过此元素。")
                     else:
@@ -99,15 +189,25 @@ class SlideRenderer:
 
                 elif element_type == 'shape':
                     elements.add_shape(slide, element, self.style_manager)
+                    backdrop.add_shape(element)
 
                 elif element_type == 'chart':
                     elements.add_chart(slide, element, self.style_manager)
 
                 elif element_type == 'table':
-                    elements.add_table(slide, element, self.style_manager)
+                    first_part, *rest = table_builder.split_table(element)
+                    elements.add_table(slide, first_part, self.style_manager)
+                    if rest:
+                        logging.info(f"表格共 {len(element.get('rows', []))} 行，超出图框容量，将拆分到 {len(rest)} 张续页。")
+                        continuation_pages.extend({'layout_type': slide_data.get('layout_type'), 'elements': [part]}
+                                                  for part in rest)
 
                 else:
                     logging.warning(f"不支持的元素类型: '{element_type}'。")
 
             except Exception as e:
-                logging.error(f"渲染类型为 '{element_type}' 的元素失败: {e}", exc_info=True)
\ No newline at end of file
+                logging.error(f"渲染类型为 '{element_type}' 的元素失败: {e}", exc_info=True)
+            metrics.ELEMENT_RENDER_SECONDS.observe(time.perf_counter() - render_start, type=element_type)
+
+        for page in continuation_pages:
+            self.render_slide(page, image_service)
@@ -61,6 +61,18 @@ class PresentationStyle:
         """
         return self._hex_to_rgb(self.color_palette.get(color_name, '#000000'))
 
+    def get_palette_hex(self) -> tuple[str, ...]:
+        """
+        以十六进制字符串元组返回 (主色, 辅色)，可用作缓存键，例如本地占位图的配色。
+        """
+        return f"#{self.primary}", f"#{self.secondary}"
+
+    def get_chart_style_signature(self) -> tuple:
+        """
+        返回影响图表样式的全部设计参数，用作已样式化图表模板的缓存键。
+        """
+        return str(self.text_color), self.heading_font, tuple(self._chart_colors_hex)
+
     def get_chart_color(self, index: int) -> RGBColor:
 
         color_hex = self._chart_colors_hex[index % len(self._chart_colors_hex)]
@@ -0,0 +1,112 @@
+import logging
+import re
+from xml.sax.saxutils import escape
+
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.oxml.shapes.graphfrm import CT_GraphicalObjectFrame
+
+from config import TABLE_PAGINATE
+
+# 表格每行所需的最小高度 (px)，按默认18pt字号加上下边距估算，用于判断表格是否放得下
+MIN_ROW_HEIGHT_PX = 40
+
+_TABLE_URI = "http://schemas.openxmlformats.org/drawingml/2006/table"
+_TABLE_STYLE_ID = "{5C22544A-7EE6-4342-B048-85BDC9FD1C3A}"
+# XML 1.0 不允许的控制字符（\v 保留，用于换行）
+_INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0c\x0e-\x1f]")
+
+
+def split_table(element_data: dict) -> list[dict]:
+    """
+    按图框高度能容纳的行数拆分表格元素。
+    返回的第一个元素放在原页面，其余作为续页，每页都重复表头并保持相同的位置和尺寸。
+    是否分页由元素的 "paginate" 字段决定，缺省时取 TABLE_PAGINATE。不分页时（默认）页数保持不变：
+    超出容量的行被截断，最后一行改为说明还有多少行未显示。
+    """
+    rows = element_data.get('rows', [])
+    height = element_data.get('height', 420)
+    rows_per_page = max(1, int(height // MIN_ROW_HEIGHT_PX) - 1)  # 减去表头行
+    if len(rows) <= rows_per_page:
+        return [element_data]
+
+    if not element_data.get('paginate', TABLE_PAGINATE):
+        kept = rows[:rows_per_page - 1]
+        hidden = len(rows) - len(kept)
+        note = [f"…… 另有 {hidden} 行未显示"] + [''] * (len(element_data.get('headers', [])) - 1)
+        logging.info(f"表格共 {len(rows)} 行，超出图框容量，只显示前 {len(kept)} 行。")
+        return [dict(element_data, rows=kept + [note])]
+
+    return [dict(element_data, rows=rows[i:i + rows_per_page]) for i in range(0, len(rows), rows_per_page)]
+
+
+def _cell_template(fill_hex: str | None, font_hex: str, font_name: str, bold: bool) -> tuple[str, str]:
+    """
+    生成一类单元格的XML模板，返回 (有文本时的前缀, 后缀)，中间插入文本段落。
+    结构与 python-pptx 逐个设置 cell.text / fill / paragraphs[0].font 的结果一致。
+    """
+    bold_attr = ' b="1"' if bold else ''
+    typeface = escape(font_name, {'"': '&quot;'})
+    p_pr = (f'<a:pPr><a:defRPr{bold_attr}><a:solidFill><a:srgbClr val="{font_hex}"/></a:solidFill>'
+            f'<a:latin typeface="{typeface}"/></a:defRPr></a:pPr>')
+    tc_pr = f'<a:tcPr><a:solidFill><a:srgbClr val="{fill_hex}"/></a:solidFill></a:tcPr>' if fill_hex else '<a:tcPr/>'
+    return f'<a:tc><a:txBody><a:bodyPr/><a:lstStyle/><a:p>{p_pr}', f'</a:txBody>{tc_pr}</a:tc>'
+
+
+def _paragraphs_xml(text: str) -> str:
+    """
+    单元格文本的段落内容。第一段紧接模板中的段落属性；按换行拆出的后续段落不带样式，
+    与 python-pptx 的 cell.text 行为一致。调用方负责闭合最后一个段落。
+    """
+    text = _INVALID_XML_CHARS.sub('', text)
+
+    def runs_xml(line):
+        return '<a:br/>'.join(f'<a:r><a:t>{escape(piece)}</a:t></a:r>' if piece else ''
+                              for piece in line.split('\v'))
+
+    return '</a:p><a:p>'.join(runs_xml(line) for line in text.split('\n'))
+
+
+def build_tbl_xml(headers: list, rows: list[list], width_emu: int, height_emu: int,
+                  header_fill: str, row_fills: list[str], header_font: tuple[str, str],
+                  body_font: tuple[str, str]) -> str:
+    """
+    一次性生成完整的 a:tbl XML。每种单元格样式（表头、各交替行颜色）只生成一次模板，所有单元格复用。
+    :param header_fill: 表头填充色 (RRGGBB)。
+    :param row_fills: 数据行的交替填充色列表，为空时数据行不设置填充。
+    :param header_font: 表头的 (字体颜色, 字体名)。
+    :param body_font: 数据行的 (字体颜色, 字体名)。
+    """
+    num_cols, num_rows = len(headers), len(rows) + 1
+    col_width, row_height = int(width_emu / num_cols), int(height_emu / num_rows)
+
+    header_template = _cell_template(header_fill, header_font[0], header_font[1], bold=True)
+    row_templates = [_cell_template(fill, body_font[0], body_font[1], bold=False) for fill in row_fills] or \
+                    [_cell_template(None, body_font[0], body_font[1], bold=False)]
+    empty_cell = '<a:tc><a:txBody><a:bodyPr/><a:lstStyle/><a:p/></a:txBody><a:tcPr/></a:tc>'
+
+    def row_xml(cells, template):
+        prefix, suffix = template
+        cells = list(cells)[:num_cols]
+        xml = ''.join(f'{prefix}{_paragraphs_xml(str(cell))}</a:p>{suffix}' for cell in cells)
+        # 行数据比表头短时，剩余单元格保持为未设置样式的空单元格
+        return f'<a:tr h="{row_height}">{xml}{empty_cell * (num_cols - len(cells))}</a:tr>'
+
+    body = [row_xml(headers, header_template)]
+    body.extend(row_xml(row, row_templates[r % len(row_templates)]) for r, row in enumerate(rows))
+
+    grid = f'<a:gridCol w="{col_width}"/>' * num_cols
+    return (f'<a:tbl {nsdecls("a")}><a:tblPr firstRow="1" bandRow="1"><a:tableStyleId>{_TABLE_STYLE_ID}'
+            f'</a:tableStyleId></a:tblPr><a:tblGrid>{grid}</a:tblGrid>{"".join(body)}</a:tbl>')
+
+
+def add_table_fast(slide, x: int, y: int, cx: int, cy: int, tbl_xml: str):
+    """把生成好的 a:tbl 放入新的图形框并加入幻灯片，只进行一次XML解析。"""
+    shapes = slide.shapes
+    shape_id = shapes._next_shape_id
+    graphic_frame = CT_GraphicalObjectFrame.new_graphicFrame(shape_id, f"Table {shape_id - 1}", x, y, cx, cy)
+    graphic_frame.graphic.graphicData.uri = _TABLE_URI
+    graphic_frame.graphic.graphicData.append(parse_xml(tbl_xml))
+    shapes._spTree.insert_element_before(graphic_frame, "p:extLst")
+    shapes._recalculate_extents()
+    return graphic_frame
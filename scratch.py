@@ -0,0 +1,139 @@
+import atexit
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from config import SCRATCH_ROOT
+
+# 临时目录名的格式：<进程号>-<任务标签>-<随机后缀>，清理时据此判断目录的所属进程是否仍在运行
+_DIR_NAME_PATTERN = re.compile(r"^(\d+)-")
+_LABEL_PATTERN = re.compile(r"[^\w.-]+")
+# Windows 进程查询用到的常量（OpenProcess 访问权限、进程不存在时的错误码、运行中进程的退出码）
+_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+_ERROR_INVALID_PARAMETER = 87
+_STILL_ACTIVE = 259
+
+_live_dirs = {}  # 路径 -> ScratchDir，本进程创建且尚未删除的目录
+_lock = threading.Lock()
+_atexit_registered = False
+
+
+class ScratchDir:
+    """
+    一个任务专用的临时目录，按引用计数管理生命周期。
+    创建者持有第一个引用；需要在创建者之后继续使用目录的一方（例如生成预览）先 acquire()，
+    用完 release()。引用计数归零时删除整个目录。也可以作为上下文管理器使用：退出时释放创建者的引用。
+    每个任务、每个进程使用各自的目录，同一台机器上的多个进程和线程互不影响。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    def acquire(self) -> "ScratchDir":
+        with self._lock:
+            if self._refs <= 0:
+                raise RuntimeError(f"临时目录 '{self.path}' 已被删除。")
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        _remove(self.path)
+
+    def __enter__(self) -> str:
+        return self.path
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def create(label: str = "job") -> ScratchDir:
+    """在 SCRATCH_ROOT 下为一个任务新建临时目录，引用计数为1。"""
+    global _atexit_registered
+    os.makedirs(SCRATCH_ROOT, exist_ok=True)
+    safe_label = _LABEL_PATTERN.sub('_', label)[:40] or "job"
+    scratch = ScratchDir(tempfile.mkdtemp(prefix=f"{os.getpid()}-{safe_label}-", dir=SCRATCH_ROOT))
+    with _lock:
+        _live_dirs[scratch.path] = scratch
+        if not _atexit_registered:
+            atexit.register(cleanup_process_dirs)
+            _atexit_registered = True
+    return scratch
+
+
+def _remove(path: str):
+    with _lock:
+        _live_dirs.pop(path, None)
+    shutil.rmtree(path, ignore_errors=True)
+    logging.debug(f"临时目录 '{path}' 已删除。")
+
+
+def cleanup_process_dirs():
+    """进程退出时删除本进程创建、仍未释放的临时目录；不会触及其他进程的目录。"""
+    with _lock:
+        paths = [path for path in _live_dirs if os.path.basename(path).startswith(f"{os.getpid()}-")]
+    for path in paths:
+        _remove(path)
+
+
+def _windows_pid_alive(pid: int) -> bool:
+    """通过 OpenProcess/GetExitCodeProcess 查询进程是否仍在运行；无法确定时保守地视为仍在运行。"""
+    try:
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    except (ImportError, OSError, AttributeError):
+        return True
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    handle = kernel32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # 进程不存在时返回 ERROR_INVALID_PARAMETER；拒绝访问等其他错误说明进程存在
+        return ctypes.get_last_error() != _ERROR_INVALID_PARAMETER
+    try:
+        exit_code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == _STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _pid_alive(pid: int) -> bool:
+    # Windows 上信号0就是 CTRL_C_EVENT，os.kill(pid, 0) 会向控制台上的进程发送 Ctrl+C，不能用来探测
+    if os.name == 'nt':
+        return _windows_pid_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # 无权向该进程发送信号：进程存在
+        return True
+    return True
+
+
+def sweep_stale_dirs() -> int:
+    """
+    删除所属进程已不存在的临时目录（例如被强制终止的进程或渲染子进程遗留的目录），返回删除的数量。
+    正在运行的进程的目录保持不动，因此启动时调用是安全的。
+    """
+    if not os.path.isdir(SCRATCH_ROOT):
+        return 0
+    removed = 0
+    for name in os.listdir(SCRATCH_ROOT):
+        match = _DIR_NAME_PATTERN.match(name)
+        if match and not _pid_alive(int(match.group(1))):
+            shutil.rmtree(os.path.join(SCRATCH_ROOT, name), ignore_errors=True)
+            removed += 1
+    if removed:
+        logging.info(f"已清理 {removed} 个遗留的临时目录。")
+    return removed
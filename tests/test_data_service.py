@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from data_service import describe_datasets
+
+
+class DescribeDatasetsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+
+    def _write(self, name: str, content: bytes) -> str:
+        path = os.path.join(self._dir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_unreadable_files_are_skipped(self):
+        good = self._write('good.csv', "地区,销售额\n华东,1\n华南,2\n".encode('utf-8'))
+        gbk = self._write('gbk.csv', "地区,销售额\n华东,1\n华南,2\n".encode('gbk'))
+        parquet = self._write('broken.parquet', b'PAR1' + b'\x00' * 32)
+
+        data_files, prompt = describe_datasets([gbk, parquet, good])
+
+        self.assertEqual(list(data_files), ['good.csv'])
+        self.assertIn('`good.csv`', prompt)
+        self.assertNotIn('gbk.csv', prompt)
+        self.assertNotIn('broken.parquet', prompt)
+
+    def test_all_files_unreadable(self):
+        parquet = self._write('broken.parquet', b'PAR1')
+        self.assertEqual(describe_datasets([parquet]), ({}, ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
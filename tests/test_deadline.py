@@ -0,0 +1,26 @@
+import time
+import unittest
+
+from deadline import Deadline
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_exhausted_budget_is_not_unlimited(self):
+        deadline = Deadline(0.0)
+        self.assertFalse(deadline.unlimited)
+        self.assertTrue(deadline.expired())
+        self.assertTrue(deadline.is_low())
+
+    def test_none_is_unlimited(self):
+        self.assertTrue(Deadline().unlimited)
+        self.assertTrue(Deadline.until(None).unlimited)
+
+    def test_wall_expiry_round_trip_charges_elapsed_time(self):
+        expiry = Deadline(60).wall_expiry()
+        self.assertAlmostEqual(Deadline.until(expiry).remaining(), 60, delta=1)
+        self.assertTrue(Deadline.until(time.time() - 5).expired())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+from unittest import mock
+
+from ppt_builder import layout_engine
+from ppt_builder.layout_engine import layout_plan
+
+
+class LayoutEngineTest(unittest.TestCase):
+
+    def test_non_dict_items_are_normalized(self):
+        for layout_type in ('three_column_comparison', 'process_flow', 'team_introduction'):
+            page = {'layout_type': layout_type, 'title': 'T', 'items': ['第一步', 2, None, {'heading': '第三步'}]}
+            elements = layout_plan({'pages': [page]}, '16:9')['pages'][0]['elements']
+            texts = [e['content'] for e in elements if e.get('type') == 'text_box']
+            self.assertIn('第一步', texts)
+            self.assertIn('第三步', texts)
+
+    def test_failing_layout_falls_back_per_page(self):
+        plan = {'pages': [{'layout_type': 'process_flow', 'title': 'A', 'items': ['x'], 'bullets': ['要点']},
+                          {'layout_type': 'title_slide', 'title': 'B'}]}
+        with mock.patch.dict(layout_engine.LAYOUTS, process_flow=(mock.Mock(side_effect=KeyError('boom')),
+                                                                  'items', '')):
+            pages = layout_plan(plan, '16:9')['pages']
+        self.assertTrue(pages[0]['elements'])
+        self.assertTrue(pages[1]['elements'])
+
+
+if __name__ == "__main__":
+    unittest.main()
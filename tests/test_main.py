@@ -0,0 +1,25 @@
+import unittest
+
+from main import link_aspect_ratio_variants
+
+
+def _task(key: str, aspect_ratio: str, data_files=None) -> dict:
+    return {'key': key, 'theme': '年度总结', 'pages': 8, 'aspect_ratio': aspect_ratio, 'data_files': data_files}
+
+
+class LinkAspectRatioVariantsTest(unittest.TestCase):
+
+    def test_same_data_files_share_plan(self):
+        tasks = [_task('a', '16:9', ['sales.csv']), _task('b', '4:3', ['sales.csv'])]
+        link_aspect_ratio_variants(tasks)
+        self.assertEqual(tasks[1].get('plan_source'), 'a')
+
+    def test_different_data_files_do_not_share_plan(self):
+        tasks = [_task('a', '16:9', ['sales.csv']), _task('b', '4:3', ['costs.csv']), _task('c', '4:3')]
+        link_aspect_ratio_variants(tasks)
+        self.assertNotIn('plan_source', tasks[1])
+        self.assertNotIn('plan_source', tasks[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
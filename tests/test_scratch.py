@@ -0,0 +1,27 @@
+import os
+import unittest
+from unittest import mock
+
+import scratch
+
+
+class PidAliveTest(unittest.TestCase):
+
+    def test_current_process_is_alive(self):
+        self.assertTrue(scratch._pid_alive(os.getpid()))
+
+    def test_windows_never_signals(self):
+        # Windows 上信号0是 CTRL_C_EVENT：探测进程时绝不能调用 os.kill
+        with mock.patch.object(scratch.os, 'name', 'nt'), \
+                mock.patch.object(scratch.os, 'kill', side_effect=AssertionError("os.kill called")), \
+                mock.patch.object(scratch, '_windows_pid_alive', return_value=False) as query:
+            self.assertFalse(scratch._pid_alive(12345))
+        query.assert_called_once_with(12345)
+
+    def test_windows_without_process_api_assumes_alive(self):
+        with mock.patch('ctypes.WinDLL', side_effect=OSError, create=True):
+            self.assertTrue(scratch._windows_pid_alive(12345))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import threading
+import unittest
+
+from worker_pool import RecyclingProcessPool
+
+# 每轮关闭进程池允许的最长时间（秒），超过即视为卡死
+SHUTDOWN_TIMEOUT = 30
+
+
+def _square(value):
+    return value * value
+
+
+class RecyclingProcessPoolShutdownTest(unittest.TestCase):
+
+    def test_shutdown_does_not_hang_when_workers_recycle(self):
+        """每个进程只执行一个任务：关闭时总有进程正在被回收，补充的进程也必须收到结束标记。"""
+        for cycle in range(30):
+            pool = RecyclingProcessPool(2, max_tasks_per_worker=1)
+            futures = [pool.submit(_square, i) for i in range(6)]
+            closer = threading.Thread(target=pool.shutdown, daemon=True)
+            closer.start()
+            closer.join(SHUTDOWN_TIMEOUT)
+            self.assertFalse(closer.is_alive(), f"第 {cycle + 1} 轮关闭进程池卡死")
+            self.assertEqual([f.result() for f in futures], [i * i for i in range(6)])
+            self.assertEqual(pool._workers, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import itertools
+import logging
+import multiprocessing
+import pickle
+import threading
+from concurrent.futures import Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import connection
+
+import metrics
+from memory_usage import TaskMemoryTracker, current_rss_bytes, log_report
+
+# 收集线程等待消息的超时（秒），用于及时发现进程池已关闭
+_POLL_INTERVAL = 1.0
+
+
+def _worker_main(worker_id: int, tasks, conn, max_tasks: int | None, max_rss_bytes: int | None,
+                 memory_report: bool):
+    """
+    工作进程主循环：逐个执行任务并通过 conn 回报结果。
+    完成 max_tasks 个任务、或任务结束后RSS超过 max_rss_bytes 时主动退出，由主进程启动新的进程接替，
+    释放解码后的图片、下载缓存和 python-pptx 对象图等随任务累积的内存。
+    conn.send 是同步写入，进程即使随后被强制终止，已发出的消息也不会丢失。
+    """
+    completed = 0
+    while True:
+        item = tasks.get()
+        if item is None:
+            conn.send(('exit', None))
+            return
+        task_id, fn, args, kwargs = item
+        conn.send(('start', task_id))
+        tracker = TaskMemoryTracker(f"task-{task_id}", trace=memory_report, log=False)
+        try:
+            with tracker:
+                value = fn(*args, **kwargs)
+            result = (task_id, True, value, tracker.report)
+        except BaseException as e:
+            try:
+                pickle.loads(pickle.dumps(e))
+            except Exception:
+                # 无法在主进程中还原的异常改为 RuntimeError，否则主进程接收时会出错
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            result = (task_id, False, e, tracker.report)
+        try:
+            conn.send(('done', result))
+        except Exception as e:
+            # 返回值无法序列化
+            conn.send(('done', (task_id, False, RuntimeError(f"任务结果无法序列化: {e}"), tracker.report)))
+
+        completed += 1
+        if max_tasks and completed >= max_tasks:
+            conn.send(('exit', 'tasks'))
+            return
+        if max_rss_bytes and (rss := current_rss_bytes()) is not None and rss > max_rss_bytes:
+            conn.send(('exit', 'rss'))
+            return
+
+
+class RecyclingProcessPool:
+    """
+    会回收工作进程的进程池，接口与 concurrent.futures 的 Executor 相同（submit 返回 Future）。
+    与 ProcessPoolExecutor(max_tasks_per_child=...) 不同，除了按任务数回收，还会在进程RSS超过阈值时回收；
+    工作进程意外退出（如被OOM终止）时，只有它正在执行的任务失败，进程池会补充新的进程继续工作。
+    memory_report 为True时每个任务都统计RSS峰值和 tracemalloc 分配热点，由主进程写入日志。
+    """
+
+    def __init__(self, max_workers: int, max_tasks_per_worker: int | None = None, max_rss_mb: float | None = None,
+                 memory_report: bool = False):
+        self.max_workers = max(1, max_workers)
+        self.max_tasks_per_worker = max_tasks_per_worker or None
+        self.max_rss_bytes = int(max_rss_mb * 1024 * 1024) if max_rss_mb else None
+        self.memory_report = memory_report
+
+        self._context = multiprocessing.get_context()
+        self._tasks = self._context.Queue()
+        self._futures = {}
+        self._workers = {}  # worker_id -> (进程, 结果管道的读端)
+        self._running = {}  # worker_id -> 正在执行的 task_id
+        self._ids = itertools.count()
+        self._worker_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+        for _ in range(self.max_workers):
+            self._spawn()
+        self._collector = threading.Thread(target=self._collect, name="worker-pool-collector", daemon=True)
+        self._collector.start()
+
+    def _spawn(self):
+        worker_id = next(self._worker_ids)
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main, name=f"render-worker-{worker_id}", daemon=True,
+            args=(worker_id, self._tasks, writer, self.max_tasks_per_worker, self.max_rss_bytes, self.memory_report)
+        )
+        process.start()
+        # 关闭主进程中的写端，工作进程退出后读端才能读到EOF
+        writer.close()
+        self._workers[worker_id] = (process, reader)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if self._shutdown:
+            raise RuntimeError("进程池已关闭。")
+        future = Future()
+        task_id = next(self._ids)
+        with self._lock:
+            self._futures[task_id] = future
+        self._tasks.put((task_id, fn, args, kwargs))
+        return future
+
+    def _retire(self, worker_id: int, reason: str | None):
+        """
+        回收一个已退出的工作进程；reason 为None表示关闭进程池时的正常退出，否则在仍需要时补充新进程。
+        移除旧进程和补充新进程在同一把锁内完成，与 shutdown 按存活进程数发送结束标记互斥：
+        shutdown 之后补充的进程（仍有未完成的任务时）由这里另外补发一个结束标记，保证每个进程都能收到。
+        """
+        with self._lock:
+            process, reader = self._workers.pop(worker_id)
+            self._running.pop(worker_id, None)
+            respawn = reason is not None and (not self._shutdown or bool(self._futures))
+            if respawn:
+                self._spawn()
+                if self._shutdown:
+                    self._tasks.put(None)
+        process.join(timeout=5)
+        reader.close()
+        if reason is None:
+            return
+        metrics.WORKER_RECYCLES.inc(reason=reason)
+        logging.info(f"工作进程 {worker_id} 已回收 (原因: {reason})。")
+
+    def _collect(self):
+        """后台线程：同时等待各工作进程的结果管道和进程句柄，进程退出时能立即发现。"""
+        while not (self._shutdown and not self._workers):
+            handles = {}
+            for worker_id, (process, reader) in self._workers.items():
+                handles[reader] = worker_id
+                handles[process.sentinel] = worker_id
+            for handle in connection.wait(list(handles), timeout=_POLL_INTERVAL):
+                if handles[handle] in self._workers:
+                    self._drain(handles[handle])
+
+    def _drain(self, worker_id: int):
+        """处理一个工作进程已发出的全部消息；进程已不在运行且没有发出 'exit' 消息时按意外退出处理。"""
+        process, reader = self._workers[worker_id]
+        while True:
+            try:
+                if not reader.poll():
+                    break
+                kind, payload = reader.recv()
+            except (EOFError, OSError):
+                break
+
+            if kind == 'start':
+                self._running[worker_id] = payload
+            elif kind == 'done':
+                task_id, ok, value, report = payload
+                self._running.pop(worker_id, None)
+                if self.memory_report and report:
+                    log_report(report)
+                self._resolve(task_id, value, ok)
+            elif kind == 'exit':
+                self._retire(worker_id, payload)
+                return
+
+        if process.is_alive():
+            return
+        process.join()
+        logging.error(f"工作进程 {worker_id} 意外退出 (退出码 {process.exitcode})。")
+        if (task_id := self._running.get(worker_id)) is not None:
+            self._resolve(task_id, BrokenProcessPool(f"工作进程意外退出，退出码 {process.exitcode}"), False)
+        self._retire(worker_id, 'crash')
+
+    def _resolve(self, task_id: int, value, ok: bool):
+        with self._lock:
+            future = self._futures.pop(task_id, None)
+        if future is not None:
+            future.set_result(value) if ok else future.set_exception(value)
+
+    def shutdown(self, wait_for_tasks: bool = True):
+        """关闭进程池。wait_for_tasks 为True时先等待所有已提交的任务完成。"""
+        if wait_for_tasks:
+            with self._lock:
+                pending = list(self._futures.values())
+            wait(pending)
+        # 与 _retire 互斥：设置标志后不会再有未收到结束标记的新进程
+        with self._lock:
+            self._shutdown = True
+            for _ in range(len(self._workers)):
+                self._tasks.put(None)
+        self._collector.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait_for_tasks=exc_type is None)
+        return False